@@ -0,0 +1,243 @@
+"""
+Benchmark hors-ligne du pipeline d'analyse (analyze_mp4_from_url) sur le corpus synthétique
+
+Chaque analyse tourne dans un processus dédié pour isoler le pic mémoire (RSS)
+et le temps CPU des processus ffmpeg enfants. Le rapport JSON peut être comparé
+entre deux commits avec --compare.
+
+Usage :
+    python -m benchmarks.corpus --output benchmarks/corpus
+    python -m benchmarks.analyser_benchmark --corpus benchmarks/corpus --output bench.json
+    python -m benchmarks.analyser_benchmark --corpus benchmarks/corpus --compare bench.json
+    python -m benchmarks.analyser_benchmark --corpus benchmarks/corpus --profile approximate --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks.corpus import load_manifest
+from benchmarks.http_server import start_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ANALYSER_DIR = os.path.join(REPO_ROOT, 'lambda', 'mp4_analyser')
+# Modules partagés du layer commun (montés dans /opt/python sur Lambda)
+COMMON_LAYER_DIR = os.path.join(REPO_ROOT, 'lambda', 'layers', 'common', 'python')
+
+# Étapes chronométrées : fonctions du module analyser appelées par analyze_mp4_from_url
+STAGE_FUNCTIONS = [
+    'download_mp4',
+    'probe_media',
+    'analyze_window',
+]
+
+
+def rusage_snapshot():
+    """Temps CPU (ms) du processus courant et des enfants terminés"""
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu_ms': (self_usage.ru_utime + self_usage.ru_stime) * 1000,
+        'children_cpu_ms': (children_usage.ru_utime + children_usage.ru_stime) * 1000,
+    }
+
+
+def instrument_stages(module, stages):
+    """Remplace les fonctions d'étape du module par des versions chronométrées"""
+    for name in STAGE_FUNCTIONS:
+        original = getattr(module, name, None)
+        if original is None:
+            continue
+
+        def timed(*args, __name=name, __original=original, **kwargs):
+            before = rusage_snapshot()
+            start = time.perf_counter_ns()
+            try:
+                return __original(*args, **kwargs)
+            finally:
+                wall_ms = (time.perf_counter_ns() - start) / 1e6
+                after = rusage_snapshot()
+                stage = stages.setdefault(__name, {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'children_cpu_ms': 0.0})
+                stage['calls'] += 1
+                stage['wall_ms'] += wall_ms
+                stage['cpu_ms'] += after['cpu_ms'] - before['cpu_ms']
+                stage['children_cpu_ms'] += after['children_cpu_ms'] - before['children_cpu_ms']
+
+        setattr(module, name, timed)
+
+
+def run_worker(file_url, profile='full'):
+    """Exécute une analyse dans le processus courant et retourne les mesures"""
+    sys.path[:0] = [ANALYSER_DIR, COMMON_LAYER_DIR]
+    import instrumentation
+    import mp4_analyser_handler
+
+    stages = {}
+    instrument_stages(mp4_analyser_handler, stages)
+    metrics = instrumentation.start_invocation()
+
+    before = rusage_snapshot()
+    start = time.perf_counter_ns()
+    error = None
+    result = None
+    try:
+        result = mp4_analyser_handler.analyze_mp4_from_url(file_url, profile=profile)
+    except Exception as e:
+        error = str(e)
+    wall_ms = (time.perf_counter_ns() - start) / 1e6
+    after = rusage_snapshot()
+
+    # ru_maxrss est exprimé en Ko sous Linux
+    return {
+        'wall_ms': round(wall_ms, 3),
+        'cpu_ms': round(after['cpu_ms'] - before['cpu_ms'], 3),
+        'children_cpu_ms': round(after['children_cpu_ms'] - before['children_cpu_ms'], 3),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'children_peak_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        'stages': {name: {k: round(v, 3) for k, v in stage.items()} for name, stage in stages.items()},
+        # Spans internes de l'analyser (ffmpeg, parsing, octets téléchargés...)
+        'instrumentation': metrics.snapshot(),
+        'result': result,
+        'error': error,
+    }
+
+
+def run_in_subprocess(file_url, env=None, command_prefix=None, profile='full'):
+    """Lance une analyse dans un processus Python dédié (--worker)"""
+    cmd = list(command_prefix or []) + [sys.executable, '-m', 'benchmarks.analyser_benchmark', '--worker', file_url, '--profile', profile]
+    output = subprocess.run(cmd, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def summarize_runs(runs):
+    """Médianes des mesures sur les répétitions"""
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ('wall_ms', 'cpu_ms', 'children_cpu_ms', 'peak_rss_kb', 'children_peak_rss_kb')
+    }
+    stage_names = sorted({name for run in runs for name in run['stages']})
+    summary['stages'] = {
+        name: {
+            key: round(statistics.median(run['stages'].get(name, {}).get(key, 0) for run in runs), 3)
+            for key in ('wall_ms', 'cpu_ms', 'children_cpu_ms')
+        }
+        for name in stage_names
+    }
+    return summary
+
+
+def collect_metadata(ffmpeg_path):
+    """Contexte d'exécution du benchmark (commit, machine, version de ffmpeg)"""
+    def first_line(cmd):
+        try:
+            return subprocess.run(cmd, cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.splitlines()[0].strip()
+        except (OSError, IndexError):
+            return None
+
+    return {
+        'git_commit': first_line(['git', 'rev-parse', 'HEAD']),
+        'ffmpeg_version': first_line([ffmpeg_path, '-version']),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'started_at': datetime.now().isoformat(),
+    }
+
+
+def log_progress(message):
+    """Progression sur stderr pour garder stdout exploitable en JSON"""
+    print(message, file=sys.stderr)
+
+
+def run_benchmark(corpus_dir, repetitions=3, name_filter=None, env=None, command_prefix=None, log=log_progress, profile='full'):
+    """Sert le corpus en HTTP local et mesure chaque fichier repetitions fois"""
+    manifest = load_manifest(corpus_dir)
+    server, base_url = start_server(corpus_dir)
+    files = []
+    try:
+        for entry in manifest['files']:
+            if name_filter and name_filter not in entry['name']:
+                continue
+            runs = []
+            for _ in range(repetitions):
+                runs.append(run_in_subprocess(f"{base_url}/{entry['name']}", env, command_prefix, profile))
+            summary = summarize_runs(runs)
+            log(f"⏱️  {entry['name']}: {summary['wall_ms']:.0f} ms (CPU ffmpeg {summary['children_cpu_ms']:.0f} ms)")
+            files.append({'file': entry, 'runs': runs, 'summary': summary})
+    finally:
+        server.shutdown()
+    return files
+
+
+def compare_reports(baseline, current):
+    """Affiche l'évolution des médianes (temps total et par étape) par rapport à un rapport de référence"""
+    baseline_by_name = {f['file']['name']: f['summary'] for f in baseline['files']}
+    baseline_results = {f['file']['name']: f['runs'][0].get('result') for f in baseline['files']}
+    print(f"{'fichier':<45} {'étape':<24} {'ref (ms)':>10} {'actuel (ms)':>12} {'ratio':>7}")
+    for entry in current['files']:
+        name = entry['file']['name']
+        reference = baseline_by_name.get(name)
+        if reference is None:
+            continue
+        rows = [('total', reference['wall_ms'], entry['summary']['wall_ms'])]
+        for stage, values in entry['summary']['stages'].items():
+            if stage in reference['stages']:
+                rows.append((stage, reference['stages'][stage]['wall_ms'], values['wall_ms']))
+        for stage, before, after in rows:
+            ratio = after / before if before else float('nan')
+            print(f"{name:<45} {stage:<24} {before:>10.1f} {after:>12.1f} {ratio:>7.2f}")
+        compare_measures(name, baseline_results.get(name), entry['runs'][0].get('result'))
+
+
+def compare_measures(name, reference, result):
+    """Écart des mesures (profil approximatif comparé à une référence complète)"""
+    if not reference or not result:
+        return
+    loudness_delta = result['loudnessMeasured'] - reference['loudnessMeasured']
+    silence_delta = result['silencePercentage'] - reference['silencePercentage']
+    bounds = ((result.get('sampling') or {}).get('confidence') or {}).get('loudnessMeasured')
+    inside = '' if not bounds else (' (dans l\'intervalle)' if bounds[0] <= reference['loudnessMeasured'] <= bounds[1] else ' (hors intervalle)')
+    print(f"{name:<45} {'écart mesures':<24} loudness {loudness_delta:+.2f} LU{inside}, silence {silence_delta:+.2f} pts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors-ligne de l'analyser MP4")
+    parser.add_argument('--corpus', default='benchmarks/corpus', help="Répertoire du corpus généré")
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--filter', help="Ne mesurer que les fichiers dont le nom contient ce texte")
+    parser.add_argument('--output', help="Fichier JSON de sortie (stdout sinon)")
+    parser.add_argument('--compare', help="Rapport JSON de référence à comparer")
+    parser.add_argument('--profile', default='full', choices=['full', 'approximate'], help="Profil d'analyse mesuré")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.profile)))
+        return
+
+    report = {
+        'metadata': collect_metadata(os.environ.get('FFMPEG_PATH', 'ffmpeg')),
+        'profile': args.profile,
+        'files': run_benchmark(args.corpus, args.repetitions, args.filter, profile=args.profile),
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Rapport écrit dans {args.output}")
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Génération d'un corpus MP4 synthétique et déterministe avec les sources lavfi de ffmpeg
+
+Usage :
+    python -m benchmarks.corpus --output benchmarks/corpus --profile quick
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+
+# Profils de durées (secondes) : de 5 s à 2 h
+PROFILES = {
+    'quick': [5, 30, 120],
+    'full': [5, 30, 120, 600, 1800, 7200],
+}
+
+# Variantes de conteneur / codec / layout générées pour chaque durée
+VARIANTS = [
+    {'video': True, 'faststart': True, 'audio_codec': 'aac', 'channels': 2},
+    {'video': True, 'faststart': False, 'audio_codec': 'aac', 'channels': 2},
+    {'video': False, 'faststart': True, 'audio_codec': 'aac', 'channels': 1},
+    {'video': True, 'faststart': True, 'audio_codec': 'ac3', 'channels': 6},
+    {'video': False, 'faststart': False, 'audio_codec': 'libmp3lame', 'channels': 2},
+]
+
+# Signal audio : 8 s de sinus puis 2 s de silence, toutes les 10 s (20 % de silence)
+AUDIO_EXPRESSION = "if(lt(mod(t\\,10)\\,8)\\,0.25*sin(2*PI*440*t)\\,0)"
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def corpus_entry_name(duration, variant):
+    """Nom de fichier stable décrivant les paramètres du média"""
+    parts = [
+        f"{duration}s",
+        'av' if variant['video'] else 'a',
+        'faststart' if variant['faststart'] else 'moovend',
+        variant['audio_codec'],
+        f"{variant['channels']}ch",
+    ]
+    return '_'.join(parts) + '.mp4'
+
+
+def build_ffmpeg_command(ffmpeg_path, duration, variant, output_path):
+    """Construit la commande ffmpeg (sorties bit-exact pour un corpus reproductible)"""
+    cmd = [
+        ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f"aevalsrc={AUDIO_EXPRESSION}:s=48000:d={duration}",
+    ]
+    if variant['video']:
+        cmd += ['-f', 'lavfi', '-i', f"testsrc2=size=640x360:rate=25:duration={duration}"]
+        cmd += ['-map', '0:a', '-map', '1:v', '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '50']
+    else:
+        cmd += ['-map', '0:a']
+    cmd += [
+        '-c:a', variant['audio_codec'], '-ac', str(variant['channels']), '-b:a', '128k',
+        '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact',
+        '-map_metadata', '-1',
+    ]
+    if variant['faststart']:
+        cmd += ['-movflags', '+faststart']
+    cmd.append(output_path)
+    return cmd
+
+
+def sha256_file(path):
+    """Empreinte SHA-256 d'un fichier, lue par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def generate_corpus(output_dir, profile='quick', ffmpeg_path='ffmpeg', force=False):
+    """
+    Génère le corpus dans output_dir et écrit un manifest.json
+    Les fichiers déjà présents sont réutilisés sauf si force=True
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    entries = []
+    for duration in PROFILES[profile]:
+        for variant in VARIANTS:
+            name = corpus_entry_name(duration, variant)
+            path = os.path.join(output_dir, name)
+            if force or not os.path.exists(path):
+                print(f"🎬 Génération de {name}...")
+                subprocess.run(build_ffmpeg_command(ffmpeg_path, duration, variant, path), check=True)
+            entries.append({
+                'name': name,
+                'duration': duration,
+                **variant,
+                'size': os.path.getsize(path),
+                'sha256': sha256_file(path),
+            })
+
+    manifest = {'profile': profile, 'files': entries}
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(corpus_dir):
+    """Charge le manifest d'un corpus généré"""
+    with open(os.path.join(corpus_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère le corpus MP4 synthétique du benchmark")
+    parser.add_argument('--output', default='benchmarks/corpus', help="Répertoire de sortie")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--ffmpeg', default=os.environ.get('FFMPEG_PATH', 'ffmpeg'))
+    parser.add_argument('--force', action='store_true', help="Régénère les fichiers existants")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.output, args.profile, args.ffmpeg, args.force)
+    print(f"✅ {len(manifest['files'])} fichiers dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
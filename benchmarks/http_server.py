@@ -0,0 +1,80 @@
+"""
+Serveur HTTP local pour le corpus du benchmark, avec support des requêtes Range
+(nécessaire pour que ffprobe/ffmpeg puissent se positionner dans les fichiers moov-at-end)
+"""
+import os
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler avec réponses 206 pour un en-tête Range à plage unique"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        range_header = self.headers.get('Range')
+        if not range_header or not os.path.isfile(path):
+            return super().send_head()
+
+        match = RANGE_PATTERN.match(range_header.strip())
+        size = os.path.getsize(path)
+        if not match or (not match.group(1) and not match.group(2)):
+            return super().send_head()
+        if match.group(1):
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+        else:
+            # Suffixe : les N derniers octets
+            start = max(0, size - int(match.group(2)))
+            end = size - 1
+        end = min(end, size - 1)
+        if start > end:
+            self.send_error(416, 'Requested Range Not Satisfiable')
+            return None
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self._range_remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_range_remaining', None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        self._range_remaining = None
+        while remaining > 0:
+            chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+    def end_headers(self):
+        if self.command == 'GET' and 'Range' not in self.headers:
+            self.send_header('Accept-Ranges', 'bytes')
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(directory, host='127.0.0.1', port=0):
+    """Démarre le serveur dans un thread et retourne (serveur, URL de base)"""
+    handler = partial(RangeRequestHandler, directory=directory)
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
@@ -0,0 +1,187 @@
+"""
+Benchmark du démarrage à froid : durée d'init de chaque Lambda (imports et
+initialisation au niveau module) mesurée dans un interpréteur neuf
+
+Chaque mesure lance `python -X importtime` avec le sys.path de la fonction
+(son code, le layer commun et le layer ffmpeg s'il est présent) et
+AWS_LAMBDA_FUNCTION_NAME défini, comme sur Lambda, pour inclure la
+préinitialisation des clients AWS. La sortie -X importtime est agrégée par
+paquet de premier niveau pour repérer les imports coûteux.
+
+Usage :
+    python -m benchmarks.import_time --repetitions 10 --output init.json
+    python -m benchmarks.import_time --compare init.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.analyser_benchmark import collect_metadata
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_PATHS = [
+    os.path.join(REPO_ROOT, 'lambda', 'layers', 'common', 'python'),
+    os.path.join(REPO_ROOT, 'lambda', 'layers', 'ffmpeg', 'python'),
+]
+
+# Fonctions déployées : répertoire du code et module du handler
+FUNCTIONS = {
+    'mp4_analyser': ('lambda/mp4_analyser', 'mp4_analyser_handler'),
+    'callback_retry': ('lambda/mp4_analyser', 'callback_delivery'),
+    'mp4_dispatcher': ('lambda/mp4_dispatcher', 'mp4_dispatcher_handler'),
+    'callback': ('lambda/callback', 'callback_handler'),
+}
+
+# Variables d'environnement minimales pour importer les handlers hors AWS
+FUNCTION_ENV = {
+    'AWS_DEFAULT_REGION': 'eu-west-1',
+    'CALLBACK_TABLE_NAME': 'import-time-benchmark',
+    'BATCH_INDEX_NAME': 'BatchIdIndex',
+    'MP4_LAMBDA_NAME': 'mp4_analyser',
+}
+
+# Marqueur écrit sur stderr juste avant l'import du handler : les imports du
+# démarrage de l'interpréteur (site, encodings...) le précèdent
+IMPORT_MARKER = '--- import handler ---'
+
+INIT_SCRIPT = (
+    "import sys, time\n"
+    f"sys.stderr.write({IMPORT_MARKER!r} + '\\n')\n"
+    "start = time.perf_counter_ns()\n"
+    "import {module}\n"
+    "print(time.perf_counter_ns() - start)\n"
+)
+
+
+def parse_importtime(stderr):
+    """
+    Agrège la sortie -X importtime postérieure au marqueur :
+    durée cumulée par paquet (à sa première apparition dans l'arbre des imports,
+    sous-paquets d'un autre paquet compris) et durée propre par module
+    """
+    # -X importtime liste les imports en post-ordre : les enfants (profondeur + 1)
+    # précèdent leur parent
+    pending = {}
+    self_times = {}
+    started = False
+    for line in stderr.splitlines():
+        if line == IMPORT_MARKER:
+            started = True
+            continue
+        if not started or not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2][1:]
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        node = {'module': name.strip(), 'cumulative_us': int(fields[1]), 'children': pending.pop(depth + 1, [])}
+        pending.setdefault(depth, []).append(node)
+        self_times[node['module']] = self_times.get(node['module'], 0) + int(fields[0])
+
+    packages = {}
+
+    def walk(node, parent_package):
+        package = node['module'].split('.')[0]
+        if package != parent_package:
+            packages[package] = packages.get(package, 0) + node['cumulative_us']
+        for child in node['children']:
+            walk(child, package)
+
+    for root in pending.get(0, []):
+        walk(root, None)
+    return packages, self_times
+
+
+def measure_init(name, python=sys.executable):
+    """Une mesure d'init dans un interpréteur neuf ; retourne (init_ms, imports par paquet, durées propres)"""
+    code_dir, module = FUNCTIONS[name]
+    path = [os.path.join(REPO_ROOT, code_dir)] + [p for p in LAYER_PATHS if os.path.isdir(p)]
+    env = dict(os.environ, **FUNCTION_ENV)
+    env['AWS_LAMBDA_FUNCTION_NAME'] = name
+    env['PYTHONPATH'] = os.pathsep.join(path + [env.get('PYTHONPATH', '')]).rstrip(os.pathsep)
+    output = subprocess.run(
+        [python, '-X', 'importtime', '-c', INIT_SCRIPT.format(module=module)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if output.returncode != 0:
+        raise RuntimeError(f"Import de {module} impossible: {output.stderr.strip().splitlines()[-1]}")
+    top_level, self_times = parse_importtime(output.stderr)
+    return int(output.stdout.strip().splitlines()[-1]) / 1e6, top_level, self_times
+
+
+def benchmark_function(name, repetitions=5, top=10):
+    """Médiane de l'init et des imports les plus coûteux sur plusieurs interpréteurs neufs"""
+    # Première exécution ignorée : cache disque et bytecode des dépendances
+    measure_init(name)
+    runs = [measure_init(name) for _ in range(repetitions)]
+    init_ms = [run[0] for run in runs]
+
+    packages = {}
+    for _, top_level, _ in runs:
+        for package, cumulative_us in top_level.items():
+            packages.setdefault(package, []).append(cumulative_us)
+    slowest_self = {}
+    for _, _, self_times in runs:
+        for module, self_us in self_times.items():
+            slowest_self.setdefault(module, []).append(self_us)
+
+    def ranked(values):
+        medians = {key: statistics.median(samples) / 1000 for key, samples in values.items()}
+        return {key: round(ms, 3) for key, ms in sorted(medians.items(), key=lambda item: -item[1])[:top]}
+
+    return {
+        'init_ms': round(statistics.median(init_ms), 3),
+        'init_min_ms': round(min(init_ms), 3),
+        'init_max_ms': round(max(init_ms), 3),
+        'imports_ms': ranked(packages),
+        'self_ms': ranked(slowest_self),
+    }
+
+
+def print_report(report):
+    for name, result in report['functions'].items():
+        print(f"🧊 {name:<16} init {result['init_ms']:>8.1f} ms (min {result['init_min_ms']:.1f}, max {result['init_max_ms']:.1f})")
+        for package, ms in list(result['imports_ms'].items())[:5]:
+            print(f"     {package:<30} {ms:>8.1f} ms")
+
+
+def compare_reports(baseline, current):
+    """Évolution de la durée d'init par fonction par rapport à un rapport de référence"""
+    print(f"{'fonction':<18} {'ref (ms)':>10} {'actuel (ms)':>12} {'ratio':>7}")
+    for name, result in current['functions'].items():
+        reference = baseline['functions'].get(name)
+        if reference:
+            ratio = result['init_ms'] / reference['init_ms'] if reference['init_ms'] else float('nan')
+            print(f"{name:<18} {reference['init_ms']:>10.1f} {result['init_ms']:>12.1f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durée d'init (démarrage à froid) des Lambdas")
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--function', action='append', choices=sorted(FUNCTIONS), help="Fonction à mesurer (toutes par défaut)")
+    parser.add_argument('--top', type=int, default=10, help="Nombre d'imports les plus coûteux à garder")
+    parser.add_argument('--output', help="Fichier JSON de sortie")
+    parser.add_argument('--compare', help="Rapport JSON de référence à comparer")
+    args = parser.parse_args()
+
+    report = {
+        'metadata': collect_metadata(os.environ.get('FFMPEG_PATH', 'ffmpeg')),
+        'functions': {name: benchmark_function(name, args.repetitions, args.top) for name in (args.function or FUNCTIONS)},
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Rapport écrit dans {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
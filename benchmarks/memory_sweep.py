@@ -0,0 +1,204 @@
+"""
+Balayage des paliers de mémoire de l'analyser : le corpus synthétique est
+réanalysé sous le quota CPU correspondant à chaque palier (Lambda alloue un vCPU
+pour 1769 Mo) et le coût par fichier est calculé au tarif GB-seconde
+
+Le quota est appliqué au processus d'analyse et à ses processus ffmpeg :
+- systemd : quota cgroup fractionnaire (systemd-run --user --scope -p CPUQuota=...)
+- cgroup : quota fractionnaire écrit directement dans cpu.max (cgroup v2, droits d'écriture requis)
+- taskset : nombre entier de CPU (part de vCPU arrondie au supérieur) ; les paliers
+  fractionnaires sont alors signalés comme approchés (plus rapides que sur Lambda)
+Par défaut (auto), systemd puis cgroup ; sans quota fractionnaire disponible, le
+balayage refuse de démarrer plutôt que d'avantager les petits paliers.
+AWS_LAMBDA_FUNCTION_MEMORY_SIZE est défini comme sur Lambda, pour que
+l'analyser dimensionne ses threads ffmpeg comme en production.
+
+Usage :
+    python -m benchmarks.memory_sweep --corpus benchmarks/corpus --tiers 1024,2048,3008,10240 --output sweep.json
+    python -m benchmarks.memory_sweep --corpus benchmarks/corpus --limiter systemd --architecture arm64
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+from contextlib import contextmanager
+
+from benchmarks.analyser_benchmark import collect_metadata, log_progress, run_benchmark
+
+# Part de vCPU Lambda : un vCPU complet pour 1769 Mo, 6 vCPU au maximum (10240 Mo)
+LAMBDA_MB_PER_VCPU = 1769
+DEFAULT_TIERS = [1024, 1769, 2048, 3008, 5308, 10240]
+
+# Tarifs Lambda (us-east-1, USD) : GB-seconde par architecture et requête
+PRICE_PER_GB_SECOND = {
+    'x86_64': 0.0000166667,
+    'arm64': 0.0000133334,
+}
+PRICE_PER_REQUEST = 0.20 / 1e6
+
+# Limiteurs de CPU : les deux premiers appliquent un quota fractionnaire
+LIMITERS = ['auto', 'systemd', 'cgroup', 'taskset']
+FRACTIONAL_LIMITERS = ('systemd', 'cgroup')
+CGROUP_ROOT = '/sys/fs/cgroup'
+CGROUP_PERIOD_US = 100000
+
+
+def tier_cpus(memory_mb):
+    """Part de vCPU (fractionnaire) allouée par Lambda à un palier de mémoire"""
+    return memory_mb / LAMBDA_MB_PER_VCPU
+
+
+def systemd_available():
+    """systemd-run --user --scope utilisable (session utilisateur systemd)"""
+    try:
+        probe = subprocess.run(['systemd-run', '--user', '--scope', '--quiet', 'true'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return probe.returncode == 0
+
+
+def cgroup_available():
+    """cgroup v2 avec le contrôleur cpu délégué et une racine accessible en écriture"""
+    try:
+        with open(os.path.join(CGROUP_ROOT, 'cgroup.subtree_control')) as f:
+            controllers = f.read().split()
+    except OSError:
+        return False
+    return 'cpu' in controllers and os.access(CGROUP_ROOT, os.W_OK)
+
+
+def resolve_limiter(limiter):
+    """Limiteur effectif ; SystemExit si aucun quota fractionnaire n'est applicable"""
+    if limiter == 'auto':
+        if systemd_available():
+            return 'systemd'
+        if cgroup_available():
+            return 'cgroup'
+        sys.exit("Aucun quota CPU fractionnaire disponible (systemd-run --user, cgroup v2 cpu.max) : "
+                 "relancer avec --limiter taskset pour des paliers en CPU entiers, signalés comme approchés")
+    if limiter == 'systemd' and not systemd_available():
+        sys.exit("systemd-run --user --scope indisponible (pas de session utilisateur systemd)")
+    if limiter == 'cgroup' and not cgroup_available():
+        sys.exit(f"cgroup v2 indisponible : contrôleur cpu absent de {CGROUP_ROOT}/cgroup.subtree_control ou racine non accessible en écriture")
+    return limiter
+
+
+def exact_quota(memory_mb, limiter):
+    """Le quota appliqué correspond-il à la part de vCPU du palier ?"""
+    if limiter in FRACTIONAL_LIMITERS:
+        return True
+    cpus = tier_cpus(memory_mb)
+    return cpus == math.ceil(cpus) and cpus <= (os.cpu_count() or 1)
+
+
+@contextmanager
+def cpu_limit(memory_mb, limiter):
+    """Préfixe de commande appliquant le quota CPU du palier au processus d'analyse"""
+    cpus = tier_cpus(memory_mb)
+    if limiter == 'systemd':
+        yield ['systemd-run', '--user', '--scope', '--quiet', '-p', f"CPUQuota={round(cpus * 100)}%"]
+    elif limiter == 'cgroup':
+        # Groupe dédié au palier : le processus lancé s'y place avant l'exec (ffmpeg hérite du groupe)
+        path = os.path.join(CGROUP_ROOT, f"memory-sweep-{os.getpid()}-{memory_mb}")
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(os.path.join(path, 'cpu.max'), 'w') as f:
+                f.write(f"{round(cpus * CGROUP_PERIOD_US)} {CGROUP_PERIOD_US}")
+            yield ['sh', '-c', 'echo $$ > "$0/cgroup.procs" && exec "$@"', path]
+        finally:
+            os.rmdir(path)
+    else:
+        count = max(1, min(os.cpu_count() or 1, math.ceil(cpus)))
+        yield ['taskset', '-c', f"0-{count - 1}"]
+
+
+def billed_cost(wall_ms, memory_mb, architecture):
+    """Coût (USD) d'une invocation : durée facturée à la milliseconde près et requête"""
+    return math.ceil(wall_ms) / 1000 * memory_mb / 1024 * PRICE_PER_GB_SECOND[architecture] + PRICE_PER_REQUEST
+
+
+def sweep_tier(corpus_dir, memory_mb, repetitions, name_filter, limiter, architecture, profile):
+    """Mesure le corpus sous le quota d'un palier ; temps et coût médians par fichier"""
+    env = dict(os.environ, AWS_LAMBDA_FUNCTION_MEMORY_SIZE=str(memory_mb))
+    with cpu_limit(memory_mb, limiter) as prefix:
+        files = run_benchmark(corpus_dir, repetitions, name_filter, env, prefix, profile=profile)
+    per_file = [
+        {
+            'name': entry['file']['name'],
+            'wall_ms': entry['summary']['wall_ms'],
+            'children_cpu_ms': entry['summary']['children_cpu_ms'],
+            'cost_usd': billed_cost(entry['summary']['wall_ms'], memory_mb, architecture),
+        }
+        for entry in files
+    ]
+    return {
+        'memory_mb': memory_mb,
+        'cpus': round(tier_cpus(memory_mb), 3),
+        'exact_quota': exact_quota(memory_mb, limiter),
+        'files': per_file,
+        'median_wall_ms': round(statistics.median(f['wall_ms'] for f in per_file), 3) if per_file else None,
+        'mean_cost_usd': statistics.mean(f['cost_usd'] for f in per_file) if per_file else None,
+    }
+
+
+def print_curves(tiers):
+    """Courbe coût / temps par palier, puis coût de chaque fichier par palier"""
+    cheapest = min((tier for tier in tiers if tier['mean_cost_usd'] is not None), key=lambda tier: tier['mean_cost_usd'], default=None)
+    print(f"{'palier (Mo)':>11} {'vCPU':>6} {'temps médian (ms)':>18} {'coût / 1000 fichiers ($)':>25}")
+    for tier in tiers:
+        if tier['mean_cost_usd'] is None:
+            continue
+        marker = '  ← le moins cher' if tier is cheapest else ''
+        approx = ' ' if tier['exact_quota'] else '*'
+        print(f"{tier['memory_mb']:>11} {tier['cpus']:>6.2f}{approx}{tier['median_wall_ms']:>17.1f} {tier['mean_cost_usd'] * 1000:>25.4f}{marker}")
+    if any(not tier['exact_quota'] for tier in tiers):
+        print("* quota approché (CPU entiers) : temps sous-estimé, coût avantagé par rapport à Lambda")
+
+    names = [f['name'] for f in tiers[0]['files']] if tiers else []
+    print()
+    print(f"{'fichier':<45} " + ' '.join(f"{tier['memory_mb']:>10}" for tier in tiers) + "   (µ$ par fichier)")
+    for index, name in enumerate(names):
+        costs = ' '.join(f"{tier['files'][index]['cost_usd'] * 1e6:>10.2f}" for tier in tiers)
+        print(f"{name:<45} {costs}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coût par fichier de l'analyser selon le palier de mémoire Lambda")
+    parser.add_argument('--corpus', default='benchmarks/corpus', help="Répertoire du corpus généré")
+    parser.add_argument('--tiers', default=','.join(str(tier) for tier in DEFAULT_TIERS), help="Paliers de mémoire (Mo) séparés par des virgules")
+    parser.add_argument('--repetitions', type=int, default=3)
+    parser.add_argument('--filter', help="Ne mesurer que les fichiers dont le nom contient ce texte")
+    parser.add_argument('--limiter', default='auto', choices=LIMITERS, help="Application du quota CPU (auto : systemd puis cgroup v2)")
+    parser.add_argument('--architecture', default='x86_64', choices=sorted(PRICE_PER_GB_SECOND), help="Tarif appliqué")
+    parser.add_argument('--profile', default='full', choices=['full', 'approximate'], help="Profil d'analyse mesuré")
+    parser.add_argument('--output', help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    limiter = resolve_limiter(args.limiter)
+    tiers = []
+    for memory_mb in sorted(int(tier) for tier in args.tiers.split(',')):
+        exact = '' if exact_quota(memory_mb, limiter) else ', quota approché'
+        log_progress(f"🧮 Palier {memory_mb} Mo ({tier_cpus(memory_mb):.2f} vCPU, {limiter}{exact})")
+        tiers.append(sweep_tier(args.corpus, memory_mb, args.repetitions, args.filter, limiter, args.architecture, args.profile))
+
+    report = {
+        'metadata': collect_metadata(os.environ.get('FFMPEG_PATH', 'ffmpeg')),
+        'profile': args.profile,
+        'limiter': limiter,
+        'architecture': args.architecture,
+        'tiers': tiers,
+    }
+    print_curves(tiers)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Rapport écrit dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,94 @@
+import base64
+import gzip
 import json
+import hashlib
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 import os
-from datetime import datetime
+import re
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
 from decimal import Decimal
 import logging
+import time
 import uuid
+from trace_context import SENT_AT_HEADER, TRACEPARENT_HEADER, emit_span, new_span_id, parse_traceparent
 
 # Configuration du logging
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-# Clients AWS
-dynamodb = boto3.resource('dynamodb')
+# Table DynamoDB créée au premier usage, ou pendant la phase d'init sur Lambda
+# (AWS_ENDPOINT_URL_DYNAMODB permet de cibler DynamoDB Local, l'émulateur local
+# peut aussi injecter sa propre table)
 table_name = os.environ['CALLBACK_TABLE_NAME']
 batch_index_name = os.environ['BATCH_INDEX_NAME']
-table = dynamodb.Table(table_name)
+_table = None
+
+# Index des statuts : clé de partition "<statut>#<shard>" (les items d'un statut sont
+# répartis sur STATUS_INDEX_SHARDS partitions pour ne pas concentrer les écritures),
+# clé de tri status_at (réception du callback). Le nombre de shards ne doit pas être
+# réduit sans réécrire les items existants
+status_index_name = os.environ.get('STATUS_INDEX_NAME', 'StatusTimeIndex')
+STATUS_INDEX_SHARDS = int(os.environ.get('STATUS_INDEX_SHARDS', '4'))
+# L'analyser envoie un callback 'processing' au début des analyses asynchrones
+# (sinon aucune tâche n'a ce statut et la recherche est refusée)
+PROCESSING_CALLBACK_ENABLED = os.environ.get('PROCESSING_CALLBACK_ENABLED', 'false').lower() == 'true'
+
+# Mode de stockage : 'latest' conserve un seul item canonique par tâche,
+# 'append' ajoute une ligne par callback reçu (comportement historique)
+STORAGE_MODE = os.environ.get('STORAGE_MODE', 'latest')
+# Clé de tri de l'item canonique ('LATEST' est trié après les timestamps ISO)
+LATEST_SORT_KEY = 'LATEST'
+# Nombre de versions historiques conservées en mode 'latest' (0 = aucun historique)
+HISTORY_MAX_VERSIONS = int(os.environ.get('HISTORY_MAX_VERSIONS', '0'))
+# Durée de rétention des résultats via l'attribut TTL expires_at (0 = pas d'expiration)
+RESULT_TTL_DAYS = int(os.environ.get('RESULT_TTL_DAYS', '0'))
+
+# Long-polling (?wait=N) : API Gateway coupe les requêtes à 29 secondes
+MAX_WAIT_SECONDS = float(os.environ.get('MAX_WAIT_SECONDS', '20'))
+WAIT_INITIAL_INTERVAL = 0.2
+WAIT_MAX_INTERVAL = 2.0
+# Marge conservée avant le timeout de la Lambda pour construire la réponse
+WAIT_SAFETY_MARGIN_MS = 1500
+
+# Statuts finaux : le résultat n'évoluera plus
+TERMINAL_STATUSES = ('completed', 'partial', 'failed')
+
+# Requêtes par statut (GET /callback?status=...) : statuts interrogeables, taille
+# de page, fenêtre par défaut quand ?from n'est pas fourni
+QUERYABLE_STATUSES = ('processing',) + TERMINAL_STATUSES
+STATUS_QUERY_DEFAULT_LIMIT = 50
+STATUS_QUERY_MAX_LIMIT = 200
+STATUS_QUERY_DEFAULT_WINDOW_HOURS = 24
+# Bornes relatives : "-15m", "-1h", "-2d"
+RELATIVE_TIME_RE = re.compile(r'^-(\d+(?:\.\d+)?)([smhd])$')
+RELATIVE_TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Cache mémoire (conteneur chaud) des résultats terminés, qui ne changent plus
+CACHEABLE_STATUSES = ('completed', 'partial')
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '512'))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '3600'))
+# max-age HTTP des résultats terminés (Cache-Control)
+COMPLETED_MAX_AGE_SECONDS = int(os.environ.get('COMPLETED_MAX_AGE_SECONDS', '86400'))
+
+# task_id -> (expiration monotonic, résultats, etag), ordre LRU
+_result_cache = OrderedDict()
+
+# Déport des résultats volumineux vers S3 (un item DynamoDB est limité à 400 Ko)
+RESULTS_BUCKET_NAME = os.environ.get('RESULTS_BUCKET_NAME')
+OFFLOAD_THRESHOLD_BYTES = int(os.environ.get('OFFLOAD_THRESHOLD_BYTES', '102400'))
+PRESIGNED_URL_EXPIRES_SECONDS = int(os.environ.get('PRESIGNED_URL_EXPIRES_SECONDS', '3600'))
+# Réponse contenant des URL présignées : fraîcheur HTTP (et fenêtre de validité de
+# l'ETag) de la moitié de leur durée de vie, pour qu'une copie en cache ou revalidée
+# (304) ne présente jamais des liens expirés
+PRESIGNED_LINK_MAX_AGE_SECONDS = max(PRESIGNED_URL_EXPIRES_SECONDS // 2, 1)
+# Résolution des pointeurs en lecture : 'link' (URL présignée) ou 'inline'
+RESOLVE_MODES = ('link', 'inline')
+
+# Client S3 créé au premier déport
+_s3_client = None
 
 
 def lambda_handler(event, context):
@@ -32,6 +106,10 @@ def lambda_handler(event, context):
         elif http_method == 'GET':
             if '/batch/' in path:
                 return handle_batch_get(event, context)
+            elif not (event.get('pathParameters') or {}).get('task_id'):
+                return handle_status_query(event, context)
+            elif path.endswith('/final'):
+                return handle_callback_get(event, context, final_only=True)
             else:
                 return handle_callback_get(event, context)
         else:
@@ -60,13 +138,14 @@ def handle_callback_post(event, context):
     """
     Gère les callbacks POST pour enregistrer les résultats d'analyse
     """
+    received_ns = time.time_ns()
     try:
         # Extraire task_id du path ou le générer s'il n'existe pas
         path_task_id = event.get('pathParameters', {}).get('task_id')
         
         # Parser le body de la requête
         if event.get('body'):
-            callback_data = json.loads(event['body'])
+            callback_data = json.loads(get_request_body(event))
         else:
             return {
                 'statusCode': 400,
@@ -93,28 +172,70 @@ def handle_callback_post(event, context):
         if isinstance(processing_time, (int, float)):
             processing_time = Decimal(str(processing_time))
         
+        # Horodatage du résultat côté producteur : permet de rejeter les callbacks
+        # rejoués qui arrivent après un résultat plus récent
+        metadata = callback_data.get('metadata', {})
+        result_timestamp = metadata.get('processed_at') or metadata.get('failed_at') or metadata.get('started_at') or timestamp
+        
         item = {
             'task_id': task_id,  # Partition key
             'timestamp': timestamp,
+            'result_timestamp': result_timestamp,
             'status': callback_data.get('status', 'unknown'),
             'file_url': file_url,
             'analysis_results': json.dumps(callback_data.get('results', {}), default=str),
             'error_message': callback_data.get('error', ''),
             'processing_time': processing_time,
-            'metadata': json.dumps(callback_data.get('metadata', {}), default=str)
+            'metadata': json.dumps(metadata, default=str),
+            'status_at': timestamp
         }
         
+        # Index des statuts : partition répartie par tâche, tri par réception ; seul
+        # l'item canonique du mode 'latest' porte l'état courant de la tâche (en mode
+        # 'append', les lignes dépassées resteraient dans l'index sous leur ancien statut)
+        if STORAGE_MODE == 'latest':
+            item['status_shard'] = status_shard(item['status'], task_id)
+        
+        # Batch du dispatcher : seuls les items qui en ont un entrent dans l'index des batchs
+        batch_id = callback_data.get('batch_id') or metadata.get('batch_id')
+        if batch_id:
+            item['batch_id'] = batch_id
+        
+        # Contexte de trace propagé par l'analyser (en-tête traceparent)
+        trace_id, parent_span_id = parse_traceparent(get_header(event, TRACEPARENT_HEADER))
+        if trace_id:
+            item['trace_id'] = trace_id
+        
+        # Résultats volumineux : stockés compressés dans S3, la table ne garde qu'un pointeur
+        if RESULTS_BUCKET_NAME and len(item['analysis_results'].encode('utf-8')) > OFFLOAD_THRESHOLD_BYTES:
+            item['analysis_results_ref'] = offload_analysis_results(task_id, result_timestamp, item.pop('analysis_results'))
+        
+        if RESULT_TTL_DAYS > 0:
+            item['expires_at'] = int(time.time()) + RESULT_TTL_DAYS * 86400
+        
         # Enregistrer dans DynamoDB
-        table.put_item(Item=item)
+        if STORAGE_MODE == 'latest':
+            stored = store_latest_result(item)
+        else:
+            get_table().put_item(Item=item)
+            stored = True
+        
+        if stored:
+            _result_cache.pop(task_id, None)
+            logger.info(f"Callback enregistré pour task_id: {task_id}")
+        else:
+            logger.info(f"Callback ignoré pour task_id: {task_id} (résultat plus récent déjà enregistré)")
         
-        logger.info(f"Callback enregistré pour task_id: {task_id}")
+        if trace_id:
+            emit_callback_span(event, trace_id, parent_span_id, received_ns, task_id, stored)
         
         return {
             'statusCode': 200,
             'body': json.dumps({
-                'message': 'Callback reçu et enregistré',
+                'message': 'Callback reçu et enregistré' if stored else 'Callback ignoré : un résultat plus récent existe déjà',
                 'task_id': task_id,
-                'timestamp': timestamp
+                'timestamp': timestamp,
+                'stored': stored
             }),
             'headers': {
                 'Content-Type': 'application/json',
@@ -134,54 +255,134 @@ def handle_callback_post(event, context):
         }
 
 
-def handle_callback_get(event, context):
+def store_latest_result(item):
+    """
+    Écrit l'item canonique d'une tâche avec une écriture conditionnelle
+    qui rejette les résultats plus anciens que celui déjà enregistré.
+    Retourne False si le callback était obsolète.
+    """
+    latest_item = dict(item, timestamp=LATEST_SORT_KEY)
+    try:
+        get_table().put_item(
+            Item=latest_item,
+            ConditionExpression=Attr('task_id').not_exists() | Attr('result_timestamp').lte(item['result_timestamp'])
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise
+    
+    if HISTORY_MAX_VERSIONS > 0:
+        store_history_version(item)
+    return True
+
+
+def emit_callback_span(event, trace_id, parent_span_id, received_ns, task_id, stored):
+    """
+    Émet le span 'callback.receive' (réception -> enregistrement) avec la latence
+    de livraison mesurée depuis l'horodatage d'envoi de l'analyser
+    """
+    attributes = {'task_id': task_id, 'stored': stored}
+    sent_at = get_header(event, SENT_AT_HEADER)
+    if sent_at and sent_at.isdigit():
+        attributes['delivery_lag_ms'] = round((received_ns - int(sent_at)) / 1e6, 3)
+    emit_span('callback.receive', trace_id, new_span_id(), parent_span_id, received_ns, time.time_ns(), attributes)
+
+
+def store_history_version(item):
+    """Ajoute une version historique puis supprime les plus anciennes au-delà de HISTORY_MAX_VERSIONS"""
+    # Les versions historiques n'ont ni batch_id ni status_shard : elles restent hors
+    # des index des batchs et des statuts
+    history_item = {key: value for key, value in item.items() if key not in ('batch_id', 'status_shard')}
+    get_table().put_item(Item=history_item)
+    
+    response = get_table().query(
+        KeyConditionExpression=Key('task_id').eq(item['task_id']) & Key('timestamp').lt(LATEST_SORT_KEY),
+        ScanIndexForward=False,
+        ProjectionExpression='task_id, #ts',
+        ExpressionAttributeNames={'#ts': 'timestamp'}
+    )
+    for old_item in response.get('Items', [])[HISTORY_MAX_VERSIONS:]:
+        get_table().delete_item(Key={'task_id': old_item['task_id'], 'timestamp': old_item['timestamp']})
+
+
+def handle_callback_get(event, context, final_only=False):
     """
     Récupère les résultats d'un callback spécifique
+    Avec ?wait=N, attend jusqu'à N secondes que le résultat soit final (long-polling)
+    Avec ?history=true, inclut les versions historiques conservées
+    Avec final_only (GET /callback/{task_id}/final, seule route mise en cache par
+    API Gateway), ne répond 200 qu'avec un résultat terminé, sinon 409 sans attente
     """
     try:
         task_id = event['pathParameters']['task_id']
+        query_params = event.get('queryStringParameters') or {}
+        include_history = query_params.get('history', '').lower() == 'true'
         
-        # Récupérer l'item de DynamoDB
-        response = table.query(
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('task_id').eq(task_id),
-            ScanIndexForward=False,  # Tri par timestamp décroissant
-            Limit=10  # Limiter à 10 résultats
-        )
-        
-        items = response.get('Items', [])
+        try:
+            wait_seconds = 0 if final_only else get_wait_seconds(event, context)
+            resolve_mode = get_resolve_mode(event)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)}),
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                }
+            }
         
-        # Convertir les résultats pour la réponse JSON
-        results = []
-        for item in items:
-            # Convertir processing_time de Decimal en float pour JSON
-            processing_time = item.get('processing_time', 0)
-            if isinstance(processing_time, Decimal):
-                processing_time = float(processing_time)
+        # Les résultats terminés sont servis depuis le cache sans toucher la table
+        cached = None if include_history else result_cache_get(task_id)
+        waited = 0
+        if cached:
+            results, etag = cached
+        else:
+            results = fetch_task_results(task_id, include_history)
             
-            result = {
-                'task_id': item['task_id'],
-                'timestamp': item['timestamp'],
-                'status': item['status'],
-                'file_url': item['file_url'],
-                'analysis_results': json.loads(item.get('analysis_results', '{}')),
-                'error_message': item.get('error_message', ''),
-                'processing_time': processing_time,
-                'metadata': json.loads(item.get('metadata', '{}'))
-            }
-            results.append(result)
+            # Long-polling : sonder uniquement le statut (lecture projetée) jusqu'au résultat final
+            settled = bool(results) and results[0]['status'] in TERMINAL_STATUSES
+            if wait_seconds > 0 and not settled:
+                wait_start = time.monotonic()
+                if wait_until(lambda: is_task_settled(task_id), wait_seconds):
+                    results = fetch_task_results(task_id, include_history)
+                waited = time.monotonic() - wait_start
+            
+            etag = compute_etag(results)
+            if not include_history and results and results[0]['status'] in CACHEABLE_STATUSES:
+                result_cache_put(task_id, results, etag)
         
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'task_id': task_id,
-                'results': results,
-                'count': len(results)
-            }),
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
+        cacheable = bool(results) and results[0]['status'] in CACHEABLE_STATUSES
+        if final_only and not cacheable:
+            return {
+                'statusCode': 409,
+                'body': json.dumps({
+                    'error': 'Résultat final pas encore disponible',
+                    'task_id': task_id,
+                    'status': results[0]['status'] if results else None
+                }),
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Cache-Control': 'no-store'
+                }
             }
+        presigned_links = False
+        if any('analysis_results_ref' in r for r in results):
+            # Représentation différente selon le mode de résolution
+            etag = representation_etag(etag, resolve_mode)
+            results = resolve_offloaded_results(results, resolve_mode)
+            presigned_links = resolve_mode == 'link'
+        
+        response_body = {
+            'task_id': task_id,
+            'results': results,
+            'count': len(results)
         }
+        if wait_seconds > 0:
+            response_body['waited_seconds'] = round(waited, 2)
+        
+        return conditional_json_response(event, response_body, etag, cacheable, presigned_links)
         
     except Exception as e:
         logger.error(f"Erreur dans handle_callback_get: {str(e)}")
@@ -198,68 +399,576 @@ def handle_callback_get(event, context):
 def handle_batch_get(event, context):
     """
     Récupère tous les résultats d'un batch
+    Avec ?wait=N, attend jusqu'à N secondes que toutes les tâches soient finales
+    (ou que ?expected=M tâches finales soient présentes)
     """
     try:
         batch_id = event['pathParameters']['batch_id']
+        query_params = event.get('queryStringParameters') or {}
         
-        # Requête sur l'index secondaire global
-        response = table.query(
-            IndexName=batch_index_name,
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('batch_id').eq(batch_id),
-            ScanIndexForward=False  # Tri par timestamp décroissant
-        )
+        try:
+            wait_seconds = get_wait_seconds(event, context)
+            resolve_mode = get_resolve_mode(event)
+            expected = parse_int_param(query_params, 'expected')
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)}),
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                }
+            }
         
-        items = response.get('Items', [])
+        results = fetch_batch_results(batch_id)
         
-        # Convertir les résultats
-        results = []
-        for item in items:
-            # Convertir processing_time de Decimal en float pour JSON
-            processing_time = item.get('processing_time', 0)
-            if isinstance(processing_time, Decimal):
-                processing_time = float(processing_time)
-            
-            result = {
-                'task_id': item['task_id'],
-                'timestamp': item['timestamp'],
-                'status': item['status'],
-                'file_url': item['file_url'],
-                'analysis_results': json.loads(item.get('analysis_results', '{}')),
-                'error_message': item.get('error_message', ''),
-                'processing_time': processing_time,
-                'batch_id': item.get('batch_id', str(uuid.uuid4())),
-                'metadata': json.loads(item.get('metadata', '{}'))
-            }
-            results.append(result)
+        waited = 0
+        if wait_seconds > 0 and not is_batch_settled([r['status'] for r in results], expected):
+            wait_start = time.monotonic()
+            if wait_until(lambda: is_batch_settled(fetch_batch_statuses(batch_id), expected), wait_seconds):
+                results = fetch_batch_results(batch_id)
+            waited = time.monotonic() - wait_start
         
         # Calculer des statistiques du batch
         stats = {
             'total_tasks': len(results),
             'completed': len([r for r in results if r['status'] == 'completed']),
+            'partial': len([r for r in results if r['status'] == 'partial']),
             'failed': len([r for r in results if r['status'] == 'failed']),
             'processing': len([r for r in results if r['status'] == 'processing'])
         }
         
+        etag = compute_etag(results)
+        if any('analysis_results_ref' in r for r in results):
+            etag = representation_etag(etag, resolve_mode)
+            results = resolve_offloaded_results(results, resolve_mode)
+        
+        response_body = {
+            'batch_id': batch_id,
+            'results': results,
+            'statistics': stats
+        }
+        if wait_seconds > 0:
+            response_body['waited_seconds'] = round(waited, 2)
+        
+        # Un batch peut encore recevoir des tâches : ETag sans mise en cache longue
+        return conditional_json_response(event, response_body, etag, cacheable=False)
+        
+    except Exception as e:
+        logger.error(f"Erreur dans handle_batch_get: {str(e)}")
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'batch_id': batch_id,
-                'results': results,
-                'statistics': stats
-            }),
+            'statusCode': 500,
+            'body': json.dumps({'error': f'Erreur lors de la récupération du batch: {str(e)}'}),
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             }
         }
+
+
+def handle_status_query(event, context):
+    """
+    Liste les tâches d'un statut reçues dans une plage de temps, les plus récentes
+    en premier (GET /callback?status=failed&from=-1h&to=...&limit=50&next_token=...)
+    Lecture de l'index des statuts uniquement : les résultats d'analyse complets se
+    récupèrent ensuite par task_id
+    Disponible en mode de stockage 'latest' uniquement ; le statut 'processing'
+    demande que l'analyser envoie ses callbacks de début (PROCESSING_CALLBACK_ENABLED)
+    """
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            if STORAGE_MODE != 'latest':
+                raise ValueError("La recherche par statut n'est disponible qu'en mode de stockage 'latest'")
+            status = query_params.get('status')
+            if status not in QUERYABLE_STATUSES:
+                raise ValueError(f"Le paramètre status doit être l'une des valeurs: {', '.join(QUERYABLE_STATUSES)}")
+            if status == 'processing' and not PROCESSING_CALLBACK_ENABLED:
+                raise ValueError("Le statut 'processing' n'est enregistré que si les callbacks de début d'analyse sont activés (ANALYSER_PROCESSING_CALLBACK=true)")
+            now = datetime.utcnow()
+            end = parse_time_param(query_params.get('to'), now) or now
+            start = parse_time_param(query_params.get('from'), now) or end - timedelta(hours=STATUS_QUERY_DEFAULT_WINDOW_HOURS)
+            if start > end:
+                raise ValueError('Le paramètre from doit précéder to')
+            limit = parse_int_param(query_params, 'limit', STATUS_QUERY_DEFAULT_LIMIT, STATUS_QUERY_MAX_LIMIT)
+            start, end = start.isoformat(), end.isoformat()
+            positions = None
+            # Pages suivantes : bornes figées à la première page (les bornes relatives
+            # ne glissent pas entre deux pages)
+            if query_params.get('next_token'):
+                start, end, positions = decode_next_token(query_params['next_token'])
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)}),
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                }
+            }
+        
+        try:
+            items, positions = query_status_index(status, start, end, limit, positions)
+        except ClientError as e:
+            # Clé de reprise d'un jeton forgé ou altéré refusée par DynamoDB
+            if positions is None or e.response.get('Error', {}).get('Code') != 'ValidationException':
+                raise
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Le paramètre next_token est invalide'}),
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*'
+                }
+            }
+        response_body = {
+            'status': status,
+            'from': start,
+            'to': end,
+            'count': len(items),
+            'items': [index_item_to_summary(item) for item in items],
+            'next_token': encode_next_token(start, end, positions)
+        }
+        return conditional_json_response(event, response_body, compute_etag(response_body), cacheable=False)
         
     except Exception as e:
-        logger.error(f"Erreur dans handle_batch_get: {str(e)}")
+        logger.error(f"Erreur dans handle_status_query: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps({'error': f'Erreur lors de la récupération du batch: {str(e)}'}),
+            'body': json.dumps({'error': f'Erreur lors de la recherche par statut: {str(e)}'}),
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             }
         }
+
+
+def status_shard(status, task_id):
+    """Clé de partition de l'index des statuts : shard stable dérivé du task_id"""
+    shard = int(hashlib.sha256(task_id.encode('utf-8')).hexdigest()[:8], 16) % STATUS_INDEX_SHARDS
+    return f"{status}#{shard}"
+
+
+def parse_time_param(value, now):
+    """
+    Borne de temps en datetime UTC naïf (comme les timestamps stockés) : ISO 8601,
+    secondes epoch ou durée relative ("-15m") ; None si absente, ValueError si invalide
+    """
+    if not value:
+        return None
+    relative = RELATIVE_TIME_RE.match(value)
+    if relative:
+        return now - timedelta(seconds=float(relative.group(1)) * RELATIVE_TIME_UNITS[relative.group(2)])
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except (ValueError, OverflowError, OSError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Borne de temps invalide: {value} (ISO 8601, secondes epoch ou durée relative comme -1h)")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def index_key(item):
+    """Clé d'un item de l'index des statuts (clés de l'index et de la table)"""
+    return {name: item[name] for name in ('status_shard', 'status_at', 'task_id', 'timestamp')}
+
+
+def query_status_index(status, start, end, limit, positions=None):
+    """
+    Interroge chaque shard du statut et fusionne les pages par status_at décroissant
+    `positions` (shard -> clé de reprise, {} = début) vient de la page précédente ;
+    retourne (items, positions de la page suivante), sans positions quand tout est lu
+    """
+    if positions is None:
+        positions = {str(shard): {} for shard in range(STATUS_INDEX_SHARDS)}
+    
+    pages = {}
+    for shard, start_key in positions.items():
+        query = {
+            'IndexName': status_index_name,
+            'KeyConditionExpression': Key('status_shard').eq(f"{status}#{shard}") & Key('status_at').between(start, end),
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+        response = get_table().query(**query)
+        pages[shard] = (response.get('Items', []), 'LastEvaluatedKey' in response)
+    
+    merged = sorted(
+        ((item['status_at'], item['task_id'], shard, item) for shard, (items, _) in pages.items() for item in items),
+        key=lambda entry: entry[:2],
+        reverse=True
+    )[:limit]
+    
+    # Chaque shard reprend après son dernier item retenu ; un shard entièrement lu est terminé
+    next_positions = {}
+    for shard, (items, has_more) in pages.items():
+        taken = [entry[3] for entry in merged if entry[2] == shard]
+        if len(taken) < len(items) or has_more:
+            next_positions[shard] = index_key(taken[-1]) if taken else positions[shard]
+    return [entry[3] for entry in merged], next_positions
+
+
+def encode_next_token(start, end, positions):
+    """Jeton de pagination opaque (bornes et positions des shards), None à la dernière page"""
+    if not positions:
+        return None
+    token = {'from': start, 'to': end, 'shards': positions}
+    return base64.urlsafe_b64encode(json.dumps(token, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_next_token(token):
+    """(début, fin, positions des shards) d'un jeton de pagination ; ValueError s'il est invalide"""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        start, end, positions = decoded['from'], decoded['to'], decoded['shards']
+    except (ValueError, UnicodeError, TypeError, KeyError):
+        raise ValueError('Le paramètre next_token est invalide')
+    if not isinstance(start, str) or not isinstance(end, str):
+        raise ValueError('Le paramètre next_token est invalide')
+    if not isinstance(positions, dict) or not all(isinstance(key, dict) for key in positions.values()):
+        raise ValueError('Le paramètre next_token est invalide')
+    return start, end, positions
+
+
+def index_item_to_summary(item):
+    """Résumé d'une tâche à partir des attributs projetés dans l'index des statuts"""
+    processing_time = item.get('processing_time', 0)
+    if isinstance(processing_time, Decimal):
+        processing_time = float(processing_time)
+    summary = {
+        'task_id': item['task_id'],
+        'status': item['status'],
+        'status_at': item['status_at'],
+        'timestamp': item.get('result_timestamp', item['status_at']),
+        'file_url': item.get('file_url', ''),
+        'processing_time': processing_time,
+        'error_message': item.get('error_message', '')
+    }
+    for name in ('batch_id', 'trace_id'):
+        if name in item:
+            summary[name] = item[name]
+    return summary
+
+
+def item_to_result(item):
+    """Convertit un item DynamoDB en résultat sérialisable en JSON"""
+    # Convertir processing_time de Decimal en float pour JSON
+    processing_time = item.get('processing_time', 0)
+    if isinstance(processing_time, Decimal):
+        processing_time = float(processing_time)
+    
+    result = {
+        'task_id': item['task_id'],
+        'timestamp': item.get('result_timestamp', item['timestamp']),
+        'status': item['status'],
+        'file_url': item['file_url'],
+        'analysis_results': json.loads(item.get('analysis_results', '{}')),
+        'error_message': item.get('error_message', ''),
+        'processing_time': processing_time,
+        'metadata': json.loads(item.get('metadata', '{}'))
+    }
+    
+    # Résultats déportés dans S3 : résolus à la demande (voir resolve_offloaded_results)
+    if 'analysis_results_ref' in item:
+        result['analysis_results'] = None
+        result['analysis_results_ref'] = item['analysis_results_ref']
+    if 'trace_id' in item:
+        result['trace_id'] = item['trace_id']
+    return result
+
+
+def fetch_task_results(task_id, include_history=False):
+    """Récupère les dernières versions du résultat d'une tâche (la plus récente en premier)"""
+    if STORAGE_MODE == 'latest':
+        # L'item canonique suffit, l'historique n'est lu qu'à la demande
+        limit = 1 + HISTORY_MAX_VERSIONS if include_history else 1
+    else:
+        limit = 10  # Limiter à 10 résultats
+    
+    response = get_table().query(
+        KeyConditionExpression=Key('task_id').eq(task_id),
+        ScanIndexForward=False,  # Tri par timestamp décroissant
+        Limit=limit
+    )
+    return [item_to_result(item) for item in response.get('Items', [])]
+
+
+def fetch_batch_results(batch_id):
+    """Récupère tous les résultats d'un batch via l'index secondaire global"""
+    response = get_table().query(
+        IndexName=batch_index_name,
+        KeyConditionExpression=Key('batch_id').eq(batch_id),
+        ScanIndexForward=False  # Tri par timestamp décroissant
+    )
+    
+    results = []
+    for item in response.get('Items', []):
+        result = item_to_result(item)
+        result['batch_id'] = item.get('batch_id', str(uuid.uuid4()))
+        results.append(result)
+    return results
+
+
+def get_table():
+    """Table des résultats, créée au premier usage puis réutilisée"""
+    global _table
+    if _table is None:
+        _table = boto3.resource('dynamodb').Table(table_name)
+    return _table
+
+
+def get_s3_client():
+    """Client S3 créé au premier usage puis réutilisé"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client('s3')
+    return _s3_client
+
+
+def offload_analysis_results(task_id, result_timestamp, analysis_results):
+    """Stocke les résultats sérialisés compressés dans S3 et retourne le pointeur s3://"""
+    key = f"results/{task_id}/{result_timestamp}.json.gz"
+    get_s3_client().put_object(
+        Bucket=RESULTS_BUCKET_NAME,
+        Key=key,
+        Body=gzip.compress(analysis_results.encode('utf-8')),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+    logger.info(f"Résultats déportés dans S3 pour task_id: {task_id} ({len(analysis_results)} octets)")
+    return f"s3://{RESULTS_BUCKET_NAME}/{key}"
+
+
+def split_s3_ref(ref):
+    """Découpe un pointeur s3://bucket/key en (bucket, key)"""
+    bucket, _, key = ref[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def resolve_offloaded_results(results, resolve_mode):
+    """
+    Résout les pointeurs S3 : URL présignée (mode 'link') ou contenu inline (mode 'inline')
+    Retourne de nouveaux dictionnaires pour ne pas altérer les entrées du cache
+    """
+    resolved = []
+    for result in results:
+        if 'analysis_results_ref' not in result:
+            resolved.append(result)
+            continue
+        result = dict(result)
+        bucket, key = split_s3_ref(result['analysis_results_ref'])
+        if resolve_mode == 'inline':
+            response = get_s3_client().get_object(Bucket=bucket, Key=key)
+            result['analysis_results'] = json.loads(gzip.decompress(response['Body'].read()))
+        else:
+            result['analysis_results_url'] = get_s3_client().generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket, 'Key': key},
+                ExpiresIn=PRESIGNED_URL_EXPIRES_SECONDS
+            )
+        resolved.append(result)
+    return resolved
+
+
+def is_task_settled(task_id):
+    """Sonde légère : lit uniquement le statut de la version la plus récente"""
+    response = get_table().query(
+        KeyConditionExpression=Key('task_id').eq(task_id),
+        ScanIndexForward=False,
+        Limit=1,
+        ProjectionExpression='#st',
+        ExpressionAttributeNames={'#st': 'status'}
+    )
+    items = response.get('Items', [])
+    return bool(items) and items[0].get('status') in TERMINAL_STATUSES
+
+
+def fetch_batch_statuses(batch_id):
+    """Sonde légère : lit uniquement les statuts des tâches d'un batch"""
+    response = get_table().query(
+        IndexName=batch_index_name,
+        KeyConditionExpression=Key('batch_id').eq(batch_id),
+        ProjectionExpression='#st',
+        ExpressionAttributeNames={'#st': 'status'}
+    )
+    return [item.get('status') for item in response.get('Items', [])]
+
+
+def is_batch_settled(statuses, expected=None):
+    """Un batch est final quand toutes ses tâches connues (ou expected tâches) sont finales"""
+    finished = len([s for s in statuses if s in TERMINAL_STATUSES])
+    if expected is not None:
+        return finished >= expected
+    return bool(statuses) and finished == len(statuses)
+
+
+def result_cache_get(task_id):
+    """Retourne (résultats, etag) depuis le cache LRU, ou None si absent ou expiré"""
+    entry = _result_cache.get(task_id)
+    if entry is None:
+        return None
+    expires_at, results, etag = entry
+    if expires_at < time.monotonic():
+        del _result_cache[task_id]
+        return None
+    _result_cache.move_to_end(task_id)
+    return results, etag
+
+
+def result_cache_put(task_id, results, etag):
+    """Ajoute un résultat terminé au cache LRU en évinçant les entrées les plus anciennes"""
+    _result_cache[task_id] = (time.monotonic() + RESULT_CACHE_TTL_SECONDS, results, etag)
+    _result_cache.move_to_end(task_id)
+    while len(_result_cache) > RESULT_CACHE_MAX_ENTRIES:
+        _result_cache.popitem(last=False)
+
+
+def compute_etag(results):
+    """ETag fort calculé sur le contenu des résultats"""
+    digest = hashlib.sha256(json.dumps(results, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def get_header(event, name):
+    """Lit un header de la requête sans tenir compte de la casse"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def get_request_body(event):
+    """
+    Retourne le body texte de la requête, décodé du base64 (types binaires
+    API Gateway) et décompressé si l'émetteur l'a envoyé en gzip
+    """
+    body = event['body']
+    raw = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+    if (get_header(event, 'Content-Encoding') or '').lower() == 'gzip' or raw[:2] == b'\x1f\x8b':
+        raw = gzip.decompress(raw)
+    return raw.decode('utf-8')
+
+
+def representation_etag(etag, resolve_mode):
+    """
+    ETag d'une réponse aux pointeurs S3 résolus : dépend du mode de résolution et,
+    en mode 'link', de la fenêtre de génération des URL présignées (un 304 ne
+    confirme jamais des liens générés il y a plus de PRESIGNED_LINK_MAX_AGE_SECONDS)
+    """
+    if resolve_mode == 'link':
+        return f'{etag[:-1]}-link{int(time.time()) // PRESIGNED_LINK_MAX_AGE_SECONDS}"'
+    return f'{etag[:-1]}-{resolve_mode}"'
+
+
+def conditional_json_response(event, response_body, etag, cacheable, presigned_links=False):
+    """
+    Construit la réponse JSON avec ETag et Cache-Control,
+    ou un 304 si le client possède déjà cette version (If-None-Match)
+    Une réponse terminée contenant des URL présignées n'est ni immuable ni
+    partageable : sa fraîcheur reste inférieure à l'expiration des liens
+    """
+    if not cacheable:
+        cache_control = 'no-cache'
+    elif presigned_links:
+        cache_control = f'private, max-age={min(COMPLETED_MAX_AGE_SECONDS, PRESIGNED_LINK_MAX_AGE_SECONDS)}'
+    else:
+        cache_control = f'public, max-age={COMPLETED_MAX_AGE_SECONDS}, immutable'
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'ETag': etag,
+        'Cache-Control': cache_control
+    }
+    
+    if_none_match = get_header(event, 'If-None-Match')
+    if if_none_match:
+        candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        if '*' in candidates or etag in candidates:
+            return {
+                'statusCode': 304,
+                'body': '',
+                'headers': headers
+            }
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(response_body),
+        'headers': headers
+    }
+
+
+def get_resolve_mode(event):
+    """Lit le paramètre ?resolve=link|inline (link par défaut)"""
+    query_params = event.get('queryStringParameters') or {}
+    resolve_mode = query_params.get('resolve') or 'link'
+    if resolve_mode not in RESOLVE_MODES:
+        raise ValueError('Le paramètre resolve doit valoir link ou inline')
+    return resolve_mode
+
+
+def parse_int_param(query_params, name, default=None, maximum=None):
+    """
+    Entier strictement positif (borné par maximum) d'un query parameter, default s'il est absent
+    ValueError avec un message destiné au client s'il est invalide
+    """
+    raw_value = (query_params.get(name) or '').strip()
+    if not raw_value:
+        return default
+    # Chiffres ASCII seulement : isdigit() accepte aussi '²' ou '٣', que int() refuse ou convertit
+    value = int(raw_value) if raw_value.isascii() and raw_value.isdigit() else 0
+    if value < 1 or (maximum is not None and value > maximum):
+        if maximum is not None:
+            raise ValueError(f"Le paramètre {name} doit être un entier entre 1 et {maximum}")
+        raise ValueError(f"Le paramètre {name} doit être un entier positif")
+    return value
+
+
+def get_wait_seconds(event, context):
+    """
+    Lit le paramètre ?wait=N et le borne par MAX_WAIT_SECONDS
+    et par le temps restant avant le timeout de la Lambda
+    """
+    query_params = event.get('queryStringParameters') or {}
+    raw_wait = query_params.get('wait')
+    if not raw_wait:
+        return 0
+    
+    try:
+        wait_seconds = float(raw_wait)
+    except ValueError:
+        raise ValueError('Le paramètre wait doit être un nombre de secondes')
+    
+    wait_seconds = max(0.0, min(wait_seconds, MAX_WAIT_SECONDS))
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        remaining = (context.get_remaining_time_in_millis() - WAIT_SAFETY_MARGIN_MS) / 1000
+        wait_seconds = min(wait_seconds, max(0.0, remaining))
+    return wait_seconds
+
+
+def wait_until(is_ready, wait_seconds):
+    """
+    Appelle is_ready() avec un backoff exponentiel jusqu'à ce qu'il renvoie True
+    Retourne False si l'échéance est atteinte avant
+    """
+    deadline = time.monotonic() + wait_seconds
+    interval = WAIT_INITIAL_INTERVAL
+    while True:
+        if is_ready():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, WAIT_MAX_INTERVAL)
+
+
+# Sur Lambda, la table est préinitialisée pendant la phase d'init du conteneur
+# (partagée par toutes les invocations) plutôt qu'à la première requête
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    get_table()
@@ -0,0 +1,83 @@
+import math
+
+# Options d'analyse d'une requête (profil, métriques, timeline), partagées par le
+# dispatcher, qui les valide avant tout lancement, et l'analyser, qui les applique :
+# une seule liste de valeurs acceptées et les mêmes messages d'erreur des deux côtés
+PROFILE_FULL = 'full'
+PROFILE_APPROXIMATE = 'approximate'
+PROFILES = (PROFILE_FULL, PROFILE_APPROXIMATE)
+
+# Métriques sélectionnables : la durée se lit dans l'en-tête (ffprobe), la loudness
+# et le silence demandent de décoder l'audio, le contrôle vidéo (optionnel, hors
+# sélection par défaut) de décoder les images clés de la vidéo
+METRIC_DURATION = 'duration'
+METRIC_LOUDNESS = 'loudness'
+METRIC_SILENCE = 'silence'
+METRIC_VIDEO = 'video'
+METRICS = (METRIC_DURATION, METRIC_LOUDNESS, METRIC_SILENCE, METRIC_VIDEO)
+DEFAULT_METRICS = (METRIC_DURATION, METRIC_LOUDNESS, METRIC_SILENCE)
+
+# Résolution des timelines par défaut et minimum (ebur128 mesure toutes les 100 ms)
+TIMELINE_DEFAULT_RESOLUTION = 1.0
+TIMELINE_MIN_RESOLUTION = 0.1
+
+
+def parse_profile(value):
+    """Profil d'analyse demandé, PROFILE_FULL si absent ; ValueError si inconnu"""
+    if value is None or value == '':
+        return PROFILE_FULL
+    if value not in PROFILES:
+        raise ValueError(f"profile doit être l'une des valeurs: {', '.join(PROFILES)}")
+    return value
+
+
+def parse_metrics(value):
+    """
+    Métriques demandées : liste ou chaîne séparée par des virgules, DEFAULT_METRICS si absent
+    Retourne un tuple dans l'ordre de METRICS ; ValueError si la valeur n'est ni une liste
+    ni une chaîne, ou si une métrique est inconnue
+    """
+    if value is None or value == [] or value == '':
+        return DEFAULT_METRICS
+    if not isinstance(value, (str, list)):
+        raise ValueError("metrics doit être une liste ou une chaîne séparée par des virgules")
+    names = value.split(',') if isinstance(value, str) else value
+    requested = {str(name).strip().lower() for name in names}
+    unknown = requested - set(METRICS)
+    if unknown:
+        raise ValueError(f"metrics inconnues: {', '.join(sorted(unknown))} (valeurs possibles: {', '.join(METRICS)})")
+    return tuple(metric for metric in METRICS if metric in requested)
+
+
+def parse_timeline_option(value):
+    """
+    Option 'timeline' de la requête : false/absent, true (résolution par défaut)
+    ou résolution en secondes ; retourne la résolution ou None, ValueError si invalide
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        return TIMELINE_DEFAULT_RESOLUTION
+    try:
+        resolution = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("timeline doit être un booléen ou une résolution en secondes")
+    if not math.isfinite(resolution) or resolution < TIMELINE_MIN_RESOLUTION:
+        raise ValueError(f"La résolution de timeline doit être d'au moins {TIMELINE_MIN_RESOLUTION}s")
+    return resolution
+
+
+def request_options(request_data):
+    """
+    Options d'analyse présentes dans la requête, validées et normalisées pour être
+    transmises telles quelles à chaque analyse ; ValueError si une option est invalide
+    """
+    options = {}
+    if request_data.get('profile') is not None:
+        options['profile'] = parse_profile(request_data['profile'])
+    if request_data.get('metrics') not in (None, [], ''):
+        options['metrics'] = list(parse_metrics(request_data['metrics']))
+    timeline_resolution = parse_timeline_option(request_data.get('timeline'))
+    if timeline_resolution is not None:
+        options['timeline'] = timeline_resolution
+    return options
@@ -0,0 +1,31 @@
+import json
+
+# Contrat d'invocation interne dispatcher -> analyser : la tâche voyage en objet
+# JSON (pas de body sérialisé dans un événement API Gateway) et la réponse est
+# un objet {statusCode, data} sérialisé une seule fois par le runtime Lambda.
+# Les appels externes (API Gateway, URL de fonction) gardent le format API Gateway.
+INTERNAL_CONTRACT_KEY = 'contract'
+INTERNAL_CONTRACT_VERSION = 'analysis-task/1'
+
+
+def encode_task(task):
+    """Payload d'invocation compacte d'une tâche (une seule sérialisation, UTF-8 sans échappement)"""
+    payload = {INTERNAL_CONTRACT_KEY: INTERNAL_CONTRACT_VERSION, 'task': task}
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def is_internal_event(event):
+    """Vrai si l'événement suit le contrat interne"""
+    return isinstance(event, dict) and event.get(INTERNAL_CONTRACT_KEY) == INTERNAL_CONTRACT_VERSION
+
+
+def internal_response(data, status_code=200):
+    """Réponse du contrat interne : objet sérialisé par le runtime, sans body imbriqué"""
+    return {'statusCode': status_code, 'data': data}
+
+
+def decode_response(payload):
+    """(statusCode, données) d'une réponse, contrat interne ou format API Gateway"""
+    if 'data' in payload:
+        return payload.get('statusCode'), payload['data']
+    return payload.get('statusCode'), json.loads(payload.get('body') or '{}')
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import time
+
+# Journalisation structurée : une ligne JSON compacte par événement sur stdout.
+# Les logs de debug sont échantillonnés par tâche et leurs champs ne sont
+# sérialisés que si la ligne est effectivement écrite.
+
+# Part des tâches dont les logs de debug sont écrits (0 = aucune, 1 = toutes).
+# DEBUG=true (ancien réglage) équivaut à DEBUG_SAMPLE_RATE=1
+DEBUG_SAMPLE_RATE = 1.0 if os.environ.get('DEBUG', 'false').lower() == 'true' else float(os.environ.get('DEBUG_SAMPLE_RATE', '0'))
+# Nombre maximum de lignes structurées par invocation (les suivantes sont comptées puis ignorées)
+LOG_MAX_LINES = int(os.environ.get('LOG_MAX_LINES', '50'))
+# Taille maximum (caractères) d'un champ sérialisé, au-delà il est tronqué
+LOG_MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', '4096'))
+
+# En-tête HTTP forçant les logs de debug pour une requête
+DEBUG_HEADER = 'X-Debug'
+DEBUG_HEADER_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def is_debug_requested(headers):
+    """Indique si la requête demande les logs de debug (en-tête X-Debug)"""
+    for key, value in (headers or {}).items():
+        if key.lower() == DEBUG_HEADER.lower():
+            return str(value).strip().lower() in DEBUG_HEADER_VALUES
+    return False
+
+
+def is_task_sampled(task_id, rate=None):
+    """
+    Échantillonnage déterministe par tâche : le même task_id est retenu (ou non)
+    par toutes les Lambdas et à chaque nouvel essai
+    """
+    rate = DEBUG_SAMPLE_RATE if rate is None else rate
+    if rate >= 1:
+        return True
+    if rate <= 0 or not task_id:
+        return False
+    bucket = int(hashlib.sha1(str(task_id).encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+    return bucket < rate
+
+
+def _field_value(value):
+    """Évalue un champ paresseux (callable) puis le tronque s'il est trop long une fois sérialisé"""
+    if callable(value):
+        value = value()
+    if isinstance(value, (dict, list, tuple)):
+        serialized = json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+        if len(serialized) > LOG_MAX_FIELD_CHARS:
+            return serialized[:LOG_MAX_FIELD_CHARS] + f"…(+{len(serialized) - LOG_MAX_FIELD_CHARS})"
+        return value
+    if isinstance(value, str) and len(value) > LOG_MAX_FIELD_CHARS:
+        return value[:LOG_MAX_FIELD_CHARS] + f"…(+{len(value) - LOG_MAX_FIELD_CHARS})"
+    return value
+
+
+class InvocationLog:
+    """Logs structurés d'une invocation, plafonnés à LOG_MAX_LINES lignes"""
+
+    def __init__(self, task_id=None, debug=False):
+        self.task_id = task_id
+        self.debug_enabled = debug
+        self.lines = 0
+        self.dropped = 0
+
+    def debug(self, event, **fields):
+        """Ligne de debug : ignorée sans aucun formatage si la tâche n'est pas échantillonnée"""
+        if self.debug_enabled:
+            self._emit('DEBUG', event, fields)
+
+    def info(self, event, **fields):
+        self._emit('INFO', event, fields)
+
+    def warning(self, event, **fields):
+        self._emit('WARNING', event, fields)
+
+    def error(self, event, **fields):
+        self._emit('ERROR', event, fields)
+
+    def _emit(self, level, event, fields):
+        if self.lines >= LOG_MAX_LINES:
+            self.dropped += 1
+            return
+        self.lines += 1
+        record = {'level': level, 'event': event, 'task_id': self.task_id, 'ts': round(time.time(), 3)}
+        record.update({key: _field_value(value) for key, value in fields.items()})
+        print(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str), flush=True)
+
+    def close(self):
+        """Signale les lignes ignorées par le plafond (toujours écrit, hors plafond)"""
+        if self.dropped:
+            print(json.dumps({'level': 'WARNING', 'event': 'log_lines_dropped', 'task_id': self.task_id, 'dropped': self.dropped}, separators=(',', ':')), flush=True)
+
+
+# Logs de l'invocation en cours (une invocation à la fois par conteneur Lambda)
+_current = InvocationLog()
+
+
+def start_log(task_id=None, force_debug=False):
+    """Démarre les logs d'une invocation ; debug si demandé ou si la tâche est échantillonnée"""
+    global _current
+    _current = InvocationLog(task_id, force_debug or is_task_sampled(task_id))
+    return _current
+
+
+def current_log():
+    """Logs de l'invocation en cours"""
+    return _current
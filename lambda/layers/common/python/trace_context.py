@@ -0,0 +1,110 @@
+import json
+import os
+import re
+import time
+
+# Propagation du contexte de trace entre dispatcher, analyser et callback
+# (en-tête W3C traceparent et champ 'trace' de la payload d'invocation)
+TRACEPARENT_HEADER = 'traceparent'
+# Horodatage d'envoi (ns depuis l'epoch) pour mesurer la latence de livraison
+SENT_AT_HEADER = 'X-Trace-Sent-At'
+
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+SERVICE_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+
+TRACEPARENT_PATTERN = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+
+def new_trace_id():
+    """Identifiant de trace aléatoire (128 bits, hexadécimal)"""
+    return os.urandom(16).hex()
+
+
+def new_span_id():
+    """Identifiant de span aléatoire (64 bits, hexadécimal)"""
+    return os.urandom(8).hex()
+
+
+def format_traceparent(trace_id, span_id):
+    """En-tête traceparent W3C (version 00, échantillonné)"""
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def parse_traceparent(value):
+    """Retourne (trace_id, parent_span_id) depuis un en-tête traceparent, ou (None, None)"""
+    match = TRACEPARENT_PATTERN.match((value or '').strip().lower())
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def emit_span(name, trace_id, span_id, parent_span_id, start_ns, end_ns, attributes=None):
+    """
+    Écrit un span sous forme d'une ligne JSON sur stdout (CloudWatch Logs) ;
+    tools/trace_collector.py regroupe ces lignes par trace_id
+    """
+    if not TRACING_ENABLED or not trace_id:
+        return
+    print(json.dumps({
+        'type': 'trace_span',
+        'trace_id': trace_id,
+        'span_id': span_id,
+        'parent_span_id': parent_span_id,
+        'name': name,
+        'service': SERVICE_NAME,
+        'start_unix_nano': start_ns,
+        'end_unix_nano': end_ns,
+        'duration_ms': round((end_ns - start_ns) / 1e6, 3),
+        'attributes': attributes or {},
+    }, separators=(',', ':'), default=str), flush=True)
+
+
+class TraceSpan:
+    """Span chronométré sur l'horloge murale (comparable entre Lambdas)"""
+
+    def __init__(self, name, trace_id=None, parent_span_id=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id or new_trace_id()
+        self.span_id = new_span_id()
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes['error'] = str(exc)
+        self.end()
+        return False
+
+    def set_parent(self, trace_id, parent_span_id):
+        """Rattache le span à une trace reçue après sa création"""
+        if trace_id:
+            self.trace_id = trace_id
+            self.parent_span_id = parent_span_id
+
+    def child(self, name, **attributes):
+        """Crée un span enfant dans la même trace"""
+        return TraceSpan(name, self.trace_id, self.span_id, **attributes)
+
+    def traceparent(self):
+        """En-tête traceparent désignant ce span comme parent"""
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def payload_context(self):
+        """Contexte à transmettre dans la payload d'une invocation Lambda"""
+        return {
+            'trace_id': self.trace_id,
+            'parent_span_id': self.span_id,
+            'dispatched_at_ns': time.time_ns(),
+        }
+
+    def end(self):
+        """Termine le span (une seule fois) et l'émet"""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            emit_span(self.name, self.trace_id, self.span_id, self.parent_span_id, self.start_ns, self.end_ns, self.attributes)
@@ -1,11 +1,10 @@
 #!/bin/bash
 set -e
 
-echo "📦 Préparation du layer ffmpeg pour Lambda..."
+echo "📦 Préparation des layers ffmpeg et requests pour Lambda..."
 
 # Créer les répertoires pour le layer
 mkdir -p ffmpeg/bin
-mkdir -p ffmpeg/python
 
 # Télécharger ffmpeg statique
 echo "🔍 Téléchargement de ffmpeg statique..."
@@ -20,12 +19,13 @@ cp "$FFMPEG_DIR/ffprobe" ffmpeg/bin/
 chmod +x ffmpeg/bin/ffmpeg
 chmod +x ffmpeg/bin/ffprobe
 
-# Installer requests dans le layer
+# Installer requests dans son propre layer (aussi utilisé sans ffmpeg par la reprise des callbacks)
 echo "📦 Installation du package requests..."
-pip install requests -t ffmpeg/python/
+rm -rf requests/python
+pip install -r requests/requirements.txt -t requests/python/
 
 # Nettoyer
 echo "🧹 Nettoyage..."
 rm -rf "$FFMPEG_DIR" ffmpeg.tar.xz
 
-echo "✅ Layer ffmpeg prêt !"
+echo "✅ Layers ffmpeg et requests prêts !"
@@ -0,0 +1,204 @@
+"""
+Budget de temps de l'analyse : échéance dérivée du temps restant de la Lambda,
+estimation du coût à partir de la durée et du débit sondés, et choix de la
+stratégie (complète, segments en parallèle ou échantillonnée) avant de lancer ffmpeg ;
+plan du profil approximatif (fenêtres stratifiées) ; profils et métriques
+sélectionnables partagés avec le dispatcher par le layer commun (analysis_options)
+"""
+import math
+import os
+import random
+import time
+from analysis_options import METRIC_LOUDNESS, METRIC_SILENCE, METRIC_VIDEO
+
+# Marge conservée avant le timeout de la Lambda pour envoyer le callback
+ANALYSIS_DEADLINE_MARGIN_MS = int(os.environ.get('ANALYSIS_DEADLINE_MARGIN_MS', '15000'))
+
+# Modèle de coût d'un processus ffmpeg : secondes de média analysées par seconde
+# de calcul (ebur128 + silencedetect sur un cœur) et débit de lecture du conteneur
+# (les paquets vidéo sont lus même s'ils ne sont pas décodés)
+ANALYSIS_REALTIME_SPEED = float(os.environ.get('ANALYSIS_REALTIME_SPEED', '120'))
+ANALYSIS_READ_BYTES_PER_SECOND = float(os.environ.get('ANALYSIS_READ_MBPS', '200')) * 1e6
+# Coût fixe d'un processus (démarrage, ouverture du conteneur, seek)
+ANALYSIS_PROCESS_OVERHEAD_SECONDS = 0.3
+# Part du budget visée par l'estimation : le reste absorbe les erreurs du modèle
+ANALYSIS_BUDGET_USAGE = 0.8
+
+# Segments : durée minimum d'un segment, processus ffmpeg simultanés (0 = nombre de CPU)
+ANALYSIS_MIN_SEGMENT_SECONDS = 30
+ANALYSIS_MAX_PARALLEL = int(os.environ.get('ANALYSIS_MAX_PARALLEL', '0'))
+# Threads de décodage et du graphe de filtres par processus ffmpeg (0 = CPU disponibles
+# répartis entre les processus simultanés)
+FFMPEG_THREADS = int(os.environ.get('FFMPEG_THREADS', '0'))
+# Lambda alloue un vCPU complet pour 1769 Mo de mémoire (part proportionnelle en dessous)
+LAMBDA_MB_PER_VCPU = 1769
+# Échantillonnage : nombre de fenêtres réparties sur la durée, durée minimum d'une fenêtre
+ANALYSIS_SAMPLE_WINDOWS = int(os.environ.get('ANALYSIS_SAMPLE_WINDOWS', '12'))
+ANALYSIS_MIN_WINDOW_SECONDS = 1.0
+
+# Profil approximatif (tri rapide) : une fenêtre par strate, placée au hasard dans
+# sa strate ; le seek côté entrée évite de décoder les zones ignorées
+APPROXIMATE_WINDOWS = int(os.environ.get('APPROXIMATE_WINDOWS', '16'))
+APPROXIMATE_WINDOW_SECONDS = float(os.environ.get('APPROXIMATE_WINDOW_SECONDS', '8'))
+
+# Métriques qui demandent de décoder l'audio, ou un décodage quelconque
+AUDIO_METRICS = (METRIC_LOUDNESS, METRIC_SILENCE)
+DECODE_METRICS = (METRIC_LOUDNESS, METRIC_SILENCE, METRIC_VIDEO)
+
+STRATEGY_PROBE = 'probe'
+STRATEGY_FULL = 'full'
+STRATEGY_SEGMENTED = 'segmented'
+STRATEGY_SAMPLED = 'sampled'
+STRATEGY_APPROXIMATE = 'approximate'
+# Stratégies dont les fenêtres sont un échantillon de la durée (mesures extrapolées)
+SAMPLING_STRATEGIES = (STRATEGY_SAMPLED, STRATEGY_APPROXIMATE)
+
+
+def deadline_from_context(context, margin_ms=ANALYSIS_DEADLINE_MARGIN_MS):
+    """Échéance de l'analyse (horloge time.monotonic), None sans contexte Lambda"""
+    get_remaining_time = getattr(context, 'get_remaining_time_in_millis', None)
+    if get_remaining_time is None:
+        return None
+    return time.monotonic() + max(0, get_remaining_time() - margin_ms) / 1000
+
+
+def remaining_seconds(deadline):
+    """Secondes restantes avant l'échéance (None = pas d'échéance)"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def cpu_quota():
+    """
+    CPU alloués au processus, fractionnaires : quota cgroup (v2 cpu.max, v1
+    cpu.cfs_quota_us) et part de vCPU du palier de mémoire Lambda ; None sans limite
+    """
+    quotas = []
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            quotas.append(int(quota) / int(period))
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                quota = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if quota > 0:
+                quotas.append(quota / period)
+        except (OSError, ValueError):
+            pass
+    memory_mb = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    if memory_mb and memory_mb.isdigit():
+        quotas.append(int(memory_mb) / LAMBDA_MB_PER_VCPU)
+    return min(quotas) if quotas else None
+
+
+def available_cpus():
+    """CPU utilisables par le processus : affinité (sinon nombre de CPU) bornée par le quota arrondi au supérieur"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def ffmpeg_threads(parallel):
+    """Threads de chacun des `parallel` processus ffmpeg simultanés"""
+    return FFMPEG_THREADS or max(1, available_cpus() // parallel)
+
+
+def seconds_per_media_second(probe):
+    """
+    Coût marginal (s) d'une seconde de média : décodage et filtres de chaque piste
+    audio, lecture du conteneur (une seule fois quel que soit le nombre de pistes)
+    """
+    tracks = max(1, len(probe.get('audio_tracks') or []))
+    return tracks / ANALYSIS_REALTIME_SPEED + (probe.get('bit_rate') or 0) / 8 / ANALYSIS_READ_BYTES_PER_SECOND
+
+
+def estimate_window_seconds(probe, seconds):
+    """Durée estimée de l'analyse de `seconds` secondes de média par un processus ffmpeg"""
+    return ANALYSIS_PROCESS_OVERHEAD_SECONDS + seconds * seconds_per_media_second(probe)
+
+
+def analysis_plan(strategy, windows, parallel, estimated_seconds):
+    return {
+        'strategy': strategy,
+        'windows': windows,
+        'parallel': parallel,
+        'threads': ffmpeg_threads(parallel),
+        'estimated_s': round(estimated_seconds, 3),
+    }
+
+
+def plan_analysis(probe, budget_seconds):
+    """
+    Choisit la stratégie d'analyse avant de lancer ffmpeg :
+    - full : un processus sur tout le fichier (mesures exactes)
+    - segmented : segments contigus analysés en parallèle (couverture complète)
+    - sampled : fenêtres réparties sur la durée, dimensionnées pour tenir dans le budget
+    Les fenêtres sont des couples (début, durée) en secondes
+    """
+    duration = probe['duration']
+    full_cost = estimate_window_seconds(probe, duration)
+    if budget_seconds is None:
+        return analysis_plan(STRATEGY_FULL, [(0.0, duration)], 1, full_cost)
+
+    target = budget_seconds * ANALYSIS_BUDGET_USAGE
+    if full_cost <= target:
+        return analysis_plan(STRATEGY_FULL, [(0.0, duration)], 1, full_cost)
+
+    max_parallel = ANALYSIS_MAX_PARALLEL or available_cpus()
+    parallel = max(1, min(max_parallel, int(duration // ANALYSIS_MIN_SEGMENT_SECONDS)))
+    if parallel > 1:
+        segment = duration / parallel
+        segmented_cost = estimate_window_seconds(probe, segment)
+        if segmented_cost <= target:
+            windows = [(i * segment, segment) for i in range(parallel)]
+            return analysis_plan(STRATEGY_SEGMENTED, windows, parallel, segmented_cost)
+
+    # Échantillonnage : fenêtres centrées dans des strates régulières, traitées par
+    # vagues de `parallel` processus, chaque vague tenant dans sa part du budget
+    count = math.ceil(max(ANALYSIS_SAMPLE_WINDOWS, parallel) / parallel) * parallel
+    waves = count // parallel
+    stride = duration / count
+    window = (target / waves - ANALYSIS_PROCESS_OVERHEAD_SECONDS) / seconds_per_media_second(probe)
+    window = min(stride, max(ANALYSIS_MIN_WINDOW_SECONDS, window))
+    windows = [(i * stride + (stride - window) / 2, window) for i in range(count)]
+    return analysis_plan(STRATEGY_SAMPLED, windows, parallel, waves * estimate_window_seconds(probe, window))
+
+
+def stratified_windows(duration, count, window, seed):
+    """Une fenêtre par strate de durée égale, à une position aléatoire (reproductible) dans la strate"""
+    rng = random.Random(seed)
+    stride = duration / count
+    return [(i * stride + rng.uniform(0, stride - window), window) for i in range(count)]
+
+
+def plan_approximate(probe, budget_seconds):
+    """
+    Profil approximatif : APPROXIMATE_WINDOWS fenêtres stratifiées de
+    APPROXIMATE_WINDOW_SECONDS (raccourcies si le budget ne suffit pas)
+    Les fichiers courts, pour lesquels l'échantillonnage n'économiserait presque rien,
+    suivent le plan normal
+    """
+    duration = probe['duration']
+    count = APPROXIMATE_WINDOWS
+    window = APPROXIMATE_WINDOW_SECONDS
+    if count * window * 2 >= duration:
+        return plan_analysis(probe, budget_seconds)
+
+    parallel = max(1, min(ANALYSIS_MAX_PARALLEL or available_cpus(), count))
+    waves = math.ceil(count / parallel)
+    if budget_seconds is not None:
+        fitted = (budget_seconds * ANALYSIS_BUDGET_USAGE / waves - ANALYSIS_PROCESS_OVERHEAD_SECONDS) / seconds_per_media_second(probe)
+        window = max(ANALYSIS_MIN_WINDOW_SECONDS, min(window, fitted))
+    # Graine dérivée du fichier : un même fichier est échantillonné aux mêmes positions
+    windows = stratified_windows(duration, count, window, f"{duration}:{probe.get('size')}")
+    return analysis_plan(STRATEGY_APPROXIMATE, windows, parallel, waves * estimate_window_seconds(probe, window))
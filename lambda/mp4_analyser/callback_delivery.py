@@ -0,0 +1,336 @@
+import gzip
+import json
+import logging
+import os
+import random
+import time
+import urllib.parse
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from analysis_budget import deadline_from_context, remaining_seconds
+from instrumentation import current
+
+# Configuration du logging
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Timeouts HTTP du callback (secondes)
+CALLBACK_CONNECT_TIMEOUT = float(os.environ.get('CALLBACK_CONNECT_TIMEOUT', '3'))
+CALLBACK_READ_TIMEOUT = float(os.environ.get('CALLBACK_READ_TIMEOUT', '10'))
+
+# Retries avec backoff exponentiel et jitter complet
+CALLBACK_MAX_ATTEMPTS = int(os.environ.get('CALLBACK_MAX_ATTEMPTS', '4'))
+CALLBACK_BACKOFF_BASE = float(os.environ.get('CALLBACK_BACKOFF_BASE', '0.5'))
+CALLBACK_BACKOFF_MAX = float(os.environ.get('CALLBACK_BACKOFF_MAX', '8'))
+
+# Échéance de livraison : temps restant de la Lambda moins la réserve de la mise en
+# file de reprise (SQS, dépôt S3) ; sous CALLBACK_MIN_ATTEMPT_SECONDS restantes, plus
+# de nouvel essai HTTP, le callback part directement en reprise
+CALLBACK_SPILL_RESERVE_MS = int(os.environ.get('CALLBACK_SPILL_RESERVE_MS', '5000'))
+CALLBACK_MIN_ATTEMPT_SECONDS = 0.5
+# Timeouts des appels AWS de la mise en reprise, bornés par la réserve
+AWS_CONNECT_TIMEOUT = 1
+AWS_READ_TIMEOUT = 3
+
+# Compression gzip des bodies à partir de cette taille (0 = jamais)
+CALLBACK_GZIP_MIN_BYTES = int(os.environ.get('CALLBACK_GZIP_MIN_BYTES', '65536'))
+
+# File SQS de reprise quand le destinataire est indisponible
+CALLBACK_RETRY_QUEUE_URL = os.environ.get('CALLBACK_RETRY_QUEUE_URL')
+# Un message SQS est limité à 256 Ko : au-delà, le callback est déposé dans le bucket
+# des résultats (préfixe dédié) et le message ne transporte que son pointeur
+SQS_MAX_MESSAGE_BYTES = 262144
+RESULTS_BUCKET_NAME = os.environ.get('RESULTS_BUCKET_NAME')
+CALLBACK_RETRY_PREFIX = 'callback-retry/'
+
+# Codes HTTP pour lesquels un nouvel essai a du sens
+RETRYABLE_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+# Statuts de livraison retournés par deliver_callback
+DELIVERED = 'delivered'
+QUEUED = 'queued'
+REJECTED = 'rejected'
+FAILED = 'failed'
+
+# Clients partagés entre les invocations d'un même conteneur
+_session = None
+_sqs_client = None
+_s3_client = None
+
+
+class CallbackDeliveryError(Exception):
+    """Échec d'envoi d'un callback après tous les essais"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def get_session():
+    """Session HTTP avec pool de connexions keep-alive réutilisée entre invocations"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        # Les retries sont gérés par post_with_retries (backoff + jitter)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def aws_client_config():
+    """Timeouts courts et un seul nouvel essai : la mise en reprise tient dans CALLBACK_SPILL_RESERVE_MS"""
+    from botocore.config import Config
+    return Config(
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={'mode': 'standard', 'max_attempts': 2}
+    )
+
+
+def delivery_deadline(context):
+    """Échéance des essais HTTP d'un callback (horloge time.monotonic), None sans contexte Lambda"""
+    return deadline_from_context(context, CALLBACK_SPILL_RESERVE_MS)
+
+
+def get_sqs_client():
+    """Client SQS créé au premier usage puis réutilisé"""
+    global _sqs_client
+    if _sqs_client is None:
+        # Import différé : boto3 n'est chargé que pour la file de reprise
+        import boto3
+        _sqs_client = boto3.client('sqs', config=aws_client_config())
+    return _sqs_client
+
+
+def get_s3_client():
+    """Client S3 créé au premier usage puis réutilisé"""
+    global _s3_client
+    if _s3_client is None:
+        # Import différé : boto3 n'est chargé que pour un callback en reprise volumineux
+        import boto3
+        _s3_client = boto3.client('s3', config=aws_client_config())
+    return _s3_client
+
+
+def store_retry_payload(task_id, callback_data):
+    """Dépose le callback compressé dans S3 et retourne son pointeur s3://"""
+    key = f"{CALLBACK_RETRY_PREFIX}{task_id}/{uuid.uuid4().hex}.json.gz"
+    payload = json.dumps(callback_data, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    get_s3_client().put_object(
+        Bucket=RESULTS_BUCKET_NAME,
+        Key=key,
+        Body=gzip.compress(payload),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+    return f"s3://{RESULTS_BUCKET_NAME}/{key}"
+
+
+def load_retry_payload(ref):
+    """Relit un callback déposé dans S3 par store_retry_payload"""
+    bucket, _, key = ref[len('s3://'):].partition('/')
+    response = get_s3_client().get_object(Bucket=bucket, Key=key)
+    return json.loads(gzip.decompress(response['Body'].read()))
+
+
+def delete_retry_payload(ref):
+    """Supprime un callback déposé dans S3 une fois livré ou abandonné"""
+    bucket, _, key = ref[len('s3://'):].partition('/')
+    try:
+        get_s3_client().delete_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        # Le cycle de vie du bucket finira par le supprimer
+        logger.warning(f"Suppression du callback en reprise {ref} impossible: {str(e)}")
+
+
+def build_callback_url(callback_url, query_params=None):
+    """Ajoute les query parameters à l'URL de callback s'ils existent"""
+    full_callback_url = callback_url.rstrip('/')
+    if query_params and isinstance(query_params, dict):
+        query_string = urllib.parse.urlencode(query_params)
+        separator = '&' if '?' in full_callback_url else '?'
+        full_callback_url = f"{full_callback_url}{separator}{query_string}"
+    return full_callback_url
+
+
+def encode_body(callback_data):
+    """Sérialise le callback en JSON compact, compressé en gzip au-delà du seuil"""
+    body = json.dumps(callback_data, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if CALLBACK_GZIP_MIN_BYTES > 0 and len(body) >= CALLBACK_GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+def parse_retry_after(response):
+    """Lit le header Retry-After (en secondes) s'il est présent"""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is None:
+        return None
+    try:
+        return min(float(retry_after), CALLBACK_BACKOFF_MAX)
+    except ValueError:
+        return None
+
+
+def post_with_retries(method, url, body, headers, max_attempts=CALLBACK_MAX_ATTEMPTS, deadline=None):
+    """
+    Envoie la requête avec des timeouts de connexion/lecture et des retries
+    (backoff exponentiel avec jitter complet, Retry-After respecté)
+    Avec une échéance (time.monotonic), timeouts et attentes sont bornés par le
+    temps restant et les essais s'arrêtent avant de la dépasser
+    """
+    error = None
+    for attempt in range(1, max_attempts + 1):
+        budget = remaining_seconds(deadline)
+        if budget is not None and budget < CALLBACK_MIN_ATTEMPT_SECONDS:
+            error = f"{error or 'Aucun essai'} - échéance atteinte après {attempt - 1} essai(s)"
+            break
+        connect_timeout, read_timeout = CALLBACK_CONNECT_TIMEOUT, CALLBACK_READ_TIMEOUT
+        if budget is not None:
+            connect_timeout = min(connect_timeout, budget / 2)
+            read_timeout = min(read_timeout, budget - connect_timeout)
+        retry_after = None
+        try:
+            response = get_session().request(
+                method,
+                url,
+                data=body,
+                headers=headers,
+                timeout=(connect_timeout, read_timeout),
+                allow_redirects=True
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = f"Erreur réseau: {str(e)}"
+        else:
+            if response.status_code < 400:
+                return response
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                raise CallbackDeliveryError(f"Callback refusé (status: {response.status_code})", retryable=False)
+            error = f"Destinataire indisponible (status: {response.status_code})"
+            retry_after = parse_retry_after(response)
+
+        if attempt < max_attempts:
+            delay = retry_after
+            if delay is None:
+                delay = random.uniform(0, min(CALLBACK_BACKOFF_MAX, CALLBACK_BACKOFF_BASE * 2 ** (attempt - 1)))
+            budget = remaining_seconds(deadline)
+            if budget is not None and delay > budget - CALLBACK_MIN_ATTEMPT_SECONDS:
+                error = f"{error} - échéance atteinte après {attempt} essai(s)"
+                break
+            logger.warning(f"Callback {method} essai {attempt}/{max_attempts} échoué: {error} - nouvel essai dans {delay:.2f}s")
+            time.sleep(delay)
+
+    raise CallbackDeliveryError(error)
+
+
+def spill_to_retry_queue(full_callback_url, method, task_id, callback_data, extra_headers=None):
+    """
+    Met le callback en file de reprise ; retourne False si aucune file n'est disponible
+    Un message dépassant la limite SQS transporte un pointeur S3 (callback_data_ref)
+    """
+    if not CALLBACK_RETRY_QUEUE_URL:
+        return False
+    message = {
+        'callback_url': full_callback_url,
+        'method': method,
+        'task_id': task_id,
+        'callback_data': callback_data,
+        'headers': extra_headers or {}
+    }
+    try:
+        message_body = json.dumps(message, ensure_ascii=False, separators=(',', ':'), default=str)
+        if len(message_body.encode('utf-8')) > SQS_MAX_MESSAGE_BYTES:
+            if not RESULTS_BUCKET_NAME:
+                logger.error(f"Callback de {task_id} trop volumineux pour la file de reprise ({len(message_body)} caractères) et aucun bucket configuré")
+                return False
+            del message['callback_data']
+            message['callback_data_ref'] = store_retry_payload(task_id, callback_data)
+            message_body = json.dumps(message, ensure_ascii=False, separators=(',', ':'), default=str)
+            logger.info(f"Callback de {task_id} déposé dans S3 pour la reprise: {message['callback_data_ref']}")
+        get_sqs_client().send_message(
+            QueueUrl=CALLBACK_RETRY_QUEUE_URL,
+            MessageBody=message_body
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Impossible de mettre le callback en file de reprise pour {task_id}: {str(e)}")
+        return False
+
+
+def deliver_callback(callback_url, task_id, callback_data, method='POST', query_params=None, extra_headers=None, deadline=None):
+    """
+    Livre un callback sans jamais lever d'exception : l'analyse n'est pas
+    considérée comme échouée si le destinataire est indisponible.
+    extra_headers (contexte de trace...) est conservé en cas de mise en file de reprise.
+    deadline (voir delivery_deadline) borne les essais HTTP pour laisser le temps de la mise en reprise.
+    Retourne DELIVERED, QUEUED (file de reprise), REJECTED (4xx) ou FAILED.
+    """
+    method = method.upper()
+    full_callback_url = build_callback_url(callback_url, query_params)
+    body, headers = encode_body(callback_data)
+    headers.update(extra_headers or {})
+    current().add('callback_bytes', len(body))
+
+    try:
+        response = post_with_retries(method, full_callback_url, body, headers, deadline=deadline)
+        logger.info(f"Callback {method} envoyé avec succès pour {task_id} (status: {response.status_code})")
+        return DELIVERED
+    except CallbackDeliveryError as e:
+        if not e.retryable:
+            logger.error(f"Callback {method} refusé pour {task_id}: {str(e)}")
+            return REJECTED
+        logger.error(f"Callback {method} non délivré pour {task_id}: {str(e)}")
+
+    if spill_to_retry_queue(full_callback_url, method, task_id, callback_data, extra_headers):
+        logger.info(f"Callback {method} mis en file de reprise pour {task_id}")
+        return QUEUED
+    return FAILED
+
+
+def retry_handler(event, context):
+    """
+    Handler SQS de reprise des callbacks non délivrés.
+    Un seul essai par message : les échecs sont renvoyés via batchItemFailures
+    et retentés après le délai de visibilité de la file ; les messages que le temps
+    restant de la Lambda ne permet plus de traiter le sont aussi.
+    """
+    deadline = delivery_deadline(context)
+    failures = []
+    for record in event.get('Records', []):
+        budget = remaining_seconds(deadline)
+        if budget is not None and budget < CALLBACK_MIN_ATTEMPT_SECONDS:
+            logger.warning(f"Temps restant insuffisant, message {record.get('messageId')} laissé en file")
+            failures.append({'itemIdentifier': record['messageId']})
+            continue
+        payload_ref = None
+        try:
+            message = json.loads(record['body'])
+            payload_ref = message.get('callback_data_ref')
+            callback_data = load_retry_payload(payload_ref) if payload_ref else message['callback_data']
+            body, headers = encode_body(callback_data)
+            headers.update(message.get('headers') or {})
+            post_with_retries(message['method'], message['callback_url'], body, headers, max_attempts=1, deadline=deadline)
+            logger.info(f"Callback repris avec succès pour {message.get('task_id')}")
+        except CallbackDeliveryError as e:
+            if e.retryable:
+                logger.warning(f"Reprise du callback échouée pour le message {record.get('messageId')}: {str(e)}")
+                failures.append({'itemIdentifier': record['messageId']})
+                continue
+            logger.error(f"Callback abandonné pour le message {record.get('messageId')}: {str(e)}")
+        except Exception as e:
+            # Lecture S3 en échec : le message est retenté (puis rejoint la DLQ avec son pointeur)
+            if payload_ref:
+                logger.warning(f"Callback en reprise {payload_ref} illisible pour le message {record.get('messageId')}: {str(e)}")
+                failures.append({'itemIdentifier': record['messageId']})
+                continue
+            logger.error(f"Message de reprise invalide {record.get('messageId')}: {str(e)}")
+        if payload_ref:
+            delete_retry_payload(payload_ref)
+
+    return {'batchItemFailures': failures}
@@ -0,0 +1,185 @@
+import json
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# Publication des métriques au format CloudWatch Embedded Metric Format (EMF)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'Mp4SmallAnalyser')
+FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'mp4_analyser')
+
+# Unités EMF des compteurs connus (Count par défaut)
+COUNTER_UNITS = {
+    'download_bytes': 'Bytes',
+    'callback_bytes': 'Bytes',
+}
+
+
+def _cpu_ms(usage):
+    """Temps CPU utilisateur + système en millisecondes"""
+    return (usage.ru_utime + usage.ru_stime) * 1000
+
+
+def _join_readers(readers, timeout):
+    """Attend la fin de lecture des sorties ; False si timeout expire avant"""
+    end = None if timeout is None else time.monotonic() + timeout
+    for reader in readers:
+        reader.join(None if end is None else max(0.0, end - time.monotonic()))
+    return not any(reader.is_alive() for reader in readers)
+
+
+def run_measured(cmd, timeout=None, stop_grace_seconds=None):
+    """
+    Exécute une commande (sorties capturées en texte) et récupère le processus avec
+    os.wait4 : le temps CPU relevé est celui de ce seul processus, même quand d'autres
+    ffmpeg tournent en parallèle (un écart de RUSAGE_CHILDREN compterait aussi ceux
+    terminés entre-temps). Au-delà de timeout, SIGTERM puis SIGKILL après stop_grace_seconds
+    Retourne (stdout, stderr, rusage, terminée avant timeout)
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    outputs = {}
+
+    def read(name, stream):
+        with stream:
+            outputs[name] = stream.read()
+
+    readers = [
+        threading.Thread(target=read, args=(name, stream), daemon=True)
+        for name, stream in (('stdout', process.stdout), ('stderr', process.stderr))
+    ]
+    for reader in readers:
+        reader.start()
+
+    # Sorties lues jusqu'à leur fermeture. Les signaux passent par os.kill : Popen.send_signal
+    # interroge le processus (poll) et pourrait le récupérer avant os.wait4 ; tant qu'il
+    # n'est pas récupéré, son pid ne peut pas avoir été réattribué
+    completed = _join_readers(readers, timeout)
+    if not completed:
+        os.kill(process.pid, signal.SIGTERM)
+        if not _join_readers(readers, stop_grace_seconds):
+            os.kill(process.pid, signal.SIGKILL)
+            _join_readers(readers, None)
+
+    # Récupération par os.wait4 plutôt que Popen.wait ; returncode renseigné pour que
+    # Popen ne tente plus d'attendre ce processus
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return outputs['stdout'], outputs['stderr'], rusage, completed
+
+
+class InvocationMetrics:
+    """
+    Mesures d'une invocation : spans chronométrés (perf_counter_ns) avec le
+    temps CPU des processus enfants (ffmpeg/ffprobe) lancés dans le span,
+    compteurs d'octets et pic mémoire
+    """
+
+    def __init__(self, task_id=None):
+        self.task_id = task_id
+        self.spans = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._start_ns = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Chronomètre un bloc ; les spans de même nom sont cumulés à l'émission"""
+        record = {'name': name, **attributes, 'child_cpu_ms': 0.0}
+        self_before = time.process_time_ns()
+        start = time.perf_counter_ns()
+        try:
+            yield record
+        finally:
+            record['duration_ms'] = (time.perf_counter_ns() - start) / 1e6
+            record['cpu_ms'] = (time.process_time_ns() - self_before) / 1e6
+            with self._lock:
+                self.spans.append(record)
+
+    def add_child_usage(self, record, rusage):
+        """Impute au span le temps CPU d'un processus enfant terminé (rusage de run_measured)"""
+        record['child_cpu_ms'] += _cpu_ms(rusage)
+
+    def add(self, name, value):
+        """Incrémente un compteur (octets transférés, nombre de processus...)"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def elapsed_ms(self):
+        """Temps écoulé depuis le début de l'invocation"""
+        return (time.perf_counter_ns() - self._start_ns) / 1e6
+
+    def span_totals(self):
+        """Durées et CPU cumulés par nom de span"""
+        totals = {}
+        with self._lock:
+            for record in self.spans:
+                total = totals.setdefault(record['name'], {'count': 0, 'duration_ms': 0.0, 'cpu_ms': 0.0, 'child_cpu_ms': 0.0})
+                total['count'] += 1
+                total['duration_ms'] += record['duration_ms']
+                total['cpu_ms'] += record['cpu_ms']
+                total['child_cpu_ms'] += record['child_cpu_ms']
+        return totals
+
+    def snapshot(self):
+        """Vue sérialisable des mesures (spans cumulés, compteurs, pic mémoire en Ko)"""
+        return {
+            'spans': {name: {k: round(v, 3) for k, v in total.items()} for name, total in self.span_totals().items()},
+            'counters': dict(self.counters),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'children_max_rss_kb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            'total_ms': round(self.elapsed_ms(), 3),
+        }
+
+    def emit(self):
+        """Écrit une ligne EMF sur stdout (CloudWatch extrait les métriques automatiquement)"""
+        if not METRICS_ENABLED:
+            return
+        snapshot = self.snapshot()
+        values = {'total_ms': snapshot['total_ms']}
+        units = {'total_ms': 'Milliseconds'}
+        for name, total in snapshot['spans'].items():
+            values[f"{name}_ms"] = total['duration_ms']
+            units[f"{name}_ms"] = 'Milliseconds'
+            if total['child_cpu_ms']:
+                values[f"{name}_child_cpu_ms"] = total['child_cpu_ms']
+                units[f"{name}_child_cpu_ms"] = 'Milliseconds'
+        for name, value in snapshot['counters'].items():
+            values[name] = value
+            units[name] = COUNTER_UNITS.get(name, 'Count')
+        values['max_rss_kb'] = snapshot['max_rss_kb']
+        values['children_max_rss_kb'] = snapshot['children_max_rss_kb']
+        units['max_rss_kb'] = units['children_max_rss_kb'] = 'Kilobytes'
+
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Function']],
+                    'Metrics': [{'Name': name, 'Unit': units[name]} for name in values],
+                }],
+            },
+            'Function': FUNCTION_NAME,
+            'task_id': self.task_id,
+            **values,
+        }, separators=(',', ':')), flush=True)
+
+
+# Mesures de l'invocation en cours (une invocation à la fois par conteneur Lambda)
+_current = InvocationMetrics()
+
+
+def start_invocation(task_id=None):
+    """Démarre un nouveau jeu de mesures pour l'invocation courante"""
+    global _current
+    _current = InvocationMetrics(task_id)
+    return _current
+
+
+def current():
+    """Mesures de l'invocation en cours"""
+    return _current
@@ -0,0 +1,332 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import current
+
+# Configuration du logging
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Timeouts HTTP du téléchargement (secondes, bornés par l'échéance de l'analyse)
+DOWNLOAD_CONNECT_TIMEOUT = float(os.environ.get('DOWNLOAD_CONNECT_TIMEOUT', '5'))
+DOWNLOAD_READ_TIMEOUT = float(os.environ.get('DOWNLOAD_READ_TIMEOUT', '30'))
+# Lecture par blocs (échéance vérifiée entre deux blocs)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Retries avec backoff exponentiel et jitter complet (Retry-After prioritaire)
+DOWNLOAD_MAX_ATTEMPTS = int(os.environ.get('DOWNLOAD_MAX_ATTEMPTS', '4'))
+DOWNLOAD_BACKOFF_BASE = float(os.environ.get('DOWNLOAD_BACKOFF_BASE', '0.5'))
+DOWNLOAD_BACKOFF_MAX = float(os.environ.get('DOWNLOAD_BACKOFF_MAX', '20'))
+
+# Pool de connexions keep-alive : hôtes gardés et connexions par hôte
+DOWNLOAD_POOL_HOSTS = int(os.environ.get('DOWNLOAD_POOL_HOSTS', '8'))
+DOWNLOAD_POOL_MAXSIZE = int(os.environ.get('DOWNLOAD_POOL_MAXSIZE', '16'))
+
+# Débit de requêtes par hôte d'origine (token bucket, par conteneur) :
+# "cdn.example.com=10:20,*.cloudfront.net=50" = 10 requêtes/s avec rafale de 20,
+# 50 requêtes/s pour tous les sous-domaines ; DOWNLOAD_DEFAULT_RATE pour les autres (0 = illimité)
+DOWNLOAD_RATE_LIMITS = os.environ.get('DOWNLOAD_RATE_LIMITS', '')
+DOWNLOAD_DEFAULT_RATE = os.environ.get('DOWNLOAD_DEFAULT_RATE', '0')
+
+# Entrées s3://bucket/clé : lectures par plages (GetObject Range) en parallèle,
+# écrites à leur position dans le fichier local (AWS_ENDPOINT_URL_S3 permet de
+# cibler un stockage compatible S3 en local)
+S3_DOWNLOAD_PART_SIZE = int(os.environ.get('S3_DOWNLOAD_PART_MB', '8')) * 1024 * 1024
+S3_DOWNLOAD_CONCURRENCY = int(os.environ.get('S3_DOWNLOAD_CONCURRENCY', '8'))
+# Validité de l'URL présignée passée à ffprobe (sondage de l'en-tête sans téléchargement)
+S3_PROBE_URL_EXPIRES_SECONDS = int(os.environ.get('S3_PROBE_URL_EXPIRES_SECONDS', '900'))
+
+# Codes HTTP pour lesquels un nouvel essai a du sens
+RETRYABLE_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+# Session, client S3 et limiteurs partagés entre les invocations d'un même conteneur
+_session = None
+_s3_client = None
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Limiteur de débit d'un hôte : `rate` requêtes par seconde, rafale de `burst` ;
+    pause() suspend l'hôte (429 / Retry-After) pour tous les threads du conteneur
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Réserve un jeton ; retourne l'attente (s) avant de pouvoir l'utiliser"""
+        with self.lock:
+            now = time.monotonic()
+            if self.rate:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, self.paused_until - now)
+            if self.rate:
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def parse_rate(spec):
+    """Limite "requêtes/s[:rafale]" en (débit, rafale), rafale = débit par défaut ; débit 0 = illimité"""
+    rate, _, burst = spec.partition(':')
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+def parse_rate_limits(value):
+    """Limites par hôte de DOWNLOAD_RATE_LIMITS ; les entrées invalides sont ignorées"""
+    limits = {}
+    for entry in filter(None, (item.strip() for item in value.split(','))):
+        host, _, spec = entry.partition('=')
+        try:
+            limits[host.strip().lower()] = parse_rate(spec)
+        except ValueError:
+            logger.warning(f"Limite de débit ignorée (format hôte=requêtes/s[:rafale]): {entry}")
+    return limits
+
+
+RATE_LIMITS = parse_rate_limits(DOWNLOAD_RATE_LIMITS)
+try:
+    DEFAULT_RATE = parse_rate(DOWNLOAD_DEFAULT_RATE)
+except ValueError:
+    DEFAULT_RATE = (0.0, 1.0)
+
+
+def host_rate(host):
+    """Limite d'un hôte : entrée exacte, puis joker '*.domaine' le plus précis, puis défaut"""
+    if host in RATE_LIMITS:
+        return RATE_LIMITS[host]
+    labels = host.split('.')
+    for index in range(1, len(labels)):
+        wildcard = '*.' + '.'.join(labels[index:])
+        if wildcard in RATE_LIMITS:
+            return RATE_LIMITS[wildcard]
+    return DEFAULT_RATE
+
+
+def get_bucket(host):
+    """Limiteur de l'hôte, créé au premier téléchargement puis conservé"""
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(*host_rate(host))
+        return bucket
+
+
+def get_session():
+    """Session HTTP avec pool de connexions keep-alive réutilisée entre invocations"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        # Les retries sont gérés par download_to_file (backoff, jitter, Retry-After)
+        adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_HOSTS, pool_maxsize=DOWNLOAD_POOL_MAXSIZE, max_retries=0)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def get_s3_client():
+    """Client S3 avec un pool de connexions dimensionné pour les lectures parallèles"""
+    global _s3_client
+    if _s3_client is None:
+        # Import différé : boto3 n'est chargé que pour les entrées s3://
+        import boto3
+        from botocore.config import Config
+        _s3_client = boto3.client('s3', config=Config(
+            max_pool_connections=max(10, S3_DOWNLOAD_CONCURRENCY),
+            connect_timeout=DOWNLOAD_CONNECT_TIMEOUT,
+            read_timeout=DOWNLOAD_READ_TIMEOUT,
+            signature_version='s3v4',
+            retries={'mode': 'standard', 'max_attempts': DOWNLOAD_MAX_ATTEMPTS}
+        ))
+    return _s3_client
+
+
+def is_s3_url(url):
+    return url.startswith('s3://')
+
+
+def parse_s3_url(url):
+    """
+    (bucket, clé) d'une URL s3:// ; la clé est prise telle quelle, comme dans la CLI
+    AWS (ni décodage %, ni coupure sur ? ou #) ; ValueError si l'un des deux manque
+    """
+    bucket, _, key = url[len('s3://'):].partition('/')
+    if not bucket or not key:
+        raise ValueError(f"URL S3 invalide (format s3://bucket/clé): {url}")
+    return bucket, key
+
+
+def probe_url(url):
+    """URL lisible par ffprobe : URL présignée (signée localement) pour s3://, sinon l'URL elle-même"""
+    if not is_s3_url(url):
+        return url
+    bucket, key = parse_s3_url(url)
+    return get_s3_client().generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket, 'Key': key},
+        ExpiresIn=S3_PROBE_URL_EXPIRES_SECONDS
+    )
+
+
+def read_s3_range(bucket, key, fd, start, end, deadline, etag=None):
+    """
+    Lit les octets [start, end] de l'objet et les écrit à la même position du fichier
+    Avec etag, la lecture échoue si l'objet a changé depuis la première plage
+    Retourne la réponse GetObject (taille totale dans ContentRange, ETag)
+    """
+    params = {'Bucket': bucket, 'Key': key, 'Range': f"bytes={start}-{end}"}
+    if etag:
+        params['IfMatch'] = etag
+    response = get_s3_client().get_object(**params)
+    offset = start
+    for chunk in response['Body'].iter_chunks(DOWNLOAD_CHUNK_SIZE):
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError("Délai dépassé pendant le téléchargement du fichier")
+    return response
+
+
+def download_s3_to_file(url, file, deadline=None):
+    """
+    Télécharge un objet s3:// dans `file` : la première plage donne la taille et
+    l'ETag de l'objet, les plages suivantes sont lues en parallèle (nouveaux essais
+    gérés par le client). Retourne le nombre d'octets écrits
+    """
+    from botocore.exceptions import ClientError
+
+    bucket, key = parse_s3_url(url)
+    file.seek(0)
+    file.truncate()
+    fd = file.fileno()
+    try:
+        first = read_s3_range(bucket, key, fd, 0, S3_DOWNLOAD_PART_SIZE - 1, deadline)
+        size = int(first['ContentRange'].rpartition('/')[2])
+        ranges = [(start, min(start + S3_DOWNLOAD_PART_SIZE, size) - 1) for start in range(S3_DOWNLOAD_PART_SIZE, size, S3_DOWNLOAD_PART_SIZE)]
+        if ranges:
+            with ThreadPoolExecutor(max_workers=min(S3_DOWNLOAD_CONCURRENCY, len(ranges))) as executor:
+                parts = [executor.submit(read_s3_range, bucket, key, fd, start, end, deadline, first['ETag']) for start, end in ranges]
+                for part in parts:
+                    part.result()
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        raise ValueError(f"Lecture S3 refusée pour {url} ({code})")
+    current().add('download_s3_parts', 1 + len(ranges))
+    return size
+
+
+def parse_retry_after(response):
+    """Header Retry-After en secondes (délai ou date HTTP), None s'il est absent ou invalide"""
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def wait_for(seconds, deadline, reason):
+    """Attend `seconds` secondes, TimeoutError si l'attente dépasse l'échéance"""
+    if seconds <= 0:
+        return
+    if deadline is not None and time.monotonic() + seconds >= deadline:
+        raise TimeoutError(f"Délai dépassé pendant le téléchargement du fichier ({reason})")
+    time.sleep(seconds)
+
+
+def request_timeout(deadline):
+    """Timeouts (connexion, lecture) bornés par le temps restant avant l'échéance"""
+    if deadline is None:
+        return DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT
+    remaining = max(0.001, deadline - time.monotonic())
+    return min(DOWNLOAD_CONNECT_TIMEOUT, remaining), min(DOWNLOAD_READ_TIMEOUT, remaining)
+
+
+def stream_to_file(response, file, deadline):
+    """Écrit le corps de la réponse par blocs ; retourne le nombre d'octets écrits"""
+    written = 0
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        file.write(chunk)
+        written += len(chunk)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError("Délai dépassé pendant le téléchargement du fichier")
+    return written
+
+
+def download_to_file(url, file, deadline=None, max_attempts=DOWNLOAD_MAX_ATTEMPTS):
+    """
+    Télécharge `url` dans `file` (ouvert en écriture binaire) via la session
+    partagée, sous la limite de débit de l'hôte d'origine
+    Les 429 / 5xx et erreurs réseau sont retentés (Retry-After respecté, sinon
+    backoff exponentiel avec jitter) ; un 429 suspend l'hôte pour les autres
+    téléchargements du conteneur. Les URLs s3:// sont lues directement dans le
+    bucket (voir download_s3_to_file). Retourne le nombre d'octets écrits
+    """
+    if is_s3_url(url):
+        return download_s3_to_file(url, file, deadline)
+    metrics = current()
+    host = (urllib.parse.urlsplit(url).hostname or '').lower()
+    bucket = get_bucket(host)
+    error = None
+    for attempt in range(1, max_attempts + 1):
+        throttle = bucket.reserve()
+        if throttle > 0:
+            metrics.add('download_throttle_ms', round(throttle * 1000, 3))
+        wait_for(throttle, deadline, f"limite de débit de {host}")
+
+        retry_after = None
+        try:
+            with get_session().get(url, stream=True, timeout=request_timeout(deadline)) as response:
+                if response.status_code < 400:
+                    file.seek(0)
+                    file.truncate()
+                    return stream_to_file(response, file, deadline)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise ValueError(f"Téléchargement refusé (status: {response.status_code})")
+                error = f"Origine indisponible (status: {response.status_code})"
+                retry_after = parse_retry_after(response)
+                if response.status_code == 429:
+                    metrics.add('download_429', 1)
+                    pause = retry_after if retry_after is not None else DOWNLOAD_BACKOFF_BASE * 2 ** (attempt - 1)
+                    bucket.pause(min(pause, DOWNLOAD_BACKOFF_MAX))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            error = f"Erreur réseau: {str(e)}"
+
+        if attempt < max_attempts:
+            delay = retry_after
+            if delay is None:
+                delay = random.uniform(0, min(DOWNLOAD_BACKOFF_MAX, DOWNLOAD_BACKOFF_BASE * 2 ** (attempt - 1)))
+            delay = min(delay, DOWNLOAD_BACKOFF_MAX)
+            logger.warning(f"Téléchargement essai {attempt}/{max_attempts} échoué: {error} - nouvel essai dans {delay:.2f}s")
+            metrics.add('download_retries', 1)
+            wait_for(delay, deadline, error)
+
+    raise ConnectionError(f"Téléchargement impossible après {max_attempts} essais: {error}")
@@ -1,25 +1,72 @@
 import json
-import boto3
+import math
 import os
-import subprocess
 import tempfile
-import urllib.request
 import logging
 import uuid
 import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import requests
+from analysis_budget import (
+    AUDIO_METRICS, DECODE_METRICS, SAMPLING_STRATEGIES, STRATEGY_APPROXIMATE, STRATEGY_FULL, STRATEGY_PROBE,
+    deadline_from_context, plan_analysis, plan_approximate, remaining_seconds
+)
+from analysis_options import (
+    DEFAULT_METRICS, METRIC_LOUDNESS, METRIC_SILENCE, METRIC_VIDEO, METRICS, PROFILE_APPROXIMATE, PROFILE_FULL,
+    parse_metrics, parse_profile, parse_timeline_option
+)
+from callback_delivery import build_callback_url, deliver_callback, delivery_deadline
+from result_offload import offload_results, should_offload
+from instrumentation import current, run_measured, start_invocation
+from internal_contract import internal_response, is_internal_event
+from media_download import download_to_file, probe_url
+from trace_context import SENT_AT_HEADER, TRACEPARENT_HEADER, TraceSpan, emit_span, new_span_id, parse_traceparent
+from structured_log import current_log, is_debug_requested, start_log
+from timeline import build_timeline, merge_intervals, parse_loudness_timeline
 
-# Configuration du logging
+# Configuration du logging (les logs de debug passent par structured_log,
+# échantillonnés par tâche via DEBUG_SAMPLE_RATE ou forcés par l'en-tête X-Debug)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-# Configuration debug
-DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
+# Chemins vers les binaires ffmpeg (depuis notre Layer Lambda, surchargeables en local)
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH', '/opt/bin/ffmpeg')
+FFPROBE_PATH = os.environ.get('FFPROBE_PATH', '/opt/bin/ffprobe')
 
-# Chemins vers les binaires ffmpeg (depuis notre Layer Lambda)
-FFMPEG_PATH = '/opt/bin/ffmpeg'
-FFPROBE_PATH = '/opt/bin/ffprobe'
+# Délai laissé à ffmpeg pour s'arrêter proprement après SIGTERM
+FFMPEG_STOP_GRACE_SECONDS = 2
+# Filtre ffmpeg de chaque métrique décodée, et clés de résultat de chaque métrique
+# (silencedetect journalise sans nom d'instance : ses événements sont relus via
+# ametadata, dont les lignes portent le préfixe [Parsed_ametadata_N] de la piste)
+WINDOW_FILTERS = {
+    METRIC_LOUDNESS: ["ebur128=peak=true"],
+    METRIC_SILENCE: ["silencedetect=n=-50dB:d=0.5", "ametadata=mode=print"],
+}
+# Filtre dont les logs portent les mesures de chaque métrique
+METRIC_LOG_FILTERS = {
+    METRIC_LOUDNESS: "ebur128",
+    METRIC_SILENCE: "ametadata",
+}
+# Préfixe des logs d'un filtre d'un graphe ffmpeg : [Parsed_<filtre>_<indice> @ 0x...]
+FILTER_LOG_PREFIX_RE = re.compile(r"^\[Parsed_(\w+_\d+) @ [^\]]*\] ?")
+RESULT_KEYS = {
+    METRIC_LOUDNESS: ("loudnessMeasured", "loudnessTruePeak"),
+    METRIC_SILENCE: ("silencePercentage",),
+}
+# Contrôle vidéo (métrique 'video') dans la même passe que l'audio : images réduites
+# à VIDEO_QC_WIDTH pixels de large avant blackdetect et freezedetect ; en mode
+# 'keyframes' seules les images clés sont décodées (-skip_frame nokey), 'all' décode tout
+VIDEO_QC_DECODE = os.environ.get('VIDEO_QC_DECODE', 'keyframes')
+VIDEO_QC_WIDTH = int(os.environ.get('VIDEO_QC_WIDTH', '160'))
+VIDEO_FILTERS = [f"scale={VIDEO_QC_WIDTH}:-2", "blackdetect=d=0.5:pix_th=0.10", "freezedetect=n=-60dB:d=2"]
+# Mode asynchrone : callback 'processing' au début de l'analyse (tâches en cours
+# visibles dans l'index des statuts de l'API de callback)
+PROCESSING_CALLBACK_ENABLED = os.environ.get('PROCESSING_CALLBACK_ENABLED', 'false').lower() == 'true'
+# Intervalles de confiance des mesures extrapolées d'un échantillon de fenêtres (95 %)
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = 1.96
 
 def json_response(data, status_code=200):
     """Utilitaire pour créer des réponses JSON avec caractères accentués lisibles"""
@@ -35,13 +82,67 @@ def json_response(data, status_code=200):
 def lambda_handler(event, context):
     """
     Handler principal pour l'analyse MP4
+    Les mesures de l'invocation sont émises au format EMF à la fin de chaque appel,
+    le span de trace 'analyser.invocation' est rattaché à la trace du dispatcher
     """
+    metrics = start_invocation()
+    trace_span = TraceSpan('analyser.invocation')
+    start_log()
     try:
-        # Parser le body de la requête
-        if event.get('body'):
+        return handle_analysis_request(event, context, trace_span)
+    finally:
+        trace_span.end()
+        metrics.emit()
+        current_log().close()
+
+
+def adopt_trace_context(event, request_data, trace_span):
+    """
+    Rattache le span d'invocation à la trace reçue (champ 'trace' de la payload
+    du dispatcher ou en-tête traceparent) et émet le span d'attente 'lambda.queue'
+    entre l'invocation par le dispatcher et le démarrage du handler
+    """
+    trace = request_data.get('trace') or {}
+    trace_id = trace.get('trace_id')
+    parent_span_id = trace.get('parent_span_id')
+    if not trace_id:
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        trace_id, parent_span_id = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+    trace_span.set_parent(trace_id, parent_span_id)
+
+    dispatched_at_ns = trace.get('dispatched_at_ns')
+    if trace_id and dispatched_at_ns:
+        queue_delay_ms = (trace_span.start_ns - int(dispatched_at_ns)) / 1e6
+        trace_span.attributes['queue_delay_ms'] = round(queue_delay_ms, 3)
+        emit_span('lambda.queue', trace_id, new_span_id(), parent_span_id, int(dispatched_at_ns), trace_span.start_ns, {'queue_delay_ms': round(queue_delay_ms, 3)})
+
+
+def callback_trace_headers(callback_span):
+    """En-têtes de trace du callback : span parent et horodatage d'envoi"""
+    return {
+        TRACEPARENT_HEADER: callback_span.traceparent(),
+        SENT_AT_HEADER: str(time.time_ns()),
+    }
+
+
+def handle_analysis_request(event, context, trace_span):
+    """
+    Traite une demande d'analyse (mode synchrone ou asynchrone)
+    Invocation interne du dispatcher : tâche et réponse en objets JSON (contrat
+    interne, une seule sérialisation) ; appel externe : format API Gateway
+    """
+    internal = is_internal_event(event)
+    respond = internal_response if internal else json_response
+    try:
+        # Parser la tâche (contrat interne) ou le body de la requête
+        if internal:
+            request_data = event.get('task') or {}
+        elif event.get('body'):
             request_data = json.loads(event['body'])
         else:
-            return json_response({'error': 'Body de requête manquant'}, 400)
+            return respond({'error': 'Body de requête manquant'}, 400)
+        
+        adopt_trace_context(event, request_data, trace_span)
         
         # Récupérer les query parameters
         query_params = request_data.get('query_params', {})
@@ -55,16 +156,7 @@ def lambda_handler(event, context):
         callback_url = request_data.get('callback_url')
         
         if not file_url:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'file_url est requis'
-                }),
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                }
-            }
+            return respond({'error': 'file_url est requis'}, 400)
         
         # callback_url est optionnel (mode synchrone vs asynchrone)
         
@@ -72,37 +164,65 @@ def lambda_handler(event, context):
         task_id = request_data.get('task_id')
         if not task_id or not task_id.strip():
             task_id = str(uuid.uuid4())
+        # Batch du dispatcher (regroupement des résultats côté callback)
+        batch_id = request_data.get('batch_id')
+        
+        # Profil d'analyse : complet (défaut) ou approximatif (fenêtres échantillonnées),
+        # métriques demandées (toutes par défaut) : seul le travail ffmpeg nécessaire est lancé
+        try:
+            profile = parse_profile(request_data.get('profile'))
+            requested_metrics = parse_metrics(request_data.get('metrics'))
+            # Timelines optionnelles : true ou résolution en secondes
+            timeline_resolution = parse_timeline_option(request_data.get('timeline'))
+        except ValueError as e:
+            return respond({'error': str(e)}, 400)
         
         # Récupérer la méthode HTTP pour le callback (POST par défaut)
         callback_method = request_data.get('method', 'POST').upper()
         if callback_method not in ['POST', 'PUT']:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({
-                    'error': 'La méthode doit être POST ou PUT'
-                }),
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                }
-            }
+            return respond({'error': 'La méthode doit être POST ou PUT'}, 400)
         
         # Analyser le fichier MP4
         logger.info(f"Début de l'analyse pour task_id: {task_id}, URL: {file_url}")
-        start_time = datetime.now()
+        current().task_id = task_id
+        trace_span.attributes['task_id'] = task_id
+        # Debug forcé par le dispatcher (en-tête X-Debug) ou tâche échantillonnée
+        log = start_log(task_id, bool(request_data.get('debug')) or is_debug_requested(event.get('headers')))
         
-        analysis_result = analyze_mp4_from_url(file_url)
+        if callback_url and PROCESSING_CALLBACK_ENABLED:
+            processing_callback = {
+                'status': 'processing',
+                'task_id': task_id,
+                'metadata': {
+                    'task_id': task_id,
+                    'source_url': file_url,
+                    'processor': 'mp4_small_analyser',
+                    'started_at': datetime.now().isoformat()
+                }
+            }
+            if batch_id:
+                processing_callback['batch_id'] = batch_id
+                processing_callback['metadata']['batch_id'] = batch_id
+            with trace_span.child('analyser.callback', task_id=task_id, status='processing') as callback_trace:
+                send_callback(callback_url, task_id, processing_callback, callback_method, query_params, callback_trace_headers(callback_trace), delivery_deadline(context))
+        
+        # Échéance : temps restant de la Lambda moins la marge réservée au callback
+        with trace_span.child('analyser.analysis', task_id=task_id) as analysis_trace:
+            analysis_result = analyze_mp4_from_url(file_url, deadline_from_context(context), profile, requested_metrics, timeline_resolution)
+            analysis_trace.attributes['strategy'] = analysis_result['analysisStrategy']
+            analysis_trace.attributes['coverage'] = analysis_result['coverage']
         
-        # Debug : logger le résultat de l'analyse dans CloudWatch
-        if DEBUG:
-            logger.info(f"[DEBUG] Résultat de l'analyse pour task_id {task_id}: {json.dumps(analysis_result, indent=2, ensure_ascii=False)}")
+        status = analysis_status(analysis_result)
+        
+        # Debug : résultat de l'analyse (sérialisé seulement si la tâche est échantillonnée)
+        log.debug('analysis_result', results=analysis_result)
         
         analysis_end_time = datetime.now()
-        processing_time = (analysis_end_time - start_time).total_seconds()
+        processing_time = current().elapsed_ms() / 1000
         
         # Préparer les données de callback/réponse
         callback_data = {
-            'status': 'completed',
+            'status': status,
             'results': analysis_result,
             'task_id': task_id,
             'processing_time': round(processing_time, 2),
@@ -115,57 +235,67 @@ def lambda_handler(event, context):
             }
         }
         
-        # Debug : logger les données complètes du callback
-        if DEBUG:
-            logger.info(f"[DEBUG] Données de callback complètes pour task_id {task_id}: {json.dumps(callback_data, indent=2, ensure_ascii=False)}")
+        if batch_id:
+            callback_data['batch_id'] = batch_id
+            callback_data['metadata']['batch_id'] = batch_id
+        
+        # Debug : données complètes du callback
+        log.debug('callback_data', callback=callback_data)
         
         # Mode asynchrone : envoyer le callback
         if callback_url:
-            callback_start_time = datetime.now()
-            send_callback(callback_url, task_id, callback_data, callback_method, query_params)
-            callback_end_time = datetime.now()
-            callback_time = (callback_end_time - callback_start_time).total_seconds()
+            with current().span('callback') as callback_span, trace_span.child('analyser.callback', task_id=task_id) as callback_trace:
+                callback_status = send_callback(callback_url, task_id, callback_data, callback_method, query_params, callback_trace_headers(callback_trace), delivery_deadline(context))
+                callback_trace.attributes['callback_status'] = callback_status
+            callback_time = callback_span['duration_ms'] / 1000
             
-            # Debug : afficher les temps détaillés
-            if DEBUG:
-                download_time = analysis_result.get('download_time', 0)
-                analysis_only_time = analysis_result.get('processing_time', 0)
-                total_time = processing_time
-                logger.info(f"[DEBUG] Chronométrage détaillé pour task_id {task_id}:")
-                logger.info(f"[DEBUG]   - Temps de téléchargement: {download_time:.2f}s")
-                logger.info(f"[DEBUG]   - Temps d'analyse audio: {analysis_only_time:.2f}s") 
-                logger.info(f"[DEBUG]   - Temps de callback: {callback_time:.2f}s")
-                logger.info(f"[DEBUG]   - Temps total: {total_time:.2f}s")
+            # Debug : temps détaillés
+            log.debug(
+                'timings',
+                mode='async',
+                download_s=analysis_result.get('download_time', 0),
+                analysis_s=analysis_result.get('processing_time', 0),
+                callback_s=round(callback_time, 3),
+                total_s=round(processing_time, 3)
+            )
             
-            logger.info(f"Analyse terminée pour task_id: {task_id} en {processing_time:.2f}s - Callback envoyé")
+            logger.info(f"Analyse terminée pour task_id: {task_id} en {processing_time:.2f}s - Callback: {callback_status}")
             
-            return json_response({
+            return respond({
                 'message': 'Analyse lancée avec succès',
                 'task_id': task_id,
                 'callback_url': callback_url,
+                'callback_status': callback_status,
                 'processing_time': round(processing_time, 2)
             })
         else:
             # Mode synchrone : retourner directement les résultats
-            # Debug : afficher les temps détaillés pour le mode synchrone aussi
-            if DEBUG:
-                download_time = analysis_result.get('download_time', 0)
-                analysis_only_time = analysis_result.get('processing_time', 0)
-                total_time = processing_time
-                logger.info(f"[DEBUG] Chronométrage détaillé pour task_id {task_id} (mode synchrone):")
-                logger.info(f"[DEBUG]   - Temps de téléchargement: {download_time:.2f}s")
-                logger.info(f"[DEBUG]   - Temps d'analyse audio: {analysis_only_time:.2f}s")
-                logger.info(f"[DEBUG]   - Temps total: {total_time:.2f}s")
+            # Debug : temps détaillés pour le mode synchrone aussi
+            log.debug(
+                'timings',
+                mode='sync',
+                download_s=analysis_result.get('download_time', 0),
+                analysis_s=analysis_result.get('processing_time', 0),
+                total_s=round(processing_time, 3)
+            )
             
             logger.info(f"Analyse terminée pour task_id: {task_id} en {processing_time:.2f}s - Mode synchrone")
             
-            return json_response({
+            response_data = {
                 'message': 'Analyse terminée avec succès',
                 'task_id': task_id,
                 'results': analysis_result,
-                'status': 'completed',
+                'status': status,
                 'processing_time': round(processing_time, 2)
-            })
+            }
+            
+            # Résultats volumineux : renvoyer un pointeur S3 plutôt que le contenu
+            serialized_results = json.dumps(analysis_result, ensure_ascii=False)
+            if should_offload(serialized_results):
+                response_data['results'] = None
+                response_data.update(offload_results(task_id, serialized_results))
+            
+            return respond(response_data)
         
     except Exception as e:
         logger.error(f"Erreur dans lambda_handler: {str(e)}")
@@ -173,21 +303,20 @@ def lambda_handler(event, context):
         # Essayer d'envoyer un callback d'erreur si possible
         try:
             # Calculer le temps de traitement même en cas d'erreur
-            if 'start_time' in locals():
-                processing_time = (datetime.now() - start_time).total_seconds()
-            else:
-                processing_time = 0
+            processing_time = current().elapsed_ms() / 1000
             
             # Essayer d'extraire les variables depuis l'event directement
             try:
-                event_body = json.loads(event.get('body', '{}'))
+                event_body = (event.get('task') or {}) if internal else json.loads(event.get('body', '{}'))
                 callback_url = event_body.get('callback_url')
                 task_id = event_body.get('task_id', str(uuid.uuid4()))
+                batch_id = event_body.get('batch_id')
                 query_params = event_body.get('query_params', {})
             except:
                 # Valeurs par défaut si l'extraction échoue
                 callback_url = None
                 task_id = str(uuid.uuid4())
+                batch_id = None
                 query_params = {}
             
             error_callback = {
@@ -201,14 +330,18 @@ def lambda_handler(event, context):
                     'failed_at': datetime.now().isoformat()
                 }
             }
+            if batch_id:
+                error_callback['batch_id'] = batch_id
+                error_callback['metadata']['batch_id'] = batch_id
             
             if callback_url:
                 # Mode asynchrone : envoyer le callback d'erreur
-                send_callback(callback_url, task_id, error_callback, 'POST', query_params)
-                return json_response({'error': f'Erreur lors de l\'analyse: {str(e)}'}, 500)
+                with trace_span.child('analyser.callback', task_id=task_id, status='failed') as callback_trace:
+                    send_callback(callback_url, task_id, error_callback, 'POST', query_params, callback_trace_headers(callback_trace), delivery_deadline(context))
+                return respond({'error': f'Erreur lors de l\'analyse: {str(e)}'}, 500)
             else:
                 # Mode synchrone : retourner l'erreur directement avec les détails
-                return json_response({
+                return respond({
                     'error': f'Erreur lors de l\'analyse: {str(e)}',
                     'task_id': task_id,
                     'status': 'failed',
@@ -217,68 +350,282 @@ def lambda_handler(event, context):
         except:
             pass
         
-        return json_response({'error': f'Erreur lors de l\'analyse: {str(e)}'}, 500)
+        return respond({'error': f'Erreur lors de l\'analyse: {str(e)}'}, 500)
 
 
-def download_mp4(url):
-    """Télécharge un fichier MP4 depuis une URL"""
+def download_mp4(url, deadline=None):
+    """
+    Télécharge un fichier MP4 depuis une URL, par blocs, sans dépasser l'échéance
+    (connexions keep-alive partagées, limite de débit par hôte, voir media_download)
+    """
     tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
     logger.info(f"Téléchargement du fichier depuis {url}...")
     
-    # urllib.request.urlopen suit automatiquement les redirections (max 30)
     try:
-        with urllib.request.urlopen(url) as response:
-            tmp.write(response.read())
+        download_to_file(url, tmp, deadline)
         tmp.close()
         return tmp.name
-    except Exception as e:
+    except Exception:
         tmp.close()
         if os.path.exists(tmp.name):
             os.remove(tmp.name)
         raise
 
 
-def run_cmd(cmd):
-    """Exécute une commande système"""
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return result.stdout + result.stderr
+def run_cmd(cmd, span_name='ffmpeg'):
+    """Exécute une commande système dans un span (CPU du processus enfant inclus)"""
+    with current().span(span_name) as span:
+        stdout, stderr, rusage, _ = run_measured(cmd)
+        current().add_child_usage(span, rusage)
+    current().add('ffmpeg_processes', 1)
+    return stdout + stderr
+
+
+def run_cmd_until(cmd, deadline, span_name='ffmpeg'):
+    """
+    Exécute une commande jusqu'à l'échéance : au-delà, ffmpeg reçoit SIGTERM et
+    s'arrête proprement (résumé ebur128 des données déjà traitées)
+    Retourne (sortie, terminée avant l'échéance)
+    """
+    with current().span(span_name) as span:
+        stdout, stderr, rusage, completed = run_measured(cmd, remaining_seconds(deadline), FFMPEG_STOP_GRACE_SECONDS)
+        current().add_child_usage(span, rusage)
+    current().add('ffmpeg_processes', 1)
+    return stdout + stderr, completed
 
 
-def get_durations(file_path):
-    """Récupère les durées audio et vidéo"""
+def probe_media(file_path):
+    """Durée, débit et pistes du fichier (durée propre de chaque flux) en un seul appel ffprobe"""
     cmd = [
         FFPROBE_PATH, "-v", "error",
-        "-show_entries", "format=duration",
+        "-show_entries",
+        "format=duration,bit_rate,size:stream=index,codec_type,channels,duration,nb_frames,avg_frame_rate:stream_tags=language",
         "-of", "json",
         file_path
     ]
-    output = subprocess.run(cmd, stdout=subprocess.PIPE, text=True)
-    duration = float(json.loads(output.stdout)["format"]["duration"])
-    return round(duration, 2), round(duration, 2)  # audioDuration, videoDuration
+    output = run_cmd(cmd, 'ffprobe.probe')
+    probe = json.loads(output)
+    media_format = probe.get("format", {})
+    streams = probe.get("streams", [])
+    duration = float(media_format.get("duration") or 0)
+    # Pistes audio dans l'ordre des spécificateurs ffmpeg 0:a:0, 0:a:1...
+    audio_tracks = [
+        {
+            "index": stream.get("index"),
+            "channels": stream.get("channels"),
+            "language": (stream.get("tags") or {}).get("language"),
+            "duration": stream_duration(stream, duration),
+        }
+        for stream in streams if stream.get("codec_type") == "audio"
+    ]
+    # Première piste vidéo (0:v:0), analysée par le contrôle vidéo
+    video_streams = [stream for stream in streams if stream.get("codec_type") == "video"]
+    video = None
+    if video_streams:
+        stream = video_streams[0]
+        video = {
+            "index": stream.get("index"),
+            "duration": stream_duration(stream, duration),
+            "frame_count": int(stream["nb_frames"]) if str(stream.get("nb_frames", "")).isdigit() else None,
+            "frame_rate": parse_frame_rate(stream.get("avg_frame_rate")),
+        }
+    size = int(media_format.get("size") or 0)
+    # bit_rate absent de certains conteneurs : débit moyen déduit de la taille
+    bit_rate = int(media_format.get("bit_rate") or (size * 8 / duration if duration else 0))
+    return {
+        "duration": duration,
+        "bit_rate": bit_rate,
+        "size": size,
+        "has_audio": bool(audio_tracks),
+        "has_video": video is not None,
+        "audio_tracks": audio_tracks,
+        "video": video,
+    }
 
 
-def has_audio_stream(file_path):
-    """Vérifie si le fichier a une piste audio"""
-    cmd = [
-        FFPROBE_PATH, "-v", "error",
-        "-select_streams", "a:0",
-        "-show_entries", "stream=codec_type",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        file_path
-    ]
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True).stdout.strip()
-    return result == "audio"
+def stream_duration(stream, default):
+    """Durée (s) d'un flux ffprobe, celle du conteneur si le flux ne l'indique pas"""
+    try:
+        return round(float(stream["duration"]), 2)
+    except (KeyError, TypeError, ValueError):
+        return round(default, 2)
+
+
+def parse_frame_rate(value):
+    """Fréquence d'images ffprobe ("30000/1001") en images par seconde, None si inconnue"""
+    try:
+        numerator, _, denominator = str(value).partition("/")
+        return round(float(numerator) / float(denominator or 1), 3)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def build_filter_complex(track_count, metrics, video=False):
+    """
+    Graphe ffmpeg analysant toutes les pistes audio en un seul processus : une chaîne
+    [0:a:i] par piste avec les filtres des métriques demandées, plus (video=True)
+    une chaîne [0:v:0] de contrôle vidéo sur le même démultiplexage
+    Retourne (graphe, étiquettes de sortie, {instance de filtre: (piste, métrique)}) ;
+    les instances sont numérotées dans l'ordre du graphe (Parsed_ebur128_0, ...),
+    la piste des filtres vidéo est None
+    """
+    chains = []
+    outputs = []
+    log_filters = {}
+    filter_index = 0
+    for track in range(track_count):
+        filters = []
+        for metric in AUDIO_METRICS:
+            if metric not in metrics:
+                continue
+            for spec in WINDOW_FILTERS[metric]:
+                name = spec.split("=", 1)[0]
+                if name == METRIC_LOG_FILTERS[metric]:
+                    log_filters[f"{name}_{filter_index}"] = (track, metric)
+                filters.append(spec)
+                filter_index += 1
+        chains.append(f"[0:a:{track}]{','.join(filters)}[a{track}]")
+        outputs.append(f"[a{track}]")
+    if video:
+        for spec in VIDEO_FILTERS:
+            name = spec.split("=", 1)[0]
+            if name != "scale":
+                log_filters[f"{name}_{filter_index}"] = (None, METRIC_VIDEO)
+            filter_index += 1
+        chains.append(f"[0:v:0]{','.join(VIDEO_FILTERS)}[v]")
+        outputs.append("[v]")
+    return ";".join(chains), outputs, log_filters
 
 
-def get_loudness(file_path):
-    """Analyse la loudness du fichier audio"""
+def split_filter_logs(output):
+    """
+    Regroupe les lignes de log par instance de filtre ; les lignes sans préfixe
+    (suite d'un message multiligne, comme le résumé ebur128) suivent la précédente
+    """
+    logs = {}
+    owner = None
+    for line in output.splitlines():
+        match = FILTER_LOG_PREFIX_RE.match(line)
+        if match:
+            owner = match.group(1)
+            line = line[match.end():]
+        elif line.startswith("["):
+            owner = None
+        if owner:
+            logs.setdefault(owner, []).append(line)
+    return {owner: "\n".join(lines) for owner, lines in logs.items()}
+
+
+def analyze_window(file_path, start, duration, deadline=None, seek=True, metrics=DECODE_METRICS, timeline_resolution=None, track_count=1, threads=None):
+    """
+    Analyse une fenêtre [start, start + duration] de toutes les pistes audio en une
+    seule passe ffmpeg (conteneur démultiplexé une fois), avec les seuls filtres des
+    métriques demandées (ebur128 pour la loudness, silencedetect pour le silence,
+    blackdetect et freezedetect sur la vidéo ; seek côté entrée, seek=False analyse
+    tout le fichier)
+    `threads` fixe les threads de décodage et du graphe de filtres (choix de ffmpeg sinon)
+    Retourne la durée effectivement traitée et, par piste, les mesures de la fenêtre
+    et (avec timeline_resolution) ses timelines tirées de la même sortie
+    """
+    video = METRIC_VIDEO in metrics
+    graph, outputs, log_filters = build_filter_complex(track_count, metrics, video)
+    bounds = ["-ss", f"{start:.3f}", "-t", f"{duration:.3f}"] if seek else []
+    skip_frames = ["-skip_frame:v", "nokey"] if video and VIDEO_QC_DECODE == 'keyframes' else []
+    decoder_threads = ["-threads", str(threads)] if threads else []
+    filter_threads = ["-filter_complex_threads", str(threads)] if threads else []
     cmd = [
-        FFMPEG_PATH, "-hide_banner", "-nostats", "-i", file_path,
-        "-filter_complex", "ebur128=peak=true",
+        FFMPEG_PATH, "-hide_banner", "-nostats", "-progress", "pipe:1",
+        *filter_threads, *bounds, *skip_frames, *decoder_threads, "-i", file_path,
+        "-filter_complex", graph,
+        *[arg for label in outputs for arg in ("-map", label)],
         "-f", "null", "-"
     ]
-    output = run_cmd(cmd)
+    output, completed = run_cmd_until(cmd, deadline, 'ffmpeg.window')
+    
+    window = {
+        "start": start,
+        "duration": duration,
+        "completed": completed,
+        "tracks": [{"loudness": None, "true_peak": None, "silence": None} for _ in range(track_count)],
+        "video": {"black": [], "freeze": [], "frames": 0} if video else None,
+    }
+    with current().span('parse.window'):
+        processed = duration if completed else min(duration, parse_progress_seconds(output))
+        window["processed"] = processed
+        # Horodatages relatifs au début de la fenêtre après le seek
+        offset = start if seek else 0.0
+        filter_logs = split_filter_logs(output)
+        for name, (track, metric) in log_filters.items():
+            log = filter_logs.get(name, "")
+            if metric == METRIC_VIDEO:
+                # Intervalles ramenés à la partie traitée de la fenêtre (gel en cours fermé à la fin)
+                intervals = parse_black_intervals(log) if name.startswith("blackdetect") else parse_freeze_intervals(log, processed)
+                window["video"]["black" if name.startswith("blackdetect") else "freeze"] = [
+                    (offset + max(0.0, interval_start), offset + min(processed, end))
+                    for interval_start, end in intervals if interval_start < processed
+                ]
+                continue
+            measures = window["tracks"][track]
+            if metric == METRIC_LOUDNESS:
+                measures["loudness"], measures["true_peak"] = parse_loudness_output(log)
+                if timeline_resolution:
+                    measures["loudness_timeline"] = parse_loudness_timeline(log, offset, timeline_resolution)
+            else:
+                intervals = parse_silence_intervals(log)
+                measures["silence"] = min(processed, sum(end - silence_start for silence_start, end in intervals))
+                if timeline_resolution:
+                    measures["silences"] = [(offset + max(0.0, silence_start), offset + end) for silence_start, end in intervals]
+        if video:
+            window["video"]["frames"] = parse_progress_frames(output)
+    return window
+
+
+def track_windows(windows, track):
+    """Vue des fenêtres limitée aux mesures d'une piste (format attendu par combine_windows)"""
+    return [dict(window, **window["tracks"][track]) for window in windows]
+
+
+def parse_progress_seconds(output):
+    """Dernière position traitée (s) dans la sortie -progress de ffmpeg"""
+    matches = re.findall(r"^out_time_us=(\d+)", output, re.MULTILINE)
+    return int(matches[-1]) / 1e6 if matches else 0.0
+
+
+def parse_progress_frames(output):
+    """Dernier nombre d'images vidéo décodées dans la sortie -progress de ffmpeg"""
+    matches = re.findall(r"^frame=(\d+)", output, re.MULTILINE)
+    return int(matches[-1]) if matches else 0
+
+
+def parse_black_intervals(output):
+    """Intervalles d'images noires (début, fin) de la sortie blackdetect"""
+    return [
+        (float(match.group(1)), float(match.group(2)))
+        for match in re.finditer(r"black_start:\s*(-?\d+(?:\.\d+)?)\s+black_end:\s*(-?\d+(?:\.\d+)?)", output)
+    ]
+
 
+def parse_freeze_intervals(output, end_of_window):
+    """
+    Intervalles d'image figée (début, fin) de la sortie freezedetect
+    (lavfi.freezedetect.freeze_start / freeze_end) ; un gel encore en cours à la
+    fin de la sortie est fermé à `end_of_window`
+    """
+    intervals = []
+    freeze_start = None
+    for match in re.finditer(r"freeze_(start|end):\s*(-?\d+(?:\.\d+)?)", output):
+        if match.group(1) == "start":
+            freeze_start = float(match.group(2))
+        elif freeze_start is not None:
+            intervals.append((freeze_start, float(match.group(2))))
+            freeze_start = None
+    if freeze_start is not None and freeze_start < end_of_window:
+        intervals.append((freeze_start, end_of_window))
+    return intervals
+
+
+def parse_loudness_output(output):
+    """Extrait la loudness intégrée et le true peak de la sortie ebur128"""
     measured = None
     true_peak = None
     
@@ -302,21 +649,26 @@ def get_loudness(file_path):
                 if match:
                     true_peak = float(match.group(1))
     
-    # Si pas trouvé dans le résumé, chercher dans les lignes de progression
+    # Si pas trouvé dans le résumé (ffmpeg interrompu), reprendre la dernière ligne
+    # de progression : loudness intégrée et true peak cumulés jusque-là
     if measured is None or true_peak is None:
+        progress_measured = None
+        progress_true_peak = None
         for line in output.splitlines():
-            # Recherche dans les lignes de progression pour la loudness
-            if "I:" in line and "LUFS" in line and measured is None:
+            if "I:" in line and "LUFS" in line:
                 match = re.search(r"I:\s*(-?\d+\.\d+)\s*LUFS", line)
                 if match:
-                    measured = float(match.group(1))
+                    progress_measured = float(match.group(1))
             
-            # Recherche du true peak dans les lignes TPK
-            if "TPK:" in line and true_peak is None:
-                # Extraire la première valeur TPK (canal gauche)
-                match = re.search(r"TPK:\s*(-?\d+\.\d+)", line)
+            # TPK (cumulé, pas FTPK de la trame) : un true peak par canal, on garde le plus élevé
+            if "TPK:" in line:
+                match = re.search(r"\bTPK:\s*((?:-?\d+\.\d+\s*)+)", line)
                 if match:
-                    true_peak = float(match.group(1))
+                    progress_true_peak = max(float(value) for value in match.group(1).split())
+        if measured is None:
+            measured = progress_measured
+        if true_peak is None:
+            true_peak = progress_true_peak
 
     # Si on n'arrive toujours pas à extraire les valeurs, retourner des valeurs par défaut
     if measured is None:
@@ -330,70 +682,236 @@ def get_loudness(file_path):
     return measured, true_peak
 
 
-def get_silence_percentage(file_path, duration):
-    """Calcule le pourcentage de silence"""
-    cmd = [
-        FFMPEG_PATH, "-i", file_path,
-        "-af", "silencedetect=n=-50dB:d=0.5",
-        "-f", "null", "-"
-    ]
-    output = run_cmd(cmd)
-
-    silence_durations = []
+def parse_silence_intervals(output):
+    """Intervalles de silence (début, fin) de la sortie silencedetect (log ou métadonnées lavfi.silence_*)"""
+    intervals = []
     silence_start = None
     for line in output.splitlines():
         if "silence_start" in line:
-            match = re.search(r"silence_start: (\d+(\.\d+)?)", line)
+            match = re.search(r"silence_start[:=] ?(-?\d+(\.\d+)?)", line)
             if match:
                 silence_start = float(match.group(1))
         elif "silence_end" in line and silence_start is not None:
-            match = re.search(r"silence_end: (\d+(\.\d+)?)", line)
+            match = re.search(r"silence_end[:=] ?(\d+(\.\d+)?)", line)
             if match:
-                silence_end = float(match.group(1))
-                silence_durations.append(silence_end - silence_start)
+                intervals.append((silence_start, float(match.group(1))))
                 silence_start = None
+    return intervals
 
-    silence_total = sum(silence_durations)
+
+def parse_silence_output(output, duration):
+    """Calcule le pourcentage de silence à partir de la sortie silencedetect"""
+    silence_total = sum(end - start for start, end in parse_silence_intervals(output))
     return round((silence_total / duration) * 100, 2)
 
 
-def analyze_mp4_from_url(file_url):
-    """Analyse complète d'un fichier MP4 depuis une URL"""
-    start_time = datetime.now()
+def run_windows(file_path, plan, deadline=None, metrics=DECODE_METRICS, timeline_resolution=None, track_count=1):
+    """Analyse les fenêtres du plan, `parallel` processus ffmpeg à la fois (`threads` threads chacun)"""
+    def run(window):
+        # Échéance atteinte avant le démarrage : fenêtre ignorée
+        if deadline is not None and remaining_seconds(deadline) <= 0:
+            return None
+        seek = plan['strategy'] != STRATEGY_FULL
+        return analyze_window(file_path, window[0], window[1], deadline, seek, metrics, timeline_resolution, track_count, plan.get('threads'))
+
+    if plan['parallel'] == 1:
+        results = [run(window) for window in plan['windows']]
+    else:
+        with ThreadPoolExecutor(max_workers=plan['parallel']) as executor:
+            results = list(executor.map(run, plan['windows']))
+    return [result for result in results if result is not None and result['processed'] > 0]
+
+
+def sampling_summary(plan, windows, duration):
+    """
+    Échantillon de fenêtres : nombre de fenêtres, durée de chacune et intervalles de
+    confiance des mesures extrapolées (erreur type entre fenêtres, avec correction
+    de population finie) ; le true peak n'y est qu'une borne inférieure
+    """
+    summary = {
+        "windows": len(windows),
+        "plannedWindows": len(plan['windows']),
+        "windowSeconds": round(plan['windows'][0][1], 3),
+        "complete": len(windows) == len(plan['windows']) and all(window['completed'] for window in windows),
+        "confidence": None,
+    }
+    if len(windows) < 2:
+        return summary
+    
+    processed = sum(window['processed'] for window in windows)
+    margin_factor = CONFIDENCE_Z / math.sqrt(len(windows)) * math.sqrt(max(0.0, 1 - processed / duration))
+    confidence = {"level": CONFIDENCE_LEVEL}
+    if windows[0]['silence'] is not None:
+        silence_mean = sum(window['silence'] for window in windows) / processed * 100
+        silence_margin = margin_factor * statistics.stdev(window['silence'] / window['processed'] * 100 for window in windows)
+        confidence["silencePercentage"] = [round(max(0.0, silence_mean - silence_margin), 2), round(min(100.0, silence_mean + silence_margin), 2)]
+    if windows[0]['loudness'] is not None:
+        energy_mean = sum(window['processed'] * 10 ** (window['loudness'] / 10) for window in windows) / processed
+        energy_margin = margin_factor * statistics.stdev(10 ** (window['loudness'] / 10) for window in windows)
+        confidence["loudnessMeasured"] = [energy_to_lufs(energy_mean - energy_margin), energy_to_lufs(energy_mean + energy_margin)]
+    summary["confidence"] = confidence
+    return summary
+
+
+def combine_video(windows, video):
+    """
+    Contrôle vidéo des fenêtres traitées : durée, nombre d'images et fréquence lus
+    dans l'en-tête, images effectivement décodées, images noires et figées
+    (intervalles fusionnés, pourcentages rapportés à la durée traitée)
+    """
+    processed = sum(window['processed'] for window in windows)
+    black = merge_intervals(interval for window in windows for interval in window['video']['black'])
+    freeze = merge_intervals(interval for window in windows for interval in window['video']['freeze'])
+    decoded = sum(window['video']['frames'] for window in windows)
+
+    def percentage(intervals):
+        return round(min(100.0, sum(end - start for start, end in intervals) / processed * 100), 2) if processed else 0.0
+
+    return {
+        "duration": video['duration'],
+        "frameCount": video['frame_count'],
+        "frameRate": video['frame_rate'],
+        "decodeMode": VIDEO_QC_DECODE,
+        "decodedFrames": decoded,
+        "decodedFrameRate": round(decoded / processed, 3) if processed else None,
+        "blackPercentage": percentage(black),
+        "blackIntervals": black,
+        "freezePercentage": percentage(freeze),
+        "freezeIntervals": freeze,
+    }
+
+
+def energy_to_lufs(energy):
+    """Loudness (LUFS) d'une énergie moyenne, plancher de -70 LUFS comme ebur128"""
+    return round(10 * math.log10(energy), 1) if energy > 0 else -70.0
+
+
+def combine_windows(windows, duration):
+    """
+    Agrège les mesures des fenêtres traitées (métriques demandées uniquement) :
+    loudness intégrée moyennée en énergie (pondérée par la durée traitée),
+    true peak maximum, silence rapporté à la durée traitée
+    """
+    processed = sum(window['processed'] for window in windows)
+    if not processed:
+        raise TimeoutError("Délai dépassé avant l'analyse du moindre segment")
+    measures = {}
+    if windows[0]['silence'] is not None:
+        silence = sum(window['silence'] for window in windows)
+        measures["silencePercentage"] = round(silence / processed * 100, 2)
+    if windows[0]['loudness'] is not None:
+        energy = sum(window['processed'] * 10 ** (window['loudness'] / 10) for window in windows)
+        measures["loudnessMeasured"] = energy_to_lufs(energy / processed)
+        measures["loudnessTruePeak"] = max(window['true_peak'] for window in windows)
+    measures["coverage"] = round(min(1.0, processed / duration), 4) if duration else 1.0
+    return measures
+
+
+def analyze_mp4_from_url(file_url, deadline=None, profile=PROFILE_FULL, requested_metrics=DEFAULT_METRICS, timeline_resolution=None):
+    """
+    Analyse d'un fichier MP4 depuis une URL, limitée aux métriques demandées
+    Toutes les pistes audio sont mesurées dans la même passe (une entrée par piste
+    dans 'tracks', la première reprise au premier niveau du résultat)
+    Avec timeline_resolution, chaque piste inclut ses timelines de loudness et de
+    silence (même passe de décodage)
+    La métrique 'video' ajoute le contrôle de la première piste vidéo (images noires
+    et figées, images décodées) à cette même passe
+    La durée seule se lit dans l'en-tête du fichier (ffprobe directement sur l'URL,
+    présignée pour une URL s3://, sans téléchargement ni décodage)
+    Avec une échéance, la stratégie (complète, segments parallèles ou échantillonnée)
+    est choisie selon le coût estimé, et l'analyse s'arrête avant l'échéance :
+    les mesures portent alors sur la part 'coverage' du fichier
+    Le profil 'approximate' n'analyse que des fenêtres stratifiées et extrapole
+    les mesures avec leurs intervalles de confiance
+    """
+    metrics = current()
+    start_ns = time.perf_counter_ns()
     local_path = None
+    decode_metrics = tuple(metric for metric in DECODE_METRICS if metric in requested_metrics)
+    audio_metrics = tuple(metric for metric in AUDIO_METRICS if metric in requested_metrics)
     
     try:
-        # Télécharger le fichier
-        download_start = datetime.now()
-        local_path = download_mp4(file_url)
-        download_end = datetime.now()
-        download_time = (download_end - download_start).total_seconds()
+        if decode_metrics:
+            # Télécharger le fichier
+            with metrics.span('download') as download_span:
+                local_path = download_mp4(file_url, deadline)
+            metrics.add('download_bytes', os.path.getsize(local_path))
+            download_time = download_span['duration_ms'] / 1000
+        else:
+            download_time = 0.0
         
-        # Vérifier qu'il y a une piste audio
-        if not has_audio_stream(local_path):
+        # Sonder le fichier : pistes audio et vidéo, durées et débit
+        probe = probe_media(local_path or probe_url(file_url))
+        if audio_metrics and not probe['has_audio']:
             raise ValueError("Le fichier ne contient pas de piste audio.")
+        tracks = [dict(track) for track in probe['audio_tracks']]
+        # Sans piste vidéo, la métrique 'video' n'ajoute rien à la passe (résultat null)
+        if METRIC_VIDEO in decode_metrics and not probe['has_video']:
+            decode_metrics = audio_metrics
+        video = None
         
-        # Analyse complète
-        analysis_start = datetime.now()
-        audio_duration, video_duration = get_durations(local_path)
-        loudness_measured, loudness_true_peak = get_loudness(local_path)
-        silence_percentage = get_silence_percentage(local_path, audio_duration)
-        analysis_end = datetime.now()
+        # Analyse selon le budget restant
+        with metrics.span('analysis') as analysis_span:
+            if not decode_metrics:
+                plan = None
+                coverage = 1.0
+            else:
+                if profile == PROFILE_APPROXIMATE:
+                    plan = plan_approximate(probe, remaining_seconds(deadline))
+                else:
+                    plan = plan_analysis(probe, remaining_seconds(deadline))
+                track_count = len(tracks) if audio_metrics else 0
+                logger.info(f"Stratégie d'analyse: {plan['strategy']} ({len(plan['windows'])} fenêtre(s), {track_count} piste(s) audio, {plan['threads']} thread(s) ffmpeg, estimation {plan['estimated_s']}s)")
+                windows = run_windows(local_path, plan, deadline, decode_metrics, timeline_resolution, track_count)
+                processed = sum(window['processed'] for window in windows)
+                if not processed:
+                    raise TimeoutError("Délai dépassé avant l'analyse du moindre segment")
+                coverage = round(min(1.0, processed / probe['duration']), 4) if probe['duration'] else 1.0
+                if METRIC_VIDEO in decode_metrics:
+                    with metrics.span('video'):
+                        video = combine_video(windows, probe['video'])
+                for number, track in enumerate(tracks[:track_count]):
+                    per_track = track_windows(windows, number)
+                    track.update(combine_windows(per_track, probe['duration']))
+                    if plan['strategy'] in SAMPLING_STRATEGIES:
+                        track["confidence"] = sampling_summary(plan, per_track, probe['duration'])["confidence"]
+                    if timeline_resolution:
+                        with metrics.span('timeline'):
+                            track["timeline"] = build_timeline(per_track, probe['duration'], timeline_resolution)
+                    track.pop("coverage")
+        strategy = plan['strategy'] if plan else STRATEGY_PROBE
+        metrics.add(f"analysis_{strategy}", 1)
         
         # Calculer les temps de traitement
-        analysis_only_time = (analysis_end - analysis_start).total_seconds()
-        total_processing_time = (datetime.now() - start_time).total_seconds()
+        total_processing_time = (time.perf_counter_ns() - start_ns) / 1e9
         
-        return {
-            "silencePercentage": silence_percentage,
-            "loudnessMeasured": loudness_measured,
-            "loudnessTruePeak": loudness_true_peak,
-            "audioDuration": audio_duration,
-            "videoDuration": video_duration,
-            "processing_time": round(analysis_only_time, 2),  # Temps d'analyse pure (sans téléchargement)
-            "download_time": round(download_time, 2),  # Temps de téléchargement
-            "total_time": round(total_processing_time, 2)  # Temps total incluant téléchargement
+        first_track = tracks[0] if tracks else {}
+        result = {
+            "silencePercentage": first_track.get('silencePercentage'),
+            "loudnessMeasured": first_track.get('loudnessMeasured'),
+            "loudnessTruePeak": first_track.get('loudnessTruePeak'),
+            # Durées propres des flux (celle du conteneur si le flux ne l'indique pas)
+            "audioDuration": first_track.get('duration'),
+            "videoDuration": probe['video']['duration'] if probe['video'] else None,
+            "coverage": coverage,
+            "analysisStrategy": strategy,
+            "metrics": [metric for metric in METRICS if metric in requested_metrics],
+            "tracks": tracks,
+            "processing_time": round(analysis_span['duration_ms'] / 1000, 3),  # Temps d'analyse pure (sans téléchargement)
+            "download_time": round(download_time, 3),  # Temps de téléchargement
+            "total_time": round(total_processing_time, 3)  # Temps total incluant téléchargement
         }
+        # Métriques non demandées : absentes du résultat
+        for metric, keys in RESULT_KEYS.items():
+            if metric not in requested_metrics:
+                for key in keys:
+                    result.pop(key)
+        if METRIC_VIDEO in requested_metrics:
+            result["video"] = video
+        if plan and plan['strategy'] in SAMPLING_STRATEGIES:
+            sampled = track_windows(windows, 0) if audio_metrics else [dict(window, loudness=None, silence=None) for window in windows]
+            result["sampling"] = sampling_summary(plan, sampled, probe['duration'])
+        return result
         
     finally:
         # Nettoyer le fichier temporaire
@@ -401,50 +919,23 @@ def analyze_mp4_from_url(file_url):
             os.remove(local_path)
 
 
-def send_callback(callback_url, task_id, callback_data, method='POST', query_params=None):
-    """Envoie le callback au système demandeur"""
-    try:
-        # Utiliser directement l'URL de callback fournie (elle contient déjà le task_id si nécessaire)
-        full_callback_url = callback_url.rstrip('/')
-        
-        # Ajouter les query parameters à l'URL de callback s'ils existent
-        if query_params and isinstance(query_params, dict):
-            import urllib.parse
-            query_string = urllib.parse.urlencode(query_params)
-            separator = '&' if '?' in full_callback_url else '?'
-            full_callback_url = f"{full_callback_url}{separator}{query_string}"
-            logger.info(f"URL de callback avec query params: {full_callback_url}")
-        
-        # Debug : logger l'URL finale et les données envoyées
-        if DEBUG:
-            logger.info(f"[DEBUG] Envoi callback {method} vers: {full_callback_url}")
-            logger.info(f"[DEBUG] Données envoyées: {json.dumps(callback_data, indent=2, ensure_ascii=False)}")
-        
-        # Choisir la méthode HTTP appropriée
-        method = method.upper()
-        if method == 'PUT':
-            response = requests.put(
-                full_callback_url,
-                json=callback_data,
-                allow_redirects=True,
-                headers={'Content-Type': 'application/json'}
-            )
-        else:  # POST par défaut
-            response = requests.post(
-                full_callback_url,
-                json=callback_data,
-                allow_redirects=True,
-                headers={'Content-Type': 'application/json'}
-            )
-        
-        # Lever une exception pour les codes d'erreur HTTP
-        response.raise_for_status()
-        
-        logger.info(f"Callback {method} envoyé avec succès pour {task_id} (status: {response.status_code})")
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erreur de requête lors de l'envoi du callback {method} pour {task_id}: {str(e)}")
-        raise
-    except Exception as e:
-        logger.error(f"Erreur lors de l'envoi du callback {method} pour {task_id}: {str(e)}")
-        raise
+def analysis_status(analysis_result):
+    """
+    'completed', ou 'partial' si l'analyse n'a pas couvert ce que le profil demandait :
+    fichier incomplet en profil complet, fenêtres manquantes ou interrompues en profil approximatif
+    """
+    if analysis_result['analysisStrategy'] == STRATEGY_APPROXIMATE:
+        return 'completed' if analysis_result['sampling']['complete'] else 'partial'
+    return 'completed' if analysis_result['coverage'] >= 1 else 'partial'
+
+
+def send_callback(callback_url, task_id, callback_data, method='POST', query_params=None, trace_headers=None, deadline=None):
+    """
+    Envoie le callback au système demandeur
+    Ne lève pas d'exception : retourne le statut de livraison (voir callback_delivery)
+    """
+    # Debug : URL finale du callback (construite seulement si la ligne est écrite ;
+    # les données envoyées sont déjà dans la ligne 'callback_data')
+    current_log().debug('callback_send', method=method, url=lambda: build_callback_url(callback_url, query_params))
+    
+    return deliver_callback(callback_url, task_id, callback_data, method, query_params, trace_headers, deadline)
@@ -0,0 +1,55 @@
+import gzip
+import logging
+import os
+
+# Configuration du logging
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Déport des résultats synchrones volumineux (une réponse Lambda est limitée à 6 Mo)
+RESULTS_BUCKET_NAME = os.environ.get('RESULTS_BUCKET_NAME')
+SYNC_OFFLOAD_THRESHOLD_BYTES = int(os.environ.get('SYNC_OFFLOAD_THRESHOLD_BYTES', '1048576'))
+PRESIGNED_URL_EXPIRES_SECONDS = int(os.environ.get('PRESIGNED_URL_EXPIRES_SECONDS', '3600'))
+
+# Client S3 créé au premier déport puis réutilisé
+_s3_client = None
+
+
+def get_s3_client():
+    """Client S3 créé au premier usage puis réutilisé"""
+    global _s3_client
+    if _s3_client is None:
+        # Import différé : boto3 n'est chargé que si un résultat est déporté
+        import boto3
+        _s3_client = boto3.client('s3')
+    return _s3_client
+
+
+def should_offload(serialized_results):
+    """Indique si des résultats sérialisés doivent être déportés vers S3"""
+    return bool(RESULTS_BUCKET_NAME) and len(serialized_results.encode('utf-8')) > SYNC_OFFLOAD_THRESHOLD_BYTES
+
+
+def offload_results(task_id, serialized_results):
+    """
+    Stocke les résultats compressés dans S3
+    Retourne le pointeur s3:// et une URL présignée pour les récupérer
+    """
+    key = f"sync-results/{task_id}.json.gz"
+    s3_client = get_s3_client()
+    s3_client.put_object(
+        Bucket=RESULTS_BUCKET_NAME,
+        Key=key,
+        Body=gzip.compress(serialized_results.encode('utf-8')),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+    logger.info(f"Résultats déportés dans S3 pour task_id: {task_id} ({len(serialized_results)} octets)")
+    return {
+        'results_ref': f"s3://{RESULTS_BUCKET_NAME}/{key}",
+        'results_url': s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': RESULTS_BUCKET_NAME, 'Key': key},
+            ExpiresIn=PRESIGNED_URL_EXPIRES_SECONDS
+        )
+    }
@@ -0,0 +1,94 @@
+"""
+Timelines de loudness et de silence : valeurs momentary/short-term d'ebur128
+(une ligne toutes les 100 ms) ramenées à une résolution configurable et stockées
+dans des tableaux int16 (centièmes de LU) encodés en base64, plus la liste des
+intervalles de silence. Produites à partir de la sortie de la passe d'analyse,
+sans décodage supplémentaire
+"""
+import base64
+import math
+import re
+import sys
+from array import array
+
+# Encodage : int16 little-endian en centièmes de LU (LUFS x 100), -32768 = pas de mesure
+TIMELINE_ENCODING = 'int16le-centi-lufs-base64'
+TIMELINE_MISSING = -32768
+# Plancher des valeurs (ebur128 descend à -120 LUFS ou -inf sur du silence numérique)
+TIMELINE_FLOOR_CENTI_LU = -7000
+
+# Ligne de mesure ebur128 : "t: 12.3   TARGET:-23 LUFS    M: -20.1 S: -21.4 ..."
+EBUR128_FRAME_RE = re.compile(r"t:\s*(\d+(?:\.\d+)?)\s+TARGET:.*?M:\s*(\S+)\s+S:\s*(\S+)")
+
+
+def to_centi_lu(value):
+    """Valeur ebur128 (texte) en centièmes de LU, bornée à l'int16 et au plancher"""
+    try:
+        centi = float(value) * 100
+    except ValueError:
+        return TIMELINE_FLOOR_CENTI_LU
+    if math.isnan(centi) or centi < TIMELINE_FLOOR_CENTI_LU:
+        return TIMELINE_FLOOR_CENTI_LU
+    return min(32767, round(centi))
+
+
+def parse_loudness_timeline(output, start, resolution):
+    """
+    Maxima momentary et short-term par intervalle de `resolution` secondes d'une
+    fenêtre commençant à `start` (les horodatages ebur128 repartent de 0 après le seek)
+    Retourne (indice du premier intervalle, momentary, short-term) en array('h')
+    """
+    first = int(start / resolution)
+    momentary = array('h')
+    short_term = array('h')
+    for match in EBUR128_FRAME_RE.finditer(output):
+        index = int((start + float(match.group(1))) / resolution) - first
+        if index >= len(momentary):
+            padding = [TIMELINE_MISSING] * (index + 1 - len(momentary))
+            momentary.extend(padding)
+            short_term.extend(padding)
+        momentary[index] = max(momentary[index], to_centi_lu(match.group(2)))
+        short_term[index] = max(short_term[index], to_centi_lu(match.group(3)))
+    return first, momentary, short_term
+
+
+def encode_array(values):
+    """Tableau int16 en base64 little-endian"""
+    if sys.byteorder == 'big':
+        values = array('h', values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def merge_intervals(intervals, gap=0.01):
+    """Trie et fusionne les intervalles contigus (silences, images noires... coupés entre deux segments)"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [[round(start, 3), round(end, 3)] for start, end in merged]
+
+
+def build_timeline(windows, duration, resolution):
+    """
+    Assemble les timelines des fenêtres sur la durée du fichier : intervalles non
+    analysés (échantillonnage, échéance) à TIMELINE_MISSING
+    """
+    count = max(1, math.ceil(duration / resolution))
+    timeline = {'resolution': resolution, 'encoding': TIMELINE_ENCODING, 'missing': TIMELINE_MISSING}
+    if windows[0].get('loudness_timeline') is not None:
+        momentary = array('h', [TIMELINE_MISSING]) * count
+        short_term = array('h', [TIMELINE_MISSING]) * count
+        for window in windows:
+            first, window_momentary, window_short_term = window['loudness_timeline']
+            for offset in range(min(len(window_momentary), count - first)):
+                index = first + offset
+                momentary[index] = max(momentary[index], window_momentary[offset])
+                short_term[index] = max(short_term[index], window_short_term[offset])
+        timeline['momentaryMax'] = encode_array(momentary)
+        timeline['shortTermMax'] = encode_array(short_term)
+    if windows[0].get('silences') is not None:
+        timeline['silences'] = merge_intervals(interval for window in windows for interval in window['silences'])
+    return timeline
@@ -0,0 +1,205 @@
+"""
+Soumissions idempotentes : une requête rejouée (nouvel essai client après un
+timeout) retrouve le batch d'origine au lieu de relancer les analyses
+
+La clé vient de l'en-tête Idempotency-Key, sinon (si IDEMPOTENCY_HASH_WINDOW_SECONDS
+est activée) de l'empreinte de la requête normalisée (fichiers, callback, options,
+priorité, query params) ; sans clé, chaque requête lance une analyse. Le premier
+appel réserve la clé (écriture conditionnelle), lance le batch puis enregistre
+sa réponse ; les appels suivants reçoivent cette réponse (en-tête
+Idempotent-Replayed), ou un 409 tant que le batch est en cours de lancement
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# Configuration du logging
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Table des requêtes (clé de partition idempotency_key, TTL expires_at) ;
+# idempotence désactivée si elle n'est pas configurée
+IDEMPOTENCY_TABLE_NAME = os.environ.get('IDEMPOTENCY_TABLE_NAME')
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# Conservation d'une réponse : clé explicite, empreinte de la requête (déduplication des
+# requêtes identiques sans clé, désactivée par défaut : une même URL soumise à nouveau,
+# fichier remplacé par exemple, doit être réanalysée ; 0 = désactivée)
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_HASH_WINDOW_SECONDS = int(os.environ.get('IDEMPOTENCY_HASH_WINDOW_SECONDS', '0'))
+# Réservation d'une requête en cours : au-delà du timeout du dispatcher, une
+# réservation jamais terminée (Lambda interrompue) peut être reprise
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '330'))
+# Réponse enregistrée compressée ; au-delà (limite d'un item DynamoDB : 400 Ko),
+# la clé est libérée et un nouvel essai relance le batch
+IDEMPOTENCY_MAX_RESPONSE_BYTES = 350000
+# Délai suggéré (Retry-After) à un nouvel essai pendant le lancement
+IDEMPOTENCY_RETRY_AFTER_SECONDS = 2
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+
+# Table créée au premier usage (l'émulateur local injecte la sienne)
+_table = None
+
+
+def get_table():
+    """Table des requêtes idempotentes, None si l'idempotence n'est pas configurée"""
+    global _table
+    if _table is None and IDEMPOTENCY_TABLE_NAME:
+        _table = boto3.resource('dynamodb').Table(IDEMPOTENCY_TABLE_NAME)
+    return _table
+
+
+def request_fingerprint(files_url, callback_url, options, priority, query_params):
+    """Empreinte SHA-256 de la requête normalisée (l'ordre des fichiers compte, pas celui des clés)"""
+    normalized = {
+        'files_url': files_url,
+        'callback_url': callback_url,
+        'options': options,
+        'priority': priority,
+        'query_params': query_params,
+    }
+    serialized = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def idempotency_key(headers, fingerprint):
+    """
+    Clé de la requête et durée de conservation : en-tête Idempotency-Key, sinon empreinte
+    si la déduplication par empreinte est activée, sinon (None, 0) : pas d'idempotence
+    ValueError si l'en-tête est vide ou trop long
+    """
+    for name, value in (headers or {}).items():
+        if name.lower() == IDEMPOTENCY_HEADER.lower():
+            value = str(value).strip()
+            if not value or len(value) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                raise ValueError(f"{IDEMPOTENCY_HEADER} doit contenir de 1 à {IDEMPOTENCY_KEY_MAX_LENGTH} caractères")
+            return f"key:{value}", IDEMPOTENCY_TTL_SECONDS
+    if IDEMPOTENCY_HASH_WINDOW_SECONDS <= 0:
+        return None, 0
+    return f"sha256:{fingerprint}", IDEMPOTENCY_HASH_WINDOW_SECONDS
+
+
+def claim_request(key, fingerprint, batch_id, ttl_seconds):
+    """
+    Réserve la clé pour ce lancement ; retourne None si la réservation est acquise
+    (ou si l'idempotence est désactivée ou sans clé), sinon l'enregistrement existant
+    """
+    table = get_table()
+    if table is None or key is None:
+        return None
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={
+                'idempotency_key': key,
+                'fingerprint': fingerprint,
+                'batch_id': batch_id,
+                'status': STATUS_IN_PROGRESS,
+                'locked_until': now + IDEMPOTENCY_LOCK_SECONDS,
+                'expires_at': now + max(ttl_seconds, IDEMPOTENCY_LOCK_SECONDS),
+            },
+            # Le TTL DynamoDB supprime les items en différé : un item expiré est réservable,
+            # comme une réservation abandonnée
+            ConditionExpression=(
+                Attr('idempotency_key').not_exists()
+                | Attr('expires_at').lt(now)
+                | (Attr('status').eq(STATUS_IN_PROGRESS) & Attr('locked_until').lt(now))
+            )
+        )
+        return None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+    record = table.get_item(Key={'idempotency_key': key}, ConsistentRead=True).get('Item')
+    # Enregistrement supprimé entre-temps (libération) : nouvelle tentative de réservation
+    return record if record is not None else claim_request(key, fingerprint, batch_id, ttl_seconds)
+
+
+def complete_request(key, fingerprint, batch_id, ttl_seconds, response):
+    """
+    Enregistre la réponse du lancement pour les nouveaux essais, tant que la
+    réservation appartient encore à ce batch (retourne False sinon)
+    """
+    table = get_table()
+    if table is None or key is None:
+        return True
+    body = gzip.compress(response['body'].encode('utf-8'))
+    if len(body) > IDEMPOTENCY_MAX_RESPONSE_BYTES:
+        logger.warning(f"Réponse du batch {batch_id} trop volumineuse pour l'idempotence ({len(body)} octets compressés), clé libérée")
+        return release_request(key, batch_id)
+    try:
+        table.put_item(
+            Item={
+                'idempotency_key': key,
+                'fingerprint': fingerprint,
+                'batch_id': batch_id,
+                'status': STATUS_COMPLETED,
+                'status_code': response['statusCode'],
+                'response_body': body,
+                'expires_at': int(time.time()) + ttl_seconds,
+            },
+            # Réservation expirée puis reprise par un autre lancement : sa réponse prévaut
+            ConditionExpression=Attr('batch_id').eq(batch_id)
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+    logger.warning(f"Réservation de la clé reprise par un autre lancement, réponse du batch {batch_id} non enregistrée")
+    return False
+
+
+def release_request(key, batch_id):
+    """
+    Libère la clé (lancement en échec) : un nouvel essai relancera le batch
+    Sans effet si la réservation a été reprise par un autre lancement (retourne False)
+    """
+    table = get_table()
+    if table is None or key is None:
+        return True
+    try:
+        table.delete_item(Key={'idempotency_key': key}, ConditionExpression=Attr('batch_id').eq(batch_id))
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+    return False
+
+
+def replayed_response(record, fingerprint):
+    """
+    Réponse à une requête dont la clé est déjà connue :
+    - 422 si la clé a servi pour une autre requête
+    - 409 (Retry-After) si le batch d'origine est en cours de lancement
+    - sinon la réponse d'origine, marquée Idempotent-Replayed
+    """
+    headers = {
+        'Content-Type': 'application/json; charset=utf-8',
+        'Access-Control-Allow-Origin': '*',
+    }
+    if record.get('fingerprint') != fingerprint:
+        body = {'error': f"{IDEMPOTENCY_HEADER} déjà utilisée pour une requête différente"}
+        return {'statusCode': 422, 'body': json.dumps(body, ensure_ascii=False), 'headers': headers}
+    if record.get('status') != STATUS_COMPLETED:
+        body = {
+            'error': 'Requête identique en cours de traitement, réessayer plus tard',
+            'batch_id': record.get('batch_id'),
+        }
+        headers['Retry-After'] = str(IDEMPOTENCY_RETRY_AFTER_SECONDS)
+        return {'statusCode': 409, 'body': json.dumps(body, ensure_ascii=False), 'headers': headers}
+
+    # DynamoDB renvoie les attributs binaires en objets Binary
+    stored = record['response_body']
+    body = gzip.decompress(bytes(getattr(stored, 'value', stored))).decode('utf-8')
+    headers['Idempotent-Replayed'] = 'true'
+    logger.info(f"Réponse rejouée pour le batch {record.get('batch_id')}")
+    return {'statusCode': int(record['status_code']), 'body': body, 'headers': headers}
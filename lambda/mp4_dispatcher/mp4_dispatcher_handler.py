@@ -5,13 +5,29 @@ import uuid
 import os
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from trace_context import TRACEPARENT_HEADER, TraceSpan, parse_traceparent
+from structured_log import is_debug_requested
+from internal_contract import decode_response, encode_task
+from analysis_options import request_options
+from idempotency import claim_request, complete_request, idempotency_key, release_request, replayed_response, request_fingerprint
 
 # Configuration du logging
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-# Client Lambda
-lambda_client = boto3.client('lambda')
+# Client Lambda créé au premier usage (l'émulateur local injecte le sien)
+_lambda_client = None
+
+# Voies de priorité : 'interactive' sur la fonction analyser principale (appels
+# synchrones de l'interface, petits lots asynchrones) et 'bulk' sur la fonction
+# analyser de masse (MP4_BULK_LAMBDA_NAME), dont la concurrence réservée plafonne
+# les reprises de masse ; ses invocations Event en attente patientent dans la file
+# interne de Lambda sans consommer la concurrence de la voie interactive
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BULK = 'bulk'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+# Taille maximum d'un lot asynchrone admis sur la voie interactive
+INTERACTIVE_ASYNC_MAX_FILES = int(os.environ.get('INTERACTIVE_ASYNC_MAX_FILES', '10'))
 
 def json_response(data, status_code=200):
     """Utilitaire pour créer des réponses JSON avec caractères accentués lisibles"""
@@ -24,15 +40,35 @@ def json_response(data, status_code=200):
         }
     }
 
+def get_lambda_client():
+    """Client Lambda partagé entre les invocations d'un même conteneur"""
+    global _lambda_client
+    if _lambda_client is None:
+        _lambda_client = boto3.client('lambda')
+    return _lambda_client
+
+
 def lambda_handler(event, context):
     """
     Handler pour lancer une ou plusieurs analyses MP4
     Supporte deux formats :
     1. Avec callback_url : mode asynchrone (lance et retourne immédiatement)
     2. Sans callback_url : mode synchrone (attend toutes les réponses)
+    Le span racine 'dispatcher.request' reprend l'en-tête traceparent entrant s'il existe
     """
     start_time = datetime.now()
-    
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    trace_id, parent_span_id = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+    with TraceSpan('dispatcher.request', trace_id, parent_span_id) as trace_span:
+        return handle_dispatch_request(event, start_time, trace_span)
+
+
+def handle_dispatch_request(event, start_time, trace_span):
+    """
+    Valide la requête et lance les analyses dans le mode demandé
+    Les tâches d'une requête partagent un batch_id ; une requête rejouée (même
+    Idempotency-Key ou requête identique) reçoit la réponse du batch d'origine
+    """
     try:
         # Parser le body de la requête
         if event.get('body'):
@@ -50,28 +86,107 @@ def lambda_handler(event, context):
             return json_response({'error': 'files_url est requis et doit contenir au moins une URL'}, 400)
         
         callback_url = request_data.get('callback_url')
+        trace_span.attributes['files'] = len(files_url)
         
-        if callback_url:
-            # Mode asynchrone : lancer les analyses et retourner immédiatement
-            return handle_async_mode(files_url, callback_url, query_params, start_time)
-        else:
-            # Mode synchrone : attendre toutes les réponses
-            return handle_sync_mode(files_url, query_params, start_time)
+        # Options d'analyse validées avec les règles de l'analyser (layer commun)
+        # et transmises normalisées à chaque analyse
+        try:
+            options = request_options(request_data)
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+        
+        # Voie de priorité (validée avant tout lancement)
+        try:
+            priority = request_priority(request_data, bool(callback_url), len(files_url))
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+        trace_span.attributes['priority'] = priority
+        
+        # En-tête X-Debug : logs de debug forcés pour toutes les analyses de la requête
+        debug = is_debug_requested(event.get('headers'))
+        
+        # Idempotence : la requête réserve sa clé avant de lancer quoi que ce soit
+        batch_id = str(uuid.uuid4())
+        fingerprint = request_fingerprint(files_url, callback_url, options, priority, query_params)
+        try:
+            key, ttl_seconds = idempotency_key(event.get('headers'), fingerprint)
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+        record = claim_request(key, fingerprint, batch_id, ttl_seconds)
+        if record is not None:
+            trace_span.attributes['idempotent_replay'] = True
+            trace_span.attributes['batch_id'] = record.get('batch_id')
+            return replayed_response(record, fingerprint)
+        trace_span.attributes['batch_id'] = batch_id
+        
+        try:
+            if callback_url:
+                # Mode asynchrone : lancer les analyses et retourner immédiatement
+                trace_span.attributes['mode'] = 'async'
+                response = handle_async_mode(files_url, callback_url, query_params, start_time, trace_span, debug, options, priority, batch_id)
+            else:
+                # Mode synchrone : attendre toutes les réponses
+                trace_span.attributes['mode'] = 'sync'
+                response = handle_sync_mode(files_url, query_params, start_time, trace_span, debug, options, batch_id)
+        except Exception:
+            release_request(key, batch_id)
+            raise
+        
+        # Lancement en échec : la clé est libérée pour qu'un nouvel essai relance le batch
+        try:
+            if response['statusCode'] >= 500:
+                release_request(key, batch_id)
+            else:
+                complete_request(key, fingerprint, batch_id, ttl_seconds, response)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'enregistrement de la réponse idempotente du batch {batch_id}: {str(e)}")
+        return response
             
     except Exception as e:
         logger.error(f"Erreur dans lambda_handler: {str(e)}")
         return json_response({'error': f'Erreur lors du lancement de l\'analyse: {str(e)}'}, 500)
 
 
-def handle_async_mode(files_url, callback_url, query_params, start_time):
+def request_priority(request_data, async_mode, file_count):
+    """
+    Voie de priorité de la requête (champ 'priority') :
+    - mode synchrone : toujours interactive ('bulk' refusé, l'appelant attend la réponse)
+    - mode asynchrone : interactive jusqu'à INTERACTIVE_ASYNC_MAX_FILES fichiers, 'bulk'
+      au-delà ou sur demande ; un gros lot demandé en interactive est admis en masse
+      pour préserver la marge des appels synchrones
+    """
+    priority = request_data.get('priority')
+    if priority is not None and priority not in PRIORITIES:
+        raise ValueError(f"priority doit être l'une des valeurs: {', '.join(PRIORITIES)}")
+    if not async_mode:
+        if priority == PRIORITY_BULK:
+            raise ValueError("priority 'bulk' n'est possible qu'en mode asynchrone (avec callback_url)")
+        return PRIORITY_INTERACTIVE
+    if priority == PRIORITY_BULK or file_count > INTERACTIVE_ASYNC_MAX_FILES:
+        if priority == PRIORITY_INTERACTIVE:
+            logger.warning(f"Lot de {file_count} fichiers admis en priorité bulk (interactive limitée à {INTERACTIVE_ASYNC_MAX_FILES})")
+        return PRIORITY_BULK
+    return PRIORITY_INTERACTIVE
+
+
+def analyser_function_name(priority=PRIORITY_INTERACTIVE):
+    """Fonction analyser de la voie (la fonction principale si aucune fonction de masse n'est configurée)"""
+    mp4_lambda_name = os.environ.get('MP4_LAMBDA_NAME')
+    if priority == PRIORITY_BULK:
+        mp4_lambda_name = os.environ.get('MP4_BULK_LAMBDA_NAME') or mp4_lambda_name
+    if not mp4_lambda_name:
+        raise ValueError("MP4_LAMBDA_NAME non configuré dans les variables d'environnement")
+    return mp4_lambda_name
+
+
+def handle_async_mode(files_url, callback_url, query_params, start_time, trace_span, debug=False, options=None, priority=PRIORITY_INTERACTIVE, batch_id=None):
     """
     Mode asynchrone : lance les analyses et retourne immédiatement
     Les résultats seront envoyés aux URLs de callback individuelles
+    Les analyses sont invoquées sur la fonction analyser de la voie de priorité
     """
     try:
-        mp4_lambda_name = os.environ.get('MP4_LAMBDA_NAME')
-        if not mp4_lambda_name:
-            raise ValueError("MP4_LAMBDA_NAME non configuré dans les variables d'environnement")
+        mp4_lambda_name = analyser_function_name(priority)
         
         launched_tasks = []
         
@@ -82,30 +197,27 @@ def handle_async_mode(files_url, callback_url, query_params, start_time):
             # Construire l'URL de callback avec l'UUID
             individual_callback_url = f"{callback_url.rstrip('/')}/{file_uuid}"
             
-            # Préparer les données pour la lambda MP4 analyser
-            task_data = {
-                'file_url': file_url,
-                'callback_url': individual_callback_url,
-                'task_id': file_uuid,
-                'query_params': query_params  # Ajouter les query params
-            }
-            
-            # Préparer le payload comme si c'était une requête API Gateway
-            payload = {
-                'httpMethod': 'POST',
-                'body': json.dumps(task_data),
-                'headers': {
-                    'Content-Type': 'application/json'
-                },
-                'queryStringParameters': query_params  # Passer aussi dans l'event
-            }
-            
-            # Invoquer la Lambda MP4 analyser de manière asynchrone
-            response = lambda_client.invoke(
-                FunctionName=mp4_lambda_name,
-                InvocationType='Event',  # Asynchrone
-                Payload=json.dumps(payload)
-            )
+            with trace_span.child('dispatcher.invoke', task_id=file_uuid, invocation_type='Event', priority=priority) as invoke_span:
+                # Préparer les données pour la lambda MP4 analyser
+                task_data = {
+                    'file_url': file_url,
+                    'callback_url': individual_callback_url,
+                    'task_id': file_uuid,
+                    'batch_id': batch_id,
+                    'query_params': query_params,  # Ajouter les query params
+                    'trace': invoke_span.payload_context(),
+                    'debug': debug,
+                    **(options or {})
+                }
+                
+                # Invoquer la Lambda MP4 analyser de manière asynchrone (contrat interne :
+                # tâche sérialisée une seule fois, contexte de trace dans 'trace')
+                response = get_lambda_client().invoke(
+                    FunctionName=mp4_lambda_name,
+                    InvocationType='Event',  # Asynchrone
+                    Payload=encode_task(task_data)
+                )
+                invoke_span.attributes['status_code'] = response['StatusCode']
             
             if response['StatusCode'] == 202:
                 launched_tasks.append({
@@ -130,8 +242,11 @@ def handle_async_mode(files_url, callback_url, query_params, start_time):
         return json_response({
             'message': f'{len(launched_tasks)} analyses lancées avec succès en mode asynchrone',
             'mode': 'async',
+            'priority': priority,
+            'batch_id': batch_id,
             'total_files': len(files_url),
             'dispatcher_processing_time': round(processing_time, 2),
+            'trace_id': trace_span.trace_id,
             'tasks': launched_tasks
         }, 202)
         
@@ -140,14 +255,12 @@ def handle_async_mode(files_url, callback_url, query_params, start_time):
         return json_response({'error': f'Erreur en mode asynchrone: {str(e)}'}, 500)
 
 
-def handle_sync_mode(files_url, query_params, start_time):
+def handle_sync_mode(files_url, query_params, start_time, trace_span, debug=False, options=None, batch_id=None):
     """
     Mode synchrone : lance les analyses en parallèle et attend toutes les réponses
     """
     try:
-        mp4_lambda_name = os.environ.get('MP4_LAMBDA_NAME')
-        if not mp4_lambda_name:
-            raise ValueError("MP4_LAMBDA_NAME non configuré dans les variables d'environnement")
+        mp4_lambda_name = analyser_function_name(PRIORITY_INTERACTIVE)
         
         results = []
         
@@ -161,7 +274,7 @@ def handle_sync_mode(files_url, query_params, start_time):
                 file_uuid = str(uuid.uuid4())
                 
                 # Soumettre la tâche
-                future = executor.submit(invoke_mp4_lambda_sync, mp4_lambda_name, file_url, file_uuid, query_params)
+                future = executor.submit(invoke_mp4_lambda_sync, mp4_lambda_name, file_url, file_uuid, query_params, trace_span, debug, options, batch_id)
                 future_to_file[future] = {'file_url': file_url, 'task_id': file_uuid}
             
             # Collecter les résultats
@@ -194,10 +307,12 @@ def handle_sync_mode(files_url, query_params, start_time):
         return json_response({
             'message': f'Traitement synchrone terminé: {successful} succès, {failed} échecs',
             'mode': 'sync',
+            'batch_id': batch_id,
             'total_files': len(files_url),
             'successful': successful,
             'failed': failed,
             'dispatcher_processing_time': round(processing_time, 2),
+            'trace_id': trace_span.trace_id,
             'results': results
         })
         
@@ -206,50 +321,48 @@ def handle_sync_mode(files_url, query_params, start_time):
         return json_response({'error': f'Erreur en mode synchrone: {str(e)}'}, 500)
 
 
-def invoke_mp4_lambda_sync(lambda_name, file_url, task_id, query_params):
+def invoke_mp4_lambda_sync(lambda_name, file_url, task_id, query_params, trace_span, debug=False, options=None, batch_id=None):
     """
     Invoque la Lambda MP4 analyser de manière synchrone et récupère le résultat
+    La durée du span 'dispatcher.invoke' couvre l'aller-retour complet de l'invocation
     """
     try:
-        # Préparer les données pour la lambda MP4 analyser
-        task_data = {
-            'file_url': file_url,
-            'task_id': task_id,
-            'query_params': query_params  # Ajouter les query params
-            # Pas de callback_url en mode synchrone
-        }
-        
-        # Préparer le payload comme si c'était une requête API Gateway
-        payload = {
-            'httpMethod': 'POST',
-            'body': json.dumps(task_data),
-            'headers': {
-                'Content-Type': 'application/json'
-            },
-            'queryStringParameters': query_params  # Passer aussi dans l'event
-        }
-        
-        # Invoquer la Lambda de manière synchrone
-        response = lambda_client.invoke(
-            FunctionName=lambda_name,
-            InvocationType='RequestResponse',  # Synchrone
-            Payload=json.dumps(payload)
-        )
-        
-        # Lire la réponse
-        response_payload = json.loads(response['Payload'].read())
+        with trace_span.child('dispatcher.invoke', task_id=task_id, invocation_type='RequestResponse') as invoke_span:
+            # Préparer les données pour la lambda MP4 analyser
+            task_data = {
+                'file_url': file_url,
+                'task_id': task_id,
+                'batch_id': batch_id,
+                'query_params': query_params,  # Ajouter les query params
+                'trace': invoke_span.payload_context(),
+                'debug': debug,
+                **(options or {})
+                # Pas de callback_url en mode synchrone
+            }
+            
+            # Invoquer la Lambda de manière synchrone (contrat interne : réponse
+            # {statusCode, data} décodée en une seule passe)
+            response = get_lambda_client().invoke(
+                FunctionName=lambda_name,
+                InvocationType='RequestResponse',  # Synchrone
+                Payload=encode_task(task_data)
+            )
+            
+            # Lire la réponse
+            response_payload = json.loads(response['Payload'].read())
+            invoke_span.attributes['status_code'] = response['StatusCode']
         
         if response['StatusCode'] == 200:
             # Parser la réponse de la lambda MP4
-            if response_payload.get('statusCode') == 200:
-                body = json.loads(response_payload.get('body', '{}'))
+            status_code, body = decode_response(response_payload)
+            if status_code == 200:
                 logger.info(f"Lambda MP4 exécutée avec succès pour {file_url}")
                 return {
                     'success': True,
                     'analysis_result': body
                 }
             else:
-                error_body = json.loads(response_payload.get('body', '{}'))
+                error_body = body
                 logger.error(f"Erreur dans la lambda MP4 pour {file_url}: {error_body}")
                 return {
                     'success': False,
@@ -268,3 +381,9 @@ def invoke_mp4_lambda_sync(lambda_name, file_url, task_id, query_params):
             'success': False,
             'error': str(e)
         }
+
+
+# Sur Lambda, le client est préinitialisé pendant la phase d'init du conteneur
+# (partagé par toutes les invocations) plutôt qu'à la première requête
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    get_lambda_client()
@@ -4,11 +4,14 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_dynamodb as dynamodb,
     aws_iam as iam,
+    aws_s3 as s3,
     RemovalPolicy,
     Duration,
     CfnOutput,
 )
 from constructs import Construct
+
+from mp4_small_analyser_cdk.lambda_assets import lambda_code
 import os
 
 
@@ -24,6 +27,18 @@ class CallbackStack(Stack):
         api_stage = os.getenv('API_GATEWAY_STAGE', 'prod')
         project_name = os.getenv('PROJECT_NAME', 'mp4-small-analyser')
         environment = os.getenv('ENVIRONMENT', 'dev')
+        max_wait_seconds = os.getenv('CALLBACK_MAX_WAIT_SECONDS', '20')
+        storage_mode = os.getenv('CALLBACK_STORAGE_MODE', 'latest')
+        history_max_versions = os.getenv('CALLBACK_HISTORY_MAX_VERSIONS', '0')
+        result_ttl_days = os.getenv('CALLBACK_RESULT_TTL_DAYS', '90')
+        offload_threshold_bytes = os.getenv('CALLBACK_OFFLOAD_THRESHOLD_BYTES', '102400')
+        api_cache_enabled = os.getenv('CALLBACK_API_CACHE_ENABLED', 'false').lower() == 'true'
+        api_cache_size = os.getenv('CALLBACK_API_CACHE_SIZE', '0.5')
+        api_cache_ttl = int(os.getenv('CALLBACK_API_CACHE_TTL_SECONDS', '60'))
+        # Partitions par statut de l'index des statuts (ne pas réduire sans réécrire les items)
+        status_index_shards = os.getenv('CALLBACK_STATUS_INDEX_SHARDS', '4')
+        # Callbacks 'processing' de l'analyser (même variable que la stack principale)
+        processing_callback = os.getenv('ANALYSER_PROCESSING_CALLBACK', 'false')
 
         # DynamoDB Table pour stocker les résultats des callbacks
         self.callback_results_table = dynamodb.Table(
@@ -42,7 +57,8 @@ class CallbackStack(Stack):
             point_in_time_recovery_specification=dynamodb.PointInTimeRecoverySpecification(
                 point_in_time_recovery_enabled=True
             ),
-            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+            time_to_live_attribute="expires_at"  # Expiration automatique des anciens résultats
         )
 
         # Index secondaire global pour rechercher par batch_id
@@ -58,17 +74,63 @@ class CallbackStack(Stack):
             )
         )
 
+        # Index secondaire global des statuts : "<statut>#<shard>" trié par réception,
+        # projeté sur les champs de résumé (pas les résultats d'analyse)
+        self.callback_results_table.add_global_secondary_index(
+            index_name="StatusTimeIndex",
+            partition_key=dynamodb.Attribute(
+                name="status_shard",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="status_at",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.INCLUDE,
+            non_key_attributes=["status", "file_url", "batch_id", "result_timestamp", "processing_time", "error_message", "trace_id"]
+        )
+
+        # Bucket S3 pour les résultats trop volumineux pour un item DynamoDB
+        self.results_bucket = s3.Bucket(
+            self, "CallbackResultsBucket",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            removal_policy=RemovalPolicy.DESTROY,  # Pour les tests uniquement
+            auto_delete_objects=True,
+            lifecycle_rules=[
+                s3.LifecycleRule(expiration=Duration.days(int(result_ttl_days)))
+            ] if int(result_ttl_days) > 0 else None
+        )
+
         # Fonction Lambda pour recevoir les callbacks
         self.callback_handler = _lambda.Function(
             self, "CallbackHandler",
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="callback_handler.lambda_handler",
-            code=_lambda.Code.from_asset("lambda/callback"),
+            code=lambda_code("lambda/callback"),
             timeout=Duration.seconds(lambda_timeout),
             memory_size=lambda_memory,
+            layers=[
+                _lambda.LayerVersion(
+                    self, "CommonLayer",
+                    code=lambda_code("lambda/layers/common"),
+                    compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+                    description="Modules Python partagés (contexte de trace, logs structurés, contrat interne, options d'analyse)"
+                )
+            ],
             environment={
                 "CALLBACK_TABLE_NAME": self.callback_results_table.table_name,
                 "BATCH_INDEX_NAME": "BatchIdIndex",
+                "STATUS_INDEX_NAME": "StatusTimeIndex",
+                "STATUS_INDEX_SHARDS": status_index_shards,
+                "PROCESSING_CALLBACK_ENABLED": processing_callback,
+                "MAX_WAIT_SECONDS": max_wait_seconds,
+                "STORAGE_MODE": storage_mode,
+                "HISTORY_MAX_VERSIONS": history_max_versions,
+                "RESULT_TTL_DAYS": result_ttl_days,
+                "RESULTS_BUCKET_NAME": self.results_bucket.bucket_name,
+                "OFFLOAD_THRESHOLD_BYTES": offload_threshold_bytes,
                 "PROJECT_NAME": project_name,
                 "ENVIRONMENT": environment
             },
@@ -78,22 +140,60 @@ class CallbackStack(Stack):
         # Permissions pour la Lambda d'écrire dans DynamoDB
         self.callback_results_table.grant_write_data(self.callback_handler)
         self.callback_results_table.grant_read_data(self.callback_handler)
+        self.results_bucket.grant_read_write(self.callback_handler)
 
         # API Gateway REST API
         self.api = apigw.RestApi(
             self, "CallbackApi",
             rest_api_name="MP4 Analyser Callback API",
             description="API pour recevoir les callbacks des analyses MP4",
+            # Les callbacks volumineux arrivent compressés (Content-Encoding: gzip) :
+            # le body JSON est transmis en base64 à la Lambda qui le décode
+            binary_media_types=["application/json"],
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
                 allow_methods=apigw.Cors.ALL_METHODS,
                 allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key"]
+            ),
+            # Cache API Gateway optionnel, activé méthode par méthode, chiffré. Il ignore
+            # Cache-Control et garde toute réponse 200 pendant le TTL : il ne couvre donc que
+            # GET /callback/{task_id}/final (clé : task_id, history, resolve), qui ne répond 200
+            # qu'avec un résultat terminé. GET /callback/{task_id} (en cours, ?wait=N), le statut
+            # par plage de temps et les batchs restent toujours servis par la Lambda
+            deploy_options=apigw.StageOptions(
+                stage_name=api_stage,
+                cache_cluster_enabled=api_cache_enabled,
+                cache_cluster_size=api_cache_size if api_cache_enabled else None,
+                caching_enabled=False,
+                method_options={
+                    "/callback/{task_id}/final/GET": apigw.MethodDeploymentOptions(
+                        caching_enabled=True,
+                        cache_ttl=Duration.seconds(api_cache_ttl),
+                        cache_data_encrypted=True
+                    )
+                } if api_cache_enabled else None
             )
         )
 
         # Resource /callback
         callback_resource = self.api.root.add_resource("callback")
         
+        # GET /callback?status=...&from=...&to=... - Tâches d'un statut sur une plage de temps
+        callback_resource.add_method(
+            "GET",
+            apigw.LambdaIntegration(
+                self.callback_handler,
+                proxy=True
+            ),
+            request_parameters={
+                "method.request.querystring.status": True,
+                "method.request.querystring.from": False,
+                "method.request.querystring.to": False,
+                "method.request.querystring.limit": False,
+                "method.request.querystring.next_token": False
+            }
+        )
+
         # Resource /callback/{task_id}
         task_resource = callback_resource.add_resource("{task_id}")
 
@@ -128,7 +228,32 @@ class CallbackStack(Stack):
             apigw.LambdaIntegration(
                 self.callback_handler,
                 proxy=True
-            )
+            ),
+            request_parameters={
+                "method.request.path.task_id": True,
+                "method.request.querystring.history": False,
+                "method.request.querystring.resolve": False,
+                "method.request.querystring.wait": False
+            }
+        )
+
+        # GET /callback/{task_id}/final - Résultat terminé uniquement (409 sinon, sans attente),
+        # seule route pouvant être mise en cache par API Gateway
+        task_resource.add_resource("final").add_method(
+            "GET",
+            apigw.LambdaIntegration(
+                self.callback_handler,
+                proxy=True,
+                cache_key_parameters=[
+                    "method.request.path.task_id", "method.request.querystring.history",
+                    "method.request.querystring.resolve"
+                ]
+            ),
+            request_parameters={
+                "method.request.path.task_id": True,
+                "method.request.querystring.history": False,
+                "method.request.querystring.resolve": False
+            }
         )
 
         # Resource /callback/batch/{batch_id}
@@ -140,7 +265,12 @@ class CallbackStack(Stack):
             apigw.LambdaIntegration(
                 self.callback_handler,
                 proxy=True
-            )
+            ),
+            request_parameters={
+                "method.request.path.batch_id": True,
+                "method.request.querystring.expected": False,
+                "method.request.querystring.resolve": False
+            }
         )
 
         # Export de l'URL de l'API
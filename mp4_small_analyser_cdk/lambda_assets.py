@@ -0,0 +1,12 @@
+from aws_cdk import aws_lambda as _lambda
+
+# Fichiers exclus des assets Lambda et des layers : bytecode compilé sur la machine
+# de packaging (version de Python différente du runtime, donc inutilisable) et
+# tests embarqués dans les paquets. Des archives plus petites se téléchargent et
+# s'extraient plus vite au démarrage à froid.
+LAMBDA_ASSET_EXCLUDE = ["**/__pycache__", "**/*.pyc", "**/tests"]
+
+
+def lambda_code(path):
+    """Code d'une Lambda ou d'un layer sans les fichiers inutiles à l'exécution"""
+    return _lambda.Code.from_asset(path, exclude=LAMBDA_ASSET_EXCLUDE)
@@ -5,53 +5,219 @@ from aws_cdk import (
     aws_lambda as _lambda,
     aws_apigateway as apigw,
     aws_iam as iam,
+    aws_sqs as sqs,
+    aws_s3 as s3,
+    aws_dynamodb as dynamodb,
+    RemovalPolicy,
+    aws_lambda_event_sources as lambda_event_sources,
 )
 from constructs import Construct
+import os
+
+from mp4_small_analyser_cdk.lambda_assets import lambda_code
 
 class Mp4SmallAnalyserCdkStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # Configuration des logs de l'analyser
+        debug_sample_rate = os.getenv('ANALYSER_DEBUG_SAMPLE_RATE', '0.01')
+        log_max_lines = os.getenv('ANALYSER_LOG_MAX_LINES', '50')
+        # Palier de mémoire de l'analyser (la part de vCPU en découle : 1769 Mo = 1 vCPU),
+        # à choisir avec benchmarks.memory_sweep
+        analyser_memory_size = int(os.getenv('ANALYSER_MEMORY_SIZE', '2048'))
+        # Limites de débit des téléchargements par hôte d'origine ("hôte=requêtes/s[:rafale],...")
+        download_rate_limits = os.getenv('ANALYSER_DOWNLOAD_RATE_LIMITS', '')
+        download_default_rate = os.getenv('ANALYSER_DOWNLOAD_DEFAULT_RATE', '0')
+        # Callback 'processing' au début de chaque analyse asynchrone (tâches en cours interrogeables)
+        processing_callback = os.getenv('ANALYSER_PROCESSING_CALLBACK', 'false')
+        # Buckets lisibles par l'analyser pour les entrées s3:// ("bucket" ou "bucket/préfixe",
+        # séparés par des virgules), taille des plages et lectures parallèles
+        input_buckets = [entry.strip() for entry in os.getenv('ANALYSER_INPUT_BUCKETS', '').split(',') if entry.strip()]
+        s3_download_part_mb = os.getenv('ANALYSER_S3_DOWNLOAD_PART_MB', '8')
+        s3_download_concurrency = os.getenv('ANALYSER_S3_DOWNLOAD_CONCURRENCY', '8')
+        # Voies de priorité : concurrence réservée de l'analyser interactif (marge garantie
+        # aux appels synchrones, qui la plafonne aussi ; 0 = non réservée, soumise aux limites
+        # du compte) et de l'analyser de masse (plafond des gros lots asynchrones), âge
+        # maximum d'une invocation de masse en attente dans la file de Lambda
+        interactive_concurrency = int(os.getenv('ANALYSER_INTERACTIVE_CONCURRENCY', '50'))
+        bulk_concurrency = int(os.getenv('ANALYSER_BULK_CONCURRENCY', '20'))
+        bulk_max_event_age_hours = int(os.getenv('ANALYSER_BULK_MAX_EVENT_AGE_HOURS', '6'))
+        interactive_async_max_files = os.getenv('INTERACTIVE_ASYNC_MAX_FILES', '10')
+        # Idempotence des soumissions : conservation des réponses (clé Idempotency-Key)
+        # et fenêtre de déduplication des requêtes identiques sans clé (0 = désactivée)
+        idempotency_ttl_seconds = os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400')
+        idempotency_hash_window_seconds = os.getenv('IDEMPOTENCY_HASH_WINDOW_SECONDS', '0')
+
         # Créer notre propre Lambda Layer pour ffmpeg et requests
         ffmpeg_layer = _lambda.LayerVersion(
             self, "FFmpegLayer",
-            code=_lambda.Code.from_asset("lambda/layers/ffmpeg"),
+            code=lambda_code("lambda/layers/ffmpeg"),
             compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
-            description="FFmpeg et FFprobe binaires avec le package requests pour Python"
+            description="FFmpeg et FFprobe binaires"
         )
 
-        # Lambda pour l'analyse MP4 individuelle (travailleur)
-        self.mp4_analyser_lambda = _lambda.Function(
-            self, "MP4AnalyserFunction",
+        # Layer des dépendances Python tierces (requests), séparé des binaires ffmpeg
+        # pour les fonctions qui n'en ont pas besoin ; préparé par prepare_ffmpeg_layer.sh
+        requests_layer = _lambda.LayerVersion(
+            self, "RequestsLayer",
+            code=lambda_code("lambda/layers/requests"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+            description="Package requests pour Python"
+        )
+
+        # Layer des modules Python partagés entre les Lambdas (propagation de trace,
+        # contrat interne, options d'analyse validées par le dispatcher et l'analyser)
+        common_layer = _lambda.LayerVersion(
+            self, "CommonLayer",
+            code=lambda_code("lambda/layers/common"),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_12],
+            description="Modules Python partagés (contexte de trace, logs structurés, contrat interne, options d'analyse)"
+        )
+
+        # File de reprise des callbacks non délivrés (destinataire indisponible)
+        callback_retry_dlq = sqs.Queue(
+            self, "CallbackRetryDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        self.callback_retry_queue = sqs.Queue(
+            self, "CallbackRetryQueue",
+            visibility_timeout=Duration.minutes(12),  # 6x le timeout de la Lambda de reprise
+            retention_period=Duration.days(4),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=10,
+                queue=callback_retry_dlq
+            )
+        )
+
+        # Bucket S3 des résultats synchrones trop volumineux pour une réponse Lambda
+        # et des callbacks en reprise trop volumineux pour un message SQS (256 Ko)
+        self.sync_results_bucket = s3.Bucket(
+            self, "SyncResultsBucket",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            enforce_ssl=True,
+            removal_policy=RemovalPolicy.DESTROY,
+            auto_delete_objects=True,
+            lifecycle_rules=[
+                s3.LifecycleRule(prefix="sync-results/", expiration=Duration.days(1)),  # Résultats transitoires
+                # Callbacks en reprise : conservés aussi longtemps que leur message (file puis DLQ)
+                s3.LifecycleRule(prefix="callback-retry/", expiration=Duration.days(18))
+            ]
+        )
+
+        # Table des soumissions idempotentes du dispatcher (réponses rejouées aux nouveaux essais)
+        self.idempotency_table = dynamodb.Table(
+            self, "IdempotencyTable",
+            partition_key=dynamodb.Attribute(
+                name="idempotency_key",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,  # Données transitoires
+            time_to_live_attribute="expires_at"
+        )
+
+        # Configuration commune aux fonctions analyser (voies interactive et de masse)
+        analyser_props = dict(
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="mp4_analyser_handler.lambda_handler",
-            code=_lambda.Code.from_asset("lambda/mp4_analyser"),
+            code=lambda_code("lambda/mp4_analyser"),
             timeout=Duration.minutes(2),  # 2 minutes pour les analyses plus longues
-            memory_size=2048,  # Plus de mémoire pour ffmpeg et téléchargement
-            layers=[ffmpeg_layer],  # Ajouter le layer ffmpeg
+            memory_size=analyser_memory_size,  # Mémoire et vCPU pour ffmpeg et téléchargement
+            layers=[ffmpeg_layer, requests_layer, common_layer],
             environment={
                 'LOG_LEVEL': 'INFO',
-                'DEBUG': 'true'
+                # Logs de debug pour une part des tâches seulement (en-tête X-Debug pour forcer)
+                'DEBUG_SAMPLE_RATE': debug_sample_rate,
+                'LOG_MAX_LINES': log_max_lines,
+                'DOWNLOAD_RATE_LIMITS': download_rate_limits,
+                'DOWNLOAD_DEFAULT_RATE': download_default_rate,
+                'PROCESSING_CALLBACK_ENABLED': processing_callback,
+                'S3_DOWNLOAD_PART_MB': s3_download_part_mb,
+                'S3_DOWNLOAD_CONCURRENCY': s3_download_concurrency,
+                'CALLBACK_RETRY_QUEUE_URL': self.callback_retry_queue.queue_url,
+                'RESULTS_BUCKET_NAME': self.sync_results_bucket.bucket_name
             }
         )
 
+        # Lambda pour l'analyse MP4 individuelle (travailleur, voie interactive)
+        self.mp4_analyser_lambda = _lambda.Function(
+            self, "MP4AnalyserFunction",
+            reserved_concurrent_executions=interactive_concurrency or None,
+            **analyser_props
+        )
+
+        # Lambda analyser de masse (gros lots asynchrones) : concurrence plafonnée, les
+        # invocations au-delà attendent dans la file asynchrone de Lambda ; pas de nouvel
+        # essai automatique (les échecs sont déjà signalés par callback)
+        self.mp4_bulk_analyser_lambda = _lambda.Function(
+            self, "MP4BulkAnalyserFunction",
+            reserved_concurrent_executions=bulk_concurrency or None,
+            max_event_age=Duration.hours(bulk_max_event_age_hours),
+            retry_attempts=0,
+            **analyser_props
+        )
+        for analyser_lambda in (self.mp4_analyser_lambda, self.mp4_bulk_analyser_lambda):
+            self.sync_results_bucket.grant_read_write(analyser_lambda)
+            self.callback_retry_queue.grant_send_messages(analyser_lambda)
+
+        # Lecture des entrées s3:// : limitée aux buckets (et préfixes) configurés
+        for index, entry in enumerate(input_buckets):
+            bucket_name, _, prefix = entry.partition('/')
+            input_bucket = s3.Bucket.from_bucket_name(self, f"InputBucket{index}", bucket_name)
+            for analyser_lambda in (self.mp4_analyser_lambda, self.mp4_bulk_analyser_lambda):
+                input_bucket.grant_read(analyser_lambda, f"{prefix}*" if prefix else '*')
+
+        # Lambda de reprise des callbacks (même code que l'analyser, sans ffmpeg)
+        self.callback_retry_lambda = _lambda.Function(
+            self, "CallbackRetryFunction",
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            handler="callback_delivery.retry_handler",
+            code=lambda_code("lambda/mp4_analyser"),
+            timeout=Duration.minutes(2),
+            memory_size=256,
+            layers=[requests_layer, common_layer],  # requests seul, sans les binaires ffmpeg
+            environment={
+                'LOG_LEVEL': 'INFO'
+            }
+        )
+        # Callbacks volumineux déposés dans S3 : relus puis supprimés après livraison
+        self.sync_results_bucket.grant_read(self.callback_retry_lambda, "callback-retry/*")
+        self.sync_results_bucket.grant_delete(self.callback_retry_lambda, "callback-retry/*")
+        self.callback_retry_lambda.add_event_source(
+            lambda_event_sources.SqsEventSource(
+                self.callback_retry_queue,
+                batch_size=5,
+                report_batch_item_failures=True
+            )
+        )
+
         # Lambda dispatcher pour lancer les analyses MP4 (synchrone ou asynchrone)
         self.mp4_dispatcher_lambda = _lambda.Function(
             self, "MP4DispatcherFunction",
             runtime=_lambda.Runtime.PYTHON_3_12,
             handler="mp4_dispatcher_handler.lambda_handler",
-            code=_lambda.Code.from_asset("lambda/mp4_dispatcher"),
+            code=lambda_code("lambda/mp4_dispatcher"),
             timeout=Duration.minutes(5),  # Plus de temps pour le mode synchrone
             memory_size=512,  # Plus de mémoire pour gérer plusieurs invocations
+            layers=[common_layer],
             environment={
                 'MP4_LAMBDA_NAME': self.mp4_analyser_lambda.function_name,
+                'MP4_BULK_LAMBDA_NAME': self.mp4_bulk_analyser_lambda.function_name,
+                'INTERACTIVE_ASYNC_MAX_FILES': interactive_async_max_files,
+                'IDEMPOTENCY_TABLE_NAME': self.idempotency_table.table_name,
+                'IDEMPOTENCY_TTL_SECONDS': idempotency_ttl_seconds,
+                'IDEMPOTENCY_HASH_WINDOW_SECONDS': idempotency_hash_window_seconds,
                 'LOG_LEVEL': 'INFO'
             }
         )
+        self.idempotency_table.grant_read_write_data(self.mp4_dispatcher_lambda)
 
-        # Permissions pour que le dispatcher puisse invoquer la lambda analyser
+        # Permissions pour que le dispatcher puisse invoquer les lambdas analyser
         self.mp4_analyser_lambda.grant_invoke(self.mp4_dispatcher_lambda)
+        self.mp4_bulk_analyser_lambda.grant_invoke(self.mp4_dispatcher_lambda)
 
         # API Gateway
         self.api = apigw.RestApi(
@@ -61,7 +227,7 @@ class Mp4SmallAnalyserCdkStack(Stack):
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
                 allow_methods=apigw.Cors.ALL_METHODS,
-                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key"]
+                allow_headers=["Content-Type", "X-Amz-Date", "Authorization", "X-Api-Key", "X-Debug", "Idempotency-Key"]
             )
         )
 
@@ -88,6 +254,12 @@ class Mp4SmallAnalyserCdkStack(Stack):
             description="Nom de la Lambda MP4 analyser"
         )
 
+        CfnOutput(
+            self, "MP4BulkAnalyserLambdaName",
+            value=self.mp4_bulk_analyser_lambda.function_name,
+            description="Nom de la Lambda MP4 analyser de masse (gros lots asynchrones)"
+        )
+
         CfnOutput(
             self, "MP4DispatcherLambdaName", 
             value=self.mp4_dispatcher_lambda.function_name,
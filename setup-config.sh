@@ -156,6 +156,7 @@ ask_with_default "Stage API Gateway" "prod" "API_GATEWAY_STAGE"
 # Configuration Lambda
 ask_with_default "Timeout Lambda (secondes)" "30" "LAMBDA_TIMEOUT"
 ask_with_default "Mémoire Lambda (MB)" "256" "LAMBDA_MEMORY_SIZE"
+ask_with_default "Mémoire de l'analyser (MB, fixe aussi sa part de vCPU)" "2048" "ANALYSER_MEMORY_SIZE"
 
 # Configuration de debug
 echo "Mode debug:"
@@ -218,6 +219,7 @@ API_GATEWAY_STAGE=$API_GATEWAY_STAGE
 # Configuration Lambda
 LAMBDA_TIMEOUT=$LAMBDA_TIMEOUT
 LAMBDA_MEMORY_SIZE=$LAMBDA_MEMORY_SIZE
+ANALYSER_MEMORY_SIZE=$ANALYSER_MEMORY_SIZE
 
 # Configuration de débogage
 DEBUG_MODE=$DEBUG_MODE
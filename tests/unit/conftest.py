@@ -0,0 +1,15 @@
+import os
+import sys
+
+# Modules des Lambdas importés comme dans leur runtime : code de la fonction et layer commun
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for path in ('lambda/layers/common/python', 'lambda/mp4_analyser', 'lambda/mp4_dispatcher', 'lambda/callback'):
+    sys.path.insert(0, os.path.join(REPO_ROOT, path))
+
+# Variables lues à l'import des handlers (les tables sont remplacées par des MemoryTable)
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('CALLBACK_TABLE_NAME', 'CallbackResults')
+os.environ.setdefault('BATCH_INDEX_NAME', 'BatchIdIndex')
+os.environ.setdefault('STATUS_INDEX_NAME', 'StatusTimeIndex')
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import analysis_options
+import mp4_analyser_handler
+import mp4_dispatcher_handler
+
+
+def test_request_options_are_normalized():
+    options = analysis_options.request_options({'profile': 'approximate', 'metrics': 'Video, duration', 'timeline': True})
+    assert options == {'profile': 'approximate', 'metrics': ['duration', 'video'], 'timeline': 1.0}
+    assert analysis_options.request_options({'metrics': [], 'timeline': False}) == {}
+
+
+@pytest.mark.parametrize('request_data,message', [
+    ({'profile': 'fast'}, 'profile doit être'),
+    ({'metrics': ['loudness', 'peak']}, 'metrics inconnues: peak'),
+    ({'metrics': 5}, 'metrics doit être une liste'),
+    ({'metrics': {'loudness': True}}, 'metrics doit être une liste'),
+    ({'timeline': 0.05}, "d'au moins 0.1s"),
+    ({'timeline': 'toujours'}, 'timeline doit être'),
+])
+def test_dispatcher_rejects_like_the_analyser(request_data, message):
+    with pytest.raises(ValueError, match=message):
+        analysis_options.request_options(request_data)
+    body = json.dumps({'files_url': ['https://example.com/a.mp4'], **request_data})
+    response = mp4_dispatcher_handler.lambda_handler({'body': body}, None)
+    assert response['statusCode'] == 400
+    assert message in response['body']
+
+
+def test_analyser_defaults():
+    assert analysis_options.parse_profile(None) == analysis_options.PROFILE_FULL
+    assert analysis_options.parse_metrics(None) == analysis_options.DEFAULT_METRICS
+    assert analysis_options.parse_timeline_option('0.5') == 0.5
+
+
+def test_analyser_rejects_invalid_metrics_type():
+    response = mp4_analyser_handler.lambda_handler({'body': json.dumps({'file_url': 'https://example.com/a.mp4', 'metrics': 5})}, None)
+    assert response['statusCode'] == 400
+    assert 'metrics doit être une liste' in response['body']
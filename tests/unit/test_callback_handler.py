@@ -0,0 +1,138 @@
+import json
+from collections import OrderedDict
+
+import pytest
+
+import callback_handler
+from tools.memory_table import MemoryTable
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = MemoryTable(indexes={
+        callback_handler.batch_index_name: ('batch_id', 'timestamp'),
+        callback_handler.status_index_name: ('status_shard', 'status_at'),
+    })
+    monkeypatch.setattr(callback_handler, '_table', table)
+    monkeypatch.setattr(callback_handler, '_result_cache', OrderedDict())
+    monkeypatch.setattr(callback_handler, 'STORAGE_MODE', 'latest')
+    monkeypatch.setattr(callback_handler, 'HISTORY_MAX_VERSIONS', 0)
+    monkeypatch.setattr(callback_handler, 'RESULTS_BUCKET_NAME', None)
+    return table
+
+
+def post_callback(task_id, status, **metadata):
+    event = {
+        'pathParameters': {'task_id': task_id},
+        'headers': {},
+        'body': json.dumps({'status': status, 'task_id': task_id, 'metadata': metadata}),
+    }
+    response = callback_handler.handle_callback_post(event, None)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['stored']
+
+
+def status_query(**params):
+    response = callback_handler.handle_status_query({'queryStringParameters': params, 'headers': {}}, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_older_callback_does_not_overwrite_newer_result(table):
+    assert post_callback('t1', 'completed', processed_at='2026-01-01T00:00:02')
+    # Callback 'processing' rejoué après le résultat final
+    assert not post_callback('t1', 'processing', started_at='2026-01-01T00:00:01')
+    latest = table.items[('t1', callback_handler.LATEST_SORT_KEY)]
+    assert latest['status'] == 'completed'
+    assert latest['status_shard'].startswith('completed#')
+
+
+def test_newer_or_replayed_callback_is_stored(table):
+    assert post_callback('t1', 'failed', failed_at='2026-01-01T00:00:01')
+    assert post_callback('t1', 'failed', failed_at='2026-01-01T00:00:01')
+    assert post_callback('t1', 'completed', processed_at='2026-01-01T00:00:05')
+    assert table.items[('t1', callback_handler.LATEST_SORT_KEY)]['status'] == 'completed'
+
+
+def test_append_mode_keeps_rows_out_of_status_index(table, monkeypatch):
+    monkeypatch.setattr(callback_handler, 'STORAGE_MODE', 'append')
+    post_callback('t1', 'failed', failed_at='2026-01-01T00:00:01')
+    assert all('status_shard' not in item for item in table.items.values())
+    code, body = status_query(status='failed')
+    assert code == 400
+    assert 'latest' in body['error']
+
+
+def test_next_token_round_trip():
+    positions = {'0': {}, '2': {'task_id': 't1', 'timestamp': 'LATEST', 'status_shard': 'failed#2', 'status_at': '2026-01-01T00:00:00'}}
+    token = callback_handler.encode_next_token('2026-01-01T00:00:00', '2026-01-02T00:00:00', positions)
+    assert callback_handler.decode_next_token(token) == ('2026-01-01T00:00:00', '2026-01-02T00:00:00', positions)
+    assert callback_handler.encode_next_token('a', 'b', {}) is None
+
+
+@pytest.mark.parametrize('token', ['abc', 'e30=', 'eyJmcm9tIjoxLCJ0byI6Miwic2hhcmRzIjp7fX0='])
+def test_invalid_next_token(token):
+    with pytest.raises(ValueError, match='next_token'):
+        callback_handler.decode_next_token(token)
+
+
+def test_status_query_pages_across_shards(table):
+    for index in range(7):
+        post_callback(f"task-{index}", 'completed', processed_at=f"2026-01-01T00:00:0{index}")
+    post_callback('other', 'failed', failed_at='2026-01-01T00:00:00')
+
+    seen, token, pages = [], None, 0
+    while True:
+        params = {'status': 'completed', 'from': '-1h', 'limit': '3'}
+        if token:
+            params['next_token'] = token
+        code, body = status_query(**params)
+        assert code == 200
+        status_at = [item['status_at'] for item in body['items']]
+        assert status_at == sorted(status_at, reverse=True)
+        seen += [item['task_id'] for item in body['items']]
+        pages += 1
+        token = body['next_token']
+        if not token:
+            break
+    assert sorted(seen) == [f"task-{index}" for index in range(7)]
+    assert pages == 3
+
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'abc', '1.5', '201', '²', '٣'])
+def test_status_query_rejects_invalid_limit(table, limit):
+    code, body = status_query(status='failed', limit=limit)
+    assert code == 400
+    assert body['error'] == f"Le paramètre limit doit être un entier entre 1 et {callback_handler.STATUS_QUERY_MAX_LIMIT}"
+
+
+def test_batch_get_rejects_invalid_expected(table):
+    event = {'pathParameters': {'batch_id': 'b1'}, 'queryStringParameters': {'expected': 'trois'}, 'headers': {}}
+    response = callback_handler.handle_batch_get(event, None)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'Le paramètre expected doit être un entier positif'
+
+
+def test_presigned_links_are_not_immutable():
+    event = {'headers': {}}
+    immutable = callback_handler.conditional_json_response(event, {}, '"e"', cacheable=True)
+    links = callback_handler.conditional_json_response(event, {}, '"e"', cacheable=True, presigned_links=True)
+    assert 'immutable' in immutable['headers']['Cache-Control']
+    assert links['headers']['Cache-Control'] == f"private, max-age={callback_handler.PRESIGNED_LINK_MAX_AGE_SECONDS}"
+    assert callback_handler.PRESIGNED_LINK_MAX_AGE_SECONDS < callback_handler.PRESIGNED_URL_EXPIRES_SECONDS
+
+
+def test_final_route_serves_only_terminal_results(table):
+    event = {
+        'httpMethod': 'GET', 'path': '/callback/t1/final', 'pathParameters': {'task_id': 't1'},
+        'queryStringParameters': {'wait': '20'}, 'headers': {},
+    }
+    post_callback('t1', 'processing', started_at='2026-01-01T00:00:01')
+    response = callback_handler.lambda_handler(event, None)
+    assert response['statusCode'] == 409
+    assert response['headers']['Cache-Control'] == 'no-store'
+    assert json.loads(response['body'])['status'] == 'processing'
+
+    post_callback('t1', 'completed', processed_at='2026-01-01T00:00:05')
+    response = callback_handler.lambda_handler(event, None)
+    assert response['statusCode'] == 200
+    assert 'waited_seconds' not in json.loads(response['body'])
@@ -0,0 +1,69 @@
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+
+from mp4_small_analyser_cdk.callback_stack import CallbackStack
+
+
+@pytest.fixture(scope="module")
+def template():
+    app = core.App()
+    stack = CallbackStack(app, "mp4-analyser-callback-assertions")
+    return assertions.Template.from_stack(stack)
+
+
+def test_status_time_index(template):
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "GlobalSecondaryIndexes": assertions.Match.array_with([
+            assertions.Match.object_like({"IndexName": "BatchIdIndex"}),
+            assertions.Match.object_like({
+                "IndexName": "StatusTimeIndex",
+                "KeySchema": [
+                    {"AttributeName": "status_shard", "KeyType": "HASH"},
+                    {"AttributeName": "status_at", "KeyType": "RANGE"}
+                ],
+                "Projection": assertions.Match.object_like({"ProjectionType": "INCLUDE"})
+            })
+        ])
+    })
+
+
+def test_status_query_route(template):
+    template.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "GET",
+        "RequestParameters": assertions.Match.object_like({"method.request.querystring.status": True})
+    })
+
+
+def test_stage_cache_disabled_by_default(template):
+    template.has_resource_properties("AWS::ApiGateway::Stage", {
+        "CacheClusterEnabled": False,
+        "MethodSettings": [assertions.Match.object_like({"HttpMethod": "*", "ResourcePath": "/*", "CachingEnabled": False})]
+    })
+
+
+def test_cache_limited_to_final_task_get(monkeypatch):
+    monkeypatch.setenv("CALLBACK_API_CACHE_ENABLED", "true")
+    app = core.App()
+    template = assertions.Template.from_stack(CallbackStack(app, "mp4-analyser-callback-cache"))
+    # Seul le résultat terminé est mis en cache : ni GET /callback/{task_id} (en cours, wait)
+    template.has_resource_properties("AWS::ApiGateway::Stage", {
+        "CacheClusterEnabled": True,
+        "MethodSettings": [
+            assertions.Match.object_like({"HttpMethod": "*", "ResourcePath": "/*", "CachingEnabled": False}),
+            assertions.Match.object_like({
+                "HttpMethod": "GET",
+                "ResourcePath": "/~1callback~1{task_id}~1final",
+                "CachingEnabled": True,
+                "CacheDataEncrypted": True
+            })
+        ]
+    })
+    cached = [
+        method["Properties"]
+        for method in template.find_resources("AWS::ApiGateway::Method", {"Properties": {"HttpMethod": "GET"}}).values()
+        if method["Properties"].get("Integration", {}).get("CacheKeyParameters")
+    ]
+    assert len(cached) == 1
+    assert "method.request.querystring.wait" not in cached[0]["RequestParameters"]
+    assert "method.request.querystring.wait" not in cached[0]["Integration"]["CacheKeyParameters"]
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+import idempotency
+from tools.memory_table import MemoryTable
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = MemoryTable(hash_key='idempotency_key', range_key=None)
+    monkeypatch.setattr(idempotency, '_table', table)
+    return table
+
+
+def launch_response(batch_id):
+    return {'statusCode': 200, 'body': json.dumps({'message': 'Analyse lancée', 'batch_id': batch_id})}
+
+
+def test_key_from_header_or_fingerprint(monkeypatch):
+    assert idempotency.idempotency_key({'idempotency-key': ' abc '}, 'f') == ('key:abc', idempotency.IDEMPOTENCY_TTL_SECONDS)
+    # Sans clé, pas de déduplication tant que la fenêtre d'empreinte n'est pas activée
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_HASH_WINDOW_SECONDS', 0)
+    assert idempotency.idempotency_key({}, 'f') == (None, 0)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_HASH_WINDOW_SECONDS', 600)
+    assert idempotency.idempotency_key({}, 'f') == ('sha256:f', 600)
+    with pytest.raises(ValueError):
+        idempotency.idempotency_key({'Idempotency-Key': 'x' * 256}, 'f')
+
+
+def test_fingerprint_ignores_option_key_order():
+    first = idempotency.request_fingerprint(['u1', 'u2'], 'cb', {'a': 1, 'b': 2}, 'interactive', {})
+    second = idempotency.request_fingerprint(['u1', 'u2'], 'cb', {'b': 2, 'a': 1}, 'interactive', {})
+    reordered = idempotency.request_fingerprint(['u2', 'u1'], 'cb', {'a': 1, 'b': 2}, 'interactive', {})
+    assert first == second
+    assert first != reordered
+
+
+def test_claim_then_replay_completed_response(table):
+    assert idempotency.claim_request('key:k', 'f', 'batch-1', 3600) is None
+    assert idempotency.complete_request('key:k', 'f', 'batch-1', 3600, launch_response('batch-1'))
+
+    record = idempotency.claim_request('key:k', 'f', 'batch-2', 3600)
+    assert record['batch_id'] == 'batch-1'
+    replay = idempotency.replayed_response(record, 'f')
+    assert replay['statusCode'] == 200
+    assert replay['headers']['Idempotent-Replayed'] == 'true'
+    assert json.loads(replay['body'])['batch_id'] == 'batch-1'
+
+
+def test_in_progress_claim_returns_409(table):
+    idempotency.claim_request('key:k', 'f', 'batch-1', 3600)
+    record = idempotency.claim_request('key:k', 'f', 'batch-2', 3600)
+    response = idempotency.replayed_response(record, 'f')
+    assert response['statusCode'] == 409
+    assert response['headers']['Retry-After'] == str(idempotency.IDEMPOTENCY_RETRY_AFTER_SECONDS)
+    assert json.loads(response['body'])['batch_id'] == 'batch-1'
+
+
+def test_key_reused_for_other_request_returns_422(table):
+    idempotency.claim_request('key:k', 'f', 'batch-1', 3600)
+    idempotency.complete_request('key:k', 'f', 'batch-1', 3600, launch_response('batch-1'))
+    record = idempotency.claim_request('key:k', 'other', 'batch-2', 3600)
+    assert idempotency.replayed_response(record, 'other')['statusCode'] == 422
+
+
+def test_request_without_key_is_never_deduplicated(table):
+    assert idempotency.claim_request(None, 'f', 'batch-1', 0) is None
+    assert idempotency.complete_request(None, 'f', 'batch-1', 0, launch_response('batch-1'))
+    assert idempotency.claim_request(None, 'f', 'batch-2', 0) is None
+    assert not table.items
+
+
+def test_stale_lock_is_reclaimed_and_old_launch_cannot_complete(table):
+    idempotency.claim_request('key:k', 'f', 'batch-1', 3600)
+    # Lambda interrompue : réservation jamais terminée, verrou expiré
+    table.items[('key:k', None)]['locked_until'] = 0
+    assert idempotency.claim_request('key:k', 'f', 'batch-2', 3600) is None
+
+    assert not idempotency.complete_request('key:k', 'f', 'batch-1', 3600, launch_response('batch-1'))
+    assert not idempotency.release_request('key:k', 'batch-1')
+    assert table.items[('key:k', None)]['batch_id'] == 'batch-2'
+
+    assert idempotency.complete_request('key:k', 'f', 'batch-2', 3600, launch_response('batch-2'))
+    assert table.items[('key:k', None)]['status'] == idempotency.STATUS_COMPLETED
+
+
+def test_release_allows_new_launch(table):
+    idempotency.claim_request('key:k', 'f', 'batch-1', 3600)
+    assert idempotency.release_request('key:k', 'batch-1')
+    assert idempotency.claim_request('key:k', 'f', 'batch-2', 3600) is None
+
+
+def test_oversized_response_releases_key(table, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_MAX_RESPONSE_BYTES', 10)
+    idempotency.claim_request('key:k', 'f', 'batch-1', 3600)
+    idempotency.complete_request('key:k', 'f', 'batch-1', 3600, launch_response('batch-1'))
+    assert table.items == {}
+
+
+def test_disabled_without_table(monkeypatch):
+    monkeypatch.setattr(idempotency, '_table', None)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_TABLE_NAME', None)
+    assert idempotency.claim_request('key:k', 'f', 'batch-1', 3600) is None
+    assert idempotency.complete_request('key:k', 'f', 'batch-1', 3600, launch_response('batch-1'))
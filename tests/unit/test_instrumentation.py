@@ -0,0 +1,31 @@
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import run_measured
+
+# Processus enfant qui consomme environ 0.3 s de CPU puis écrit sur ses deux sorties
+BUSY = "import sys, time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass\nprint('out'); print('err', file=sys.stderr)"
+
+
+def cpu_seconds(rusage):
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def test_outputs_and_own_cpu_time_with_parallel_children():
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(lambda _: run_measured([sys.executable, '-c', BUSY]), range(3)))
+    for stdout, stderr, rusage, completed in results:
+        assert (stdout, stderr, completed) == ('out\n', 'err\n', True)
+        # Seul le CPU de ce processus, pas celui des deux autres terminés en parallèle
+        assert 0.25 <= cpu_seconds(rusage) < 0.6
+
+
+def test_timeout_terminates_then_kills():
+    ignore_term = "import signal, time\nsignal.signal(signal.SIGTERM, signal.SIG_IGN)\nprint('ready', flush=True)\ntime.sleep(30)"
+    start = time.monotonic()
+    stdout, _, rusage, completed = run_measured([sys.executable, '-c', ignore_term], timeout=0.5, stop_grace_seconds=0.2)
+    assert not completed
+    assert stdout == 'ready\n'
+    assert time.monotonic() - start < 5
+    assert rusage is not None
@@ -0,0 +1,111 @@
+import pytest
+
+import mp4_analyser_handler as handler
+from timeline import TIMELINE_FLOOR_CENTI_LU, TIMELINE_MISSING, parse_loudness_timeline
+
+# Sortie d'une passe ffmpeg (une piste, loudness + silence + contrôle vidéo) : -progress
+# sur stdout, logs des filtres préfixés par leur instance sur stderr (concaténés par run_cmd_until)
+PROGRESS_OUTPUT = """\
+frame=12
+out_time_us=4000000
+frame=24
+out_time_us=8000000
+"""
+FILTER_OUTPUT = """\
+[Parsed_ebur128_0 @ 0x55d0c8a0] t: 0.4      TARGET:-23 LUFS    M: -25.1 S:-120.7     I: -25.1 LUFS       LRA:   0.0 LU  FTPK: -8.4 -8.6 dBFS  TPK: -8.4 -8.6 dBFS
+[Parsed_ebur128_0 @ 0x55d0c8a0] t: 1.5      TARGET:-23 LUFS    M: -18.0 S: -20.2     I: -19.9 LUFS       LRA:   1.1 LU  FTPK: -2.0 -3.1 dBFS  TPK: -1.6 -2.4 dBFS
+[Parsed_ametadata_2 @ 0x55d0c9b0] frame:40   pts:57600   pts_time:1.2
+[Parsed_ametadata_2 @ 0x55d0c9b0] lavfi.silence_start=1.2
+[Parsed_ametadata_2 @ 0x55d0c9b0] frame:90   pts:136800  pts_time:2.85
+[Parsed_ametadata_2 @ 0x55d0c9b0] lavfi.silence_end=2.85
+[Parsed_ametadata_2 @ 0x55d0c9b0] lavfi.silence_duration=1.65
+[Parsed_blackdetect_4 @ 0x55d0caa0] black_start:0 black_end:0.96 black_duration:0.96
+[Parsed_freezedetect_5 @ 0x55d0cbb0] lavfi.freezedetect.freeze_start: 2.5
+[Parsed_ebur128_0 @ 0x55d0c8a0] Summary:
+
+  Integrated loudness:
+    I:         -19.5 LUFS
+    Threshold: -29.8 LUFS
+
+  Loudness range:
+    LRA:         5.2 LU
+
+  True peak:
+    Peak:        -1.3 dBFS
+"""
+WINDOW_OUTPUT = PROGRESS_OUTPUT + FILTER_OUTPUT
+
+
+def test_filter_graph_names_match_log_prefixes():
+    graph, outputs, log_filters = handler.build_filter_complex(1, handler.DECODE_METRICS, video=True)
+    assert outputs == ['[a0]', '[v]']
+    assert log_filters == {
+        'ebur128_0': (0, handler.METRIC_LOUDNESS),
+        'ametadata_2': (0, handler.METRIC_SILENCE),
+        'blackdetect_4': (None, handler.METRIC_VIDEO),
+        'freezedetect_5': (None, handler.METRIC_VIDEO),
+    }
+    assert graph.startswith('[0:a:0]ebur128=peak=true,silencedetect')
+
+
+def test_split_filter_logs_keeps_multiline_summary():
+    logs = handler.split_filter_logs(WINDOW_OUTPUT)
+    assert set(logs) == {'ebur128_0', 'ametadata_2', 'blackdetect_4', 'freezedetect_5'}
+    assert 'Peak:        -1.3 dBFS' in logs['ebur128_0']
+    assert 'out_time_us' not in logs['ebur128_0']
+
+
+def test_ebur128_summary():
+    logs = handler.split_filter_logs(WINDOW_OUTPUT)
+    assert handler.parse_loudness_output(logs['ebur128_0']) == (-19.5, -1.3)
+
+
+def test_ebur128_interrupted_uses_last_progress_line():
+    # ffmpeg arrêté à l'échéance : pas de résumé, dernière valeur intégrée et TPK maximal
+    progress = '\n'.join(line for line in WINDOW_OUTPUT.splitlines() if 't: ' in line)
+    assert handler.parse_loudness_output(progress) == (-19.9, -1.6)
+
+
+def test_ebur128_without_measure_falls_back_to_defaults():
+    assert handler.parse_loudness_output('') == (-23.0, -1.0)
+
+
+def test_silencedetect_intervals():
+    logs = handler.split_filter_logs(WINDOW_OUTPUT)
+    assert handler.parse_silence_intervals(logs['ametadata_2']) == [(1.2, 2.85)]
+    log_format = "[silencedetect @ 0x1] silence_start: 0.5\n[silencedetect @ 0x1] silence_end: 2 | silence_duration: 1.5"
+    assert handler.parse_silence_intervals(log_format) == [(0.5, 2.0)]
+    assert handler.parse_silence_output(log_format, 10) == 15.0
+
+
+def test_blackdetect_and_freezedetect_intervals():
+    logs = handler.split_filter_logs(WINDOW_OUTPUT)
+    assert handler.parse_black_intervals(logs['blackdetect_4']) == [(0.0, 0.96)]
+    # Gel encore en cours à la fin de la fenêtre : fermé à la durée traitée
+    assert handler.parse_freeze_intervals(logs['freezedetect_5'], 4.0) == [(2.5, 4.0)]
+
+
+def test_progress_uses_last_report():
+    assert handler.parse_progress_seconds(WINDOW_OUTPUT) == 8.0
+    assert handler.parse_progress_frames(WINDOW_OUTPUT) == 24
+    assert handler.parse_progress_seconds('') == 0.0
+
+
+def test_loudness_timeline_maxima_per_interval():
+    logs = handler.split_filter_logs(WINDOW_OUTPUT)
+    first, momentary, short_term = parse_loudness_timeline(logs['ebur128_0'], 10.0, 1.0)
+    assert first == 10
+    assert list(momentary) == [-2510, -1800]
+    assert list(short_term) == [TIMELINE_FLOOR_CENTI_LU, -2020]
+
+
+def test_loudness_timeline_pads_missing_intervals():
+    output = "t: 2.5 TARGET:-23 LUFS M: -20.0 S: -21.0 I: -20.0 LUFS"
+    first, momentary, _ = parse_loudness_timeline(output, 0.0, 1.0)
+    assert first == 0
+    assert list(momentary) == [TIMELINE_MISSING, TIMELINE_MISSING, -2000]
+
+
+@pytest.mark.parametrize('value,expected', [('30', 30.0), ('30000/1001', pytest.approx(29.97, abs=0.01)), ('0/0', None)])
+def test_frame_rate(value, expected):
+    assert handler.parse_frame_rate(value) == expected
@@ -0,0 +1,125 @@
+import tempfile
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+import media_download
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def iter_chunks(self, chunk_size):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+
+class FakeS3:
+    """GetObject par plages avec contrôle IfMatch, comme S3"""
+
+    def __init__(self, data, etag='"v1"', replace_after_first=False):
+        self.data = data
+        self.etag = etag
+        self.replace_after_first = replace_after_first
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, Range, IfMatch=None):
+        with self.lock:
+            self.calls.append({'Bucket': Bucket, 'Key': Key, 'Range': Range, 'IfMatch': IfMatch})
+            if IfMatch is not None and IfMatch != self.etag:
+                raise ClientError({'Error': {'Code': 'PreconditionFailed', 'Message': 'At least one of the pre-conditions you specified did not hold'}}, 'GetObject')
+            start, end = (int(value) for value in Range[len('bytes='):].split('-'))
+            end = min(end, len(self.data) - 1)
+            response = {
+                'Body': FakeBody(self.data[start:end + 1]),
+                'ContentRange': f"bytes {start}-{end}/{len(self.data)}",
+                'ETag': self.etag,
+            }
+            # Objet remplacé après la première plage
+            if self.replace_after_first:
+                self.etag = '"v2"'
+            return response
+
+
+def test_token_bucket_burst_then_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(media_download, 'time', clock)
+    bucket = media_download.TokenBucket(rate=2, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    # Dette d'un jeton remboursée, puis rafale plafonnée à burst
+    clock.now += 1.5
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_token_bucket_pause_and_unlimited(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(media_download, 'time', clock)
+    bucket = media_download.TokenBucket(rate=0, burst=1)
+    assert all(bucket.reserve() == 0 for _ in range(100))
+    bucket.pause(3)
+    assert bucket.reserve() == pytest.approx(3)
+    clock.now += 3
+    assert bucket.reserve() == 0
+
+
+def test_parse_rate():
+    assert media_download.parse_rate('10:20') == (10.0, 20.0)
+    assert media_download.parse_rate('0.5') == (0.5, 1.0)
+
+
+def test_parse_s3_url_keeps_raw_key():
+    assert media_download.parse_s3_url('s3://bucket/dir/a%20b?.mp4') == ('bucket', 'dir/a%20b?.mp4')
+    with pytest.raises(ValueError):
+        media_download.parse_s3_url('s3://bucket')
+
+
+def test_ranged_s3_download_pins_etag(monkeypatch):
+    data = bytes(range(256)) * 40
+    s3 = FakeS3(data)
+    monkeypatch.setattr(media_download, '_s3_client', s3)
+    monkeypatch.setattr(media_download, 'S3_DOWNLOAD_PART_SIZE', 1000)
+    monkeypatch.setattr(media_download, 'S3_DOWNLOAD_CONCURRENCY', 4)
+
+    with tempfile.TemporaryFile() as file:
+        assert media_download.download_s3_to_file('s3://bucket/media/x.mp4', file) == len(data)
+        file.seek(0)
+        assert file.read() == data
+
+    assert s3.calls[0]['Range'] == 'bytes=0-999'
+    assert s3.calls[0]['IfMatch'] is None
+    assert len(s3.calls) == 11
+    assert all(call['IfMatch'] == '"v1"' for call in s3.calls[1:])
+    assert sorted(call['Range'] for call in s3.calls[1:])[-1] == 'bytes=9000-9999'
+
+
+def test_ranged_s3_download_fails_if_object_changes(monkeypatch):
+    s3 = FakeS3(b'x' * 3000, replace_after_first=True)
+    monkeypatch.setattr(media_download, '_s3_client', s3)
+    monkeypatch.setattr(media_download, 'S3_DOWNLOAD_PART_SIZE', 1000)
+
+    with tempfile.TemporaryFile() as file:
+        with pytest.raises(ValueError, match='PreconditionFailed'):
+            media_download.download_s3_to_file('s3://bucket/x.mp4', file)
+
+
+def test_single_range_object(monkeypatch):
+    s3 = FakeS3(b'abc')
+    monkeypatch.setattr(media_download, '_s3_client', s3)
+    with tempfile.TemporaryFile() as file:
+        assert media_download.download_s3_to_file('s3://bucket/x.mp4', file) == 3
+    assert len(s3.calls) == 1
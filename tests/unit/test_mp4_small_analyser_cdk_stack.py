@@ -1,5 +1,6 @@
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
 
 from mp4_small_analyser_cdk.mp4_small_analyser_cdk_stack import Mp4SmallAnalyserCdkStack
 
@@ -13,3 +14,96 @@ def test_sqs_queue_created():
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+@pytest.fixture(scope="module")
+def template():
+    app = core.App()
+    stack = Mp4SmallAnalyserCdkStack(app, "mp4-small-analyser-cdk-assertions")
+    return assertions.Template.from_stack(stack)
+
+
+def test_idempotency_table(template):
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [{"AttributeName": "idempotency_key", "KeyType": "HASH"}],
+        "BillingMode": "PAY_PER_REQUEST",
+        "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True}
+    })
+
+
+def test_callback_retry_queue_and_dlq(template):
+    template.has_resource_properties("AWS::SQS::Queue", {
+        "MessageRetentionPeriod": 1209600
+    })
+    template.has_resource_properties("AWS::SQS::Queue", {
+        "VisibilityTimeout": 720,
+        "RedrivePolicy": {
+            "deadLetterTargetArn": assertions.Match.any_value(),
+            "maxReceiveCount": 10
+        }
+    })
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 5,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"]
+    })
+
+
+def test_retry_payloads_outlive_the_dlq(template):
+    template.has_resource_properties("AWS::S3::Bucket", {
+        "LifecycleConfiguration": {"Rules": assertions.Match.array_with([
+            assertions.Match.object_like({"Prefix": "callback-retry/", "ExpirationInDays": 18})
+        ])}
+    })
+
+
+def test_interactive_analyser_reserved_concurrency(template):
+    analysers = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {"Handler": "mp4_analyser_handler.lambda_handler"}
+    })
+    # Marge garantie aux appels synchrones, distincte de la réservation de la voie de masse
+    interactive = [resource for logical_id, resource in analysers.items() if logical_id.startswith("MP4AnalyserFunction")]
+    assert [resource["Properties"].get("ReservedConcurrentExecutions") for resource in interactive] == [50]
+
+
+def test_bulk_analyser_reserved_concurrency(template):
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "mp4_analyser_handler.lambda_handler",
+        "ReservedConcurrentExecutions": 20
+    })
+    template.has_resource_properties("AWS::Lambda::EventInvokeConfig", {
+        "MaximumRetryAttempts": 0,
+        "MaximumEventAgeInSeconds": 6 * 3600
+    })
+
+
+def test_dispatcher_knows_both_analyser_lanes(template):
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "mp4_dispatcher_handler.lambda_handler",
+        "Environment": {"Variables": assertions.Match.object_like({
+            "MP4_LAMBDA_NAME": assertions.Match.any_value(),
+            "MP4_BULK_LAMBDA_NAME": assertions.Match.any_value(),
+            "IDEMPOTENCY_TABLE_NAME": assertions.Match.any_value()
+        })}
+    })
+
+
+def test_callback_retry_function_skips_ffmpeg_layer(template):
+    layers = template.find_resources("AWS::Lambda::LayerVersion")
+    layer_ids = {resource["Properties"]["Description"]: logical_id for logical_id, resource in layers.items()}
+    ffmpeg_layer = layer_ids["FFmpeg et FFprobe binaires"]
+    requests_layer = layer_ids["Package requests pour Python"]
+
+    functions = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {"Handler": "callback_delivery.retry_handler"}
+    })
+    (retry_function,) = functions.values()
+    retry_layers = [layer["Ref"] for layer in retry_function["Properties"]["Layers"]]
+    assert requests_layer in retry_layers
+    assert ffmpeg_layer not in retry_layers
+
+    analysers = template.find_resources("AWS::Lambda::Function", {
+        "Properties": {"Handler": "mp4_analyser_handler.lambda_handler"}
+    })
+    for analyser in analysers.values():
+        analyser_layers = [layer["Ref"] for layer in analyser["Properties"]["Layers"]]
+        assert ffmpeg_layer in analyser_layers and requests_layer in analyser_layers
@@ -0,0 +1,334 @@
+"""
+Générateur de charge et rapport de latence pour l'API batch /mp4_small_analyser
+
+Rejoue des batchs (files_url, callback_url) à un débit d'arrivée donné (loi de
+Poisson, boucle ouverte) avec une concurrence maximale. La latence est mesurée
+depuis l'instant d'arrivée prévu, l'attente d'un slot de concurrence est donc
+comptée (pas d'omission coordonnée).
+
+- mode sync : latence de la réponse du dispatcher ;
+- mode async : la réponse 202 puis l'arrivée de chaque callback, observée par
+  long-polling GET /callback/{task_id}?wait=N (délai d'arrivée des callbacks).
+
+Fonctionne contre l'émulateur local (--emulator, ou --target http://127.0.0.1:8080)
+ou une stack déployée (--target <URL API analyser> --callback-url <URL API callback>/callback).
+
+Usage :
+    python -m tools.load_generator --emulator --corpus benchmarks/corpus --rate 2 --duration 60
+    python -m tools.load_generator --target https://xxx.execute-api.eu-west-1.amazonaws.com/prod \\
+        --callback-url https://yyy.execute-api.eu-west-1.amazonaws.com/prod/callback \\
+        --files-from urls.txt --mode mixed --batch-sizes 1:70,5:20,20:10 --rate 1 --duration 300
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Statuts finaux d'un résultat de callback
+TERMINAL_STATUSES = ('completed', 'partial', 'failed')
+# Marqueurs d'un throttling Lambda relayé par le dispatcher
+THROTTLE_MARKERS = ('TooManyRequestsException', 'Rate Exceeded')
+
+
+def percentile(values, fraction):
+    """Percentile par rang le plus proche (None si aucune valeur)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def latency_summary(values):
+    """p50/p95/p99 et maximum en millisecondes"""
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': max(values) if values else None,
+    }
+
+
+def parse_batch_sizes(spec):
+    """'1:70,5:20,20:10' -> ([1, 5, 20], [70, 20, 10]) ; '1,5' -> poids égaux"""
+    sizes, weights = [], []
+    for part in spec.split(','):
+        size, _, weight = part.partition(':')
+        sizes.append(int(size))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+def http_json(method, url, data=None, timeout=330, headers=None):
+    """Requête JSON ; retourne (status, body décodé ou texte brut)"""
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    request = urllib.request.Request(url, data=body, method=method, headers={'Content-Type': 'application/json', **(headers or {})})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    try:
+        return status, json.loads(raw or b'{}')
+    except ValueError:
+        return status, raw.decode('utf-8', errors='replace')
+
+
+class LoadGenerator:
+    """Planifie les requêtes, les exécute avec une concurrence bornée et agrège les mesures"""
+
+    def __init__(self, target, callback_url, files, mode='async', async_ratio=0.5, batch_sizes='1',
+                 duplicate_ratio=0.0, concurrency=10, wait_seconds=20, callback_timeout=300, seed=None):
+        self.analyse_url = target.rstrip('/') + '/mp4_small_analyser'
+        self.callback_url = (callback_url or target.rstrip('/') + '/callback').rstrip('/')
+        self.files = files
+        self.mode = mode
+        self.async_ratio = async_ratio
+        self.batch_sizes, self.batch_weights = parse_batch_sizes(batch_sizes)
+        self.duplicate_ratio = duplicate_ratio
+        self.concurrency = concurrency
+        self.wait_seconds = wait_seconds
+        self.callback_timeout = callback_timeout
+        self.random = random.Random(seed)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load')
+        # Le suivi des callbacks ne doit pas consommer la concurrence des requêtes
+        self.poller = ThreadPoolExecutor(max_workers=max(4, concurrency * 4), thread_name_prefix='poll')
+        self.records = []
+        self.callbacks = []
+        self.used_files = []
+        self._lock = threading.Lock()
+
+    def build_batch(self):
+        """Tire un batch : taille pondérée, fichiers du mix, part de doublons"""
+        size = self.random.choices(self.batch_sizes, self.batch_weights)[0]
+        batch = []
+        for _ in range(size):
+            if self.used_files and self.random.random() < self.duplicate_ratio:
+                batch.append(self.random.choice(self.used_files))
+            else:
+                file_url = self.random.choice(self.files)
+                batch.append(file_url)
+                self.used_files.append(file_url)
+        return batch
+
+    def pick_mode(self):
+        if self.mode == 'mixed':
+            return 'async' if self.random.random() < self.async_ratio else 'sync'
+        return self.mode
+
+    def run(self, rate, duration=None, total_requests=None, log=None):
+        """Arrivées de Poisson au débit rate (requêtes/s) pendant duration secondes ou total_requests requêtes"""
+        started = time.monotonic()
+        scheduled = started
+        futures = []
+        count = 0
+        while (total_requests is None or count < total_requests) and (duration is None or scheduled - started < duration):
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(self.executor.submit(self.execute, count, self.pick_mode(), self.build_batch(), scheduled))
+            count += 1
+            scheduled += self.random.expovariate(rate)
+            if log and count % 50 == 0:
+                log(f"⏳ {count} requêtes planifiées")
+
+        for future in futures:
+            future.result()
+        self.executor.shutdown(wait=True)
+        self.poller.shutdown(wait=True)
+        return self.report(time.monotonic() - started)
+
+    def execute(self, index, mode, batch, scheduled):
+        """Envoie un batch et enregistre la latence depuis l'arrivée prévue"""
+        payload = {'files_url': batch}
+        if mode == 'async':
+            payload['callback_url'] = self.callback_url
+
+        # Une clé par requête logique : les doublons de --duplicate-ratio sont de vraies
+        # analyses, jamais des réponses rejouées par l'idempotence du dispatcher
+        headers = {'Idempotency-Key': f"loadgen-{uuid.uuid4()}"}
+        sent = time.monotonic()
+        try:
+            status, body = http_json('POST', self.analyse_url, payload, headers=headers)
+        except Exception as e:
+            status, body = None, str(e)
+        finished = time.monotonic()
+
+        record = {
+            'index': index,
+            'mode': mode,
+            'files': len(batch),
+            'status': status,
+            'latency_ms': round((finished - scheduled) * 1000, 3),
+            'queue_ms': round((sent - scheduled) * 1000, 3),
+            'throttled': status == 429 or any(marker in json.dumps(body) for marker in THROTTLE_MARKERS),
+            'error': status is None or status >= 400,
+            'failed_files': 0,
+        }
+        if isinstance(body, dict):
+            record['failed_files'] = body.get('failed', 0)
+            if mode == 'async':
+                for task in body.get('tasks', []):
+                    if task.get('status') == 'launched':
+                        self.poller.submit(self.await_callback, task['task_id'], scheduled, finished)
+                    else:
+                        record['failed_files'] += 1
+        with self._lock:
+            self.records.append(record)
+
+    def await_callback(self, task_id, scheduled, accepted):
+        """Long-polling du résultat : délai d'arrivée depuis l'acceptation (202) et latence de bout en bout"""
+        deadline = accepted + self.callback_timeout
+        outcome = {'task_id': task_id, 'status': None}
+        while time.monotonic() < deadline:
+            try:
+                status, body = http_json('GET', f"{self.callback_url}/{task_id}?wait={self.wait_seconds}", timeout=self.wait_seconds + 30)
+            except Exception:
+                time.sleep(1)
+                continue
+            results = body.get('results', []) if isinstance(body, dict) and status == 200 else []
+            if results and results[0].get('status') in TERMINAL_STATUSES:
+                observed = time.monotonic()
+                outcome.update(
+                    status=results[0]['status'],
+                    lag_ms=round((observed - accepted) * 1000, 3),
+                    end_to_end_ms=round((observed - scheduled) * 1000, 3),
+                )
+                break
+            if status not in (200, 404):
+                time.sleep(1)
+        with self._lock:
+            self.callbacks.append(outcome)
+
+    def report(self, elapsed):
+        """Synthèse : débit, latences par mode, taux de throttling/erreurs, délai des callbacks"""
+        records = self.records
+        total_files = sum(r['files'] for r in records)
+        report = {
+            'config': {
+                'mode': self.mode,
+                'batch_sizes': dict(zip(self.batch_sizes, self.batch_weights)),
+                'duplicate_ratio': self.duplicate_ratio,
+                'concurrency': self.concurrency,
+                'distinct_files': len(set(self.files)),
+            },
+            'elapsed_s': round(elapsed, 3),
+            'requests': len(records),
+            'files': total_files,
+            'throughput_rps': round(len(records) / elapsed, 3) if elapsed else None,
+            'throughput_files_per_s': round(total_files / elapsed, 3) if elapsed else None,
+            'throttle_rate': round(sum(r['throttled'] for r in records) / len(records), 4) if records else None,
+            'error_rate': round(sum(r['error'] for r in records) / len(records), 4) if records else None,
+            'file_failure_rate': round(sum(r['failed_files'] for r in records) / total_files, 4) if total_files else None,
+            'latency': {
+                mode: latency_summary([r['latency_ms'] for r in records if r['mode'] == mode and not r['error']])
+                for mode in sorted({r['mode'] for r in records})
+            },
+        }
+        if self.callbacks:
+            arrived = [c for c in self.callbacks if c.get('lag_ms') is not None]
+            report['callbacks'] = {
+                'expected': len(self.callbacks),
+                'arrived': len(arrived),
+                'partial': len([c for c in arrived if c['status'] == 'partial']),
+                'failed': len([c for c in arrived if c['status'] == 'failed']),
+                'timed_out': len(self.callbacks) - len(arrived),
+                'arrival_lag': latency_summary([c['lag_ms'] for c in arrived]),
+                'end_to_end': latency_summary([c['end_to_end_ms'] for c in arrived]),
+            }
+        return report
+
+
+def print_report(report):
+    """Affichage lisible du rapport"""
+    print(f"📊 {report['requests']} requêtes ({report['files']} fichiers) en {report['elapsed_s']:.1f}s")
+    print(f"   Débit : {report['throughput_rps']} req/s, {report['throughput_files_per_s']} fichiers/s")
+    print(f"   Throttling : {report['throttle_rate']:.2%}   Erreurs HTTP : {report['error_rate']:.2%}   Fichiers en échec : {report['file_failure_rate']:.2%}")
+
+    def row(label, summary):
+        if summary['count']:
+            print(f"   {label:<28} p50 {summary['p50_ms']:>9.0f} ms  p95 {summary['p95_ms']:>9.0f} ms  p99 {summary['p99_ms']:>9.0f} ms  (n={summary['count']})")
+
+    for mode, summary in report['latency'].items():
+        row(f"réponse dispatcher ({mode})", summary)
+    if 'callbacks' in report:
+        callbacks = report['callbacks']
+        row("arrivée des callbacks", callbacks['arrival_lag'])
+        row("bout en bout (async)", callbacks['end_to_end'])
+        print(f"   Callbacks : {callbacks['arrived']}/{callbacks['expected']} reçus, {callbacks['partial']} partiels, {callbacks['failed']} en échec, {callbacks['timed_out']} hors délai")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Générateur de charge pour l'API /mp4_small_analyser")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--target', help="URL de base de l'API analyser (stack déployée ou émulateur)")
+    target.add_argument('--emulator', action='store_true', help="Démarrer l'émulateur local dans ce processus")
+    parser.add_argument('--callback-url', help="URL /callback de l'API de callback (défaut : <target>/callback)")
+    files = parser.add_mutually_exclusive_group(required=True)
+    files.add_argument('--corpus', help="Corpus généré par benchmarks.corpus, servi en HTTP local")
+    files.add_argument('--files-from', help="Fichier texte avec une URL MP4 par ligne")
+    parser.add_argument('--mode', choices=['sync', 'async', 'mixed'], default='async')
+    parser.add_argument('--async-ratio', type=float, default=0.5, help="Part de requêtes async en mode mixed")
+    parser.add_argument('--batch-sizes', default='1', help="Tailles de batch pondérées, ex. 1:70,5:20,20:10")
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0, help="Part de fichiers déjà envoyés réutilisés")
+    parser.add_argument('--rate', type=float, default=1.0, help="Débit d'arrivée (requêtes/s)")
+    parser.add_argument('--concurrency', type=int, default=10, help="Requêtes simultanées maximum")
+    parser.add_argument('--duration', type=float, help="Durée de la génération (secondes)")
+    parser.add_argument('--requests', type=int, help="Nombre de requêtes à envoyer")
+    parser.add_argument('--callback-timeout', type=float, default=300)
+    parser.add_argument('--analyser-concurrency', type=int, default=4, help="Concurrence de l'analyser (--emulator)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help="Rapport JSON de sortie")
+    args = parser.parse_args()
+    if args.duration is None and args.requests is None:
+        parser.error("--duration ou --requests est requis")
+
+    servers = []
+    if args.corpus:
+        from benchmarks.corpus import load_manifest
+        from benchmarks.http_server import start_server
+
+        file_server, files_base = start_server(args.corpus)
+        servers.append(file_server)
+        file_urls = [f"{files_base}/{entry['name']}" for entry in load_manifest(args.corpus)['files']]
+    else:
+        with open(args.files_from) as f:
+            file_urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    emulator = None
+    target_url = args.target
+    if args.emulator:
+        from tools.local_emulator import LocalEmulator
+
+        emulator = LocalEmulator(analyser_concurrency=args.analyser_concurrency).start()
+        target_url = emulator.base_url
+
+    try:
+        generator = LoadGenerator(
+            target_url, args.callback_url, file_urls, args.mode, args.async_ratio, args.batch_sizes,
+            args.duplicate_ratio, args.concurrency, callback_timeout=args.callback_timeout, seed=args.seed
+        )
+        report = generator.run(args.rate, args.duration, args.requests, log=lambda message: print(message, file=sys.stderr))
+        if emulator:
+            report['emulator'] = emulator.stats()
+    finally:
+        if emulator:
+            emulator.shutdown()
+        for server in servers:
+            server.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Rapport écrit dans {args.output}")
+
+
+if __name__ == '__main__':
+    main()
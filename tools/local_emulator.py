@@ -0,0 +1,406 @@
+"""
+Émulateur local du flux dispatcher → analyser → callback, sans AWS
+
+Les trois handlers tournent sur la machine locale :
+- l'API HTTP locale reproduit les routes API Gateway (POST /mp4_small_analyser,
+  POST/GET /callback/{task_id}, GET /callback/batch/{batch_id}, GET /callback?status=...) ;
+- les appels lambda.invoke du dispatcher (Event et RequestResponse) sont routés
+  vers un pool local à concurrence limitée (throttling TooManyRequestsException
+  au-delà, comme la concurrence réservée d'une Lambda) ; l'analyser de masse
+  (voie 'bulk' des gros lots asynchrones) a son propre pool ;
+- l'analyser tourne par défaut dans des processus dédiés (un processus = un
+  conteneur Lambda, mesures et pic mémoire isolés) ;
+- les tables des callbacks et des soumissions idempotentes sont en mémoire, ou
+  dans DynamoDB Local avec --dynamodb-endpoint ;
+- les entrées s3:// sont lues dans un stockage compatible S3 avec --s3-endpoint.
+
+Usage :
+    python -m tools.local_emulator --port 8080 --analyser-concurrency 4
+    curl -X POST http://127.0.0.1:8080/mp4_small_analyser \\
+        -d '{"files_url": ["http://..."], "callback_url": "http://127.0.0.1:8080/callback"}'
+"""
+import argparse
+import base64
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from botocore.exceptions import ClientError
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_LAYER_DIR = os.path.join(REPO_ROOT, 'lambda', 'layers', 'common', 'python')
+
+ANALYSER_FUNCTION = 'mp4_analyser'
+BULK_ANALYSER_FUNCTION = 'mp4_analyser_bulk'
+DISPATCHER_FUNCTION = 'mp4_dispatcher'
+CALLBACK_FUNCTION = 'callback'
+
+# Fonctions hébergées : répertoire du code, module, handler et timeout (secondes) comme dans les stacks
+FUNCTIONS = {
+    ANALYSER_FUNCTION: ('lambda/mp4_analyser', 'mp4_analyser_handler', 'lambda_handler', 120),
+    BULK_ANALYSER_FUNCTION: ('lambda/mp4_analyser', 'mp4_analyser_handler', 'lambda_handler', 120),
+    DISPATCHER_FUNCTION: ('lambda/mp4_dispatcher', 'mp4_dispatcher_handler', 'lambda_handler', 300),
+    CALLBACK_FUNCTION: ('lambda/callback', 'callback_handler', 'lambda_handler', 30),
+}
+
+# Routes de l'API locale : (méthodes, motif du chemin, fonction, body binaire comme l'API de callback)
+ROUTES = [
+    (('POST',), re.compile(r'^/mp4_small_analyser/?$'), DISPATCHER_FUNCTION, False),
+    (('GET',), re.compile(r'^/callback/batch/(?P<batch_id>[^/]+)/?$'), CALLBACK_FUNCTION, True),
+    (('POST', 'GET'), re.compile(r'^/callback/(?P<task_id>[^/]+)/?$'), CALLBACK_FUNCTION, True),
+    (('GET',), re.compile(r'^/callback/?$'), CALLBACK_FUNCTION, True),
+]
+
+# Variables d'environnement par défaut des handlers en local
+DEFAULT_ENV = {
+    'AWS_DEFAULT_REGION': 'eu-west-1',
+    'CALLBACK_TABLE_NAME': 'local-callback-results',
+    'BATCH_INDEX_NAME': 'BatchIdIndex',
+    'STATUS_INDEX_NAME': 'StatusTimeIndex',
+    'MP4_LAMBDA_NAME': ANALYSER_FUNCTION,
+    'MP4_BULK_LAMBDA_NAME': BULK_ANALYSER_FUNCTION,
+    'IDEMPOTENCY_TABLE_NAME': 'local-idempotency',
+    'FFMPEG_PATH': 'ffmpeg',
+    'FFPROBE_PATH': 'ffprobe',
+    'METRICS_ENABLED': 'false',
+}
+
+
+class LocalContext:
+    """Contexte Lambda minimal (temps restant avant le timeout)"""
+
+    def __init__(self, function_name, timeout_seconds):
+        self.function_name = function_name
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+def function_path(name):
+    """sys.path d'une fonction : son code puis le layer commun (/opt/python)"""
+    return [os.path.join(REPO_ROOT, FUNCTIONS[name][0]), COMMON_LAYER_DIR]
+
+
+def load_handler(name):
+    """Importe le module d'une fonction et retourne son handler"""
+    for path in reversed(function_path(name)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    _, module_name, handler_name, _ = FUNCTIONS[name]
+    return getattr(importlib.import_module(module_name), handler_name)
+
+
+def init_worker(name):
+    """Initialise un processus de travail (équivalent d'un démarrage à froid)"""
+    load_handler(name)
+
+
+def run_handler(name, event):
+    """Exécute une invocation ; les exceptions non gérées sont renvoyées comme par Lambda"""
+    timeout_seconds = FUNCTIONS[name][3]
+    try:
+        return {'payload': load_handler(name)(event, LocalContext(name, timeout_seconds))}
+    except Exception as e:
+        return {'payload': {'errorMessage': str(e), 'errorType': type(e).__name__}, 'function_error': 'Unhandled'}
+
+
+class LocalFunction:
+    """Pool d'exécution d'une fonction avec une limite de concurrence"""
+
+    def __init__(self, name, concurrency, isolation='thread'):
+        self.name = name
+        self.concurrency = concurrency
+        if isolation == 'process':
+            self.executor = ProcessPoolExecutor(
+                max_workers=concurrency,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+                initargs=(name,)
+            )
+        else:
+            load_handler(name)
+            self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        # Invocations soumises et non terminées (en cours ou en file)
+        self.in_flight = 0
+        self.stats = {'invocations': 0, 'throttles': 0, 'errors': 0, 'max_in_flight': 0}
+        # Réentrant : le callback de fin peut s'exécuter pendant _submit
+        self._lock = threading.RLock()
+
+    def _submit(self, event):
+        self.in_flight += 1
+        self.stats['invocations'] += 1
+        self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.in_flight)
+        future = self.executor.submit(run_handler, self.name, event)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.exception() is not None or 'function_error' in future.result():
+                self.stats['errors'] += 1
+
+    def invoke_async(self, event):
+        """Invocation Event : mise en file sans limite (file interne de Lambda)"""
+        with self._lock:
+            self._submit(event)
+
+    def invoke_sync(self, event):
+        """Invocation RequestResponse : throttlée si la concurrence est saturée"""
+        with self._lock:
+            if self.in_flight >= self.concurrency:
+                self.stats['throttles'] += 1
+                raise ClientError(
+                    {'Error': {'Code': 'TooManyRequestsException', 'Message': 'Rate Exceeded.'}},
+                    'Invoke'
+                )
+            future = self._submit(event)
+        return future.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class LocalLambdaClient:
+    """Remplace boto3.client('lambda') : invoke() est routé vers les pools locaux"""
+
+    def __init__(self, functions):
+        self.functions = functions
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=b'{}', **kwargs):
+        function = self.functions.get(FunctionName.split(':')[-1])
+        if function is None:
+            raise ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': f"Function not found: {FunctionName}"}}, 'Invoke')
+        event = json.loads(Payload)
+        if InvocationType == 'Event':
+            function.invoke_async(event)
+            return {'StatusCode': 202, 'Payload': io.BytesIO(b'')}
+
+        outcome = function.invoke_sync(event)
+        response = {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(outcome['payload'], default=str).encode('utf-8'))}
+        if 'function_error' in outcome:
+            response['FunctionError'] = outcome['function_error']
+        return response
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Convertit les requêtes HTTP en événements proxy API Gateway"""
+
+    protocol_version = 'HTTP/1.1'
+    emulator = None
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def dispatch(self, method):
+        parsed = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        for methods, pattern, name, binary in ROUTES:
+            match = pattern.match(parsed.path)
+            if match and method in methods:
+                break
+        else:
+            return self.send_json(404, {'message': 'Missing Authentication Token'})
+
+        # L'API de callback déclare application/json comme type binaire : body en base64
+        is_binary = binary and 'application/json' in (self.headers.get('Content-Type') or '')
+        event = {
+            'httpMethod': method,
+            'path': parsed.path,
+            'resource': pattern.pattern,
+            'pathParameters': match.groupdict() or None,
+            'queryStringParameters': dict(urllib.parse.parse_qsl(parsed.query)) or None,
+            'headers': dict(self.headers.items()),
+            'body': (base64.b64encode(body).decode('ascii') if is_binary else body.decode('utf-8')) if body else None,
+            'isBase64Encoded': bool(body) and is_binary,
+        }
+
+        try:
+            outcome = self.emulator.functions[name].invoke_sync(event)
+        except ClientError:
+            return self.send_json(429, {'message': 'Too Many Requests'})
+        if 'function_error' in outcome:
+            return self.send_json(502, {'message': 'Internal server error'})
+
+        response = outcome['payload']
+        response_body = response.get('body') or ''
+        payload = base64.b64decode(response_body) if response.get('isBase64Encoded') else response_body.encode('utf-8')
+        self.send_response(response.get('statusCode', 200))
+        for header, value in (response.get('headers') or {}).items():
+            if header.lower() != 'content-length':
+                self.send_header(header, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_json(self, status_code, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def ensure_dynamodb_table(table_name, index_name, status_index_name):
+    """Crée la table des callbacks et ses index dans DynamoDB Local si elle n'existe pas"""
+    import boto3
+
+    client = boto3.client('dynamodb')
+    if table_name in client.list_tables()['TableNames']:
+        return
+    client.create_table(
+        TableName=table_name,
+        BillingMode='PAY_PER_REQUEST',
+        AttributeDefinitions=[
+            {'AttributeName': 'task_id', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'},
+            {'AttributeName': 'batch_id', 'AttributeType': 'S'},
+            {'AttributeName': 'status_shard', 'AttributeType': 'S'},
+            {'AttributeName': 'status_at', 'AttributeType': 'S'},
+        ],
+        KeySchema=[
+            {'AttributeName': 'task_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'timestamp', 'KeyType': 'RANGE'},
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': index_name,
+            'KeySchema': [
+                {'AttributeName': 'batch_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+        }, {
+            'IndexName': status_index_name,
+            'KeySchema': [
+                {'AttributeName': 'status_shard', 'KeyType': 'HASH'},
+                {'AttributeName': 'status_at', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+        }],
+    )
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+
+def ensure_idempotency_table(table_name):
+    """Crée la table des soumissions idempotentes dans DynamoDB Local si elle n'existe pas"""
+    import boto3
+
+    client = boto3.client('dynamodb')
+    if table_name in client.list_tables()['TableNames']:
+        return
+    client.create_table(
+        TableName=table_name,
+        BillingMode='PAY_PER_REQUEST',
+        AttributeDefinitions=[{'AttributeName': 'idempotency_key', 'AttributeType': 'S'}],
+        KeySchema=[{'AttributeName': 'idempotency_key', 'KeyType': 'HASH'}],
+    )
+    client.get_waiter('table_exists').wait(TableName=table_name)
+
+
+class LocalEmulator:
+    """Héberge les trois fonctions et l'API HTTP locale"""
+
+    def __init__(self, host='127.0.0.1', port=0, analyser_concurrency=4, dispatcher_concurrency=10,
+                 callback_concurrency=20, isolation='process', dynamodb_endpoint=None, env=None, bulk_concurrency=2,
+                 s3_endpoint=None):
+        for key, value in {**DEFAULT_ENV, **(env or {})}.items():
+            os.environ.setdefault(key, value)
+        if s3_endpoint:
+            # Hérité par les processus de l'analyser (client S3 des entrées s3://)
+            os.environ['AWS_ENDPOINT_URL_S3'] = s3_endpoint
+        if dynamodb_endpoint:
+            os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = dynamodb_endpoint
+            ensure_dynamodb_table(os.environ['CALLBACK_TABLE_NAME'], os.environ['BATCH_INDEX_NAME'], os.environ['STATUS_INDEX_NAME'])
+            ensure_idempotency_table(os.environ['IDEMPOTENCY_TABLE_NAME'])
+
+        self.server = ThreadingHTTPServer((host, port), type('Handler', (ApiRequestHandler,), {'emulator': self}))
+        self.base_url = f"http://{host}:{self.server.server_port}"
+
+        # Le dispatcher et le callback tournent dans ce processus pour partager
+        # le client Lambda local et la table en mémoire
+        self.functions = {
+            ANALYSER_FUNCTION: LocalFunction(ANALYSER_FUNCTION, analyser_concurrency, isolation),
+            BULK_ANALYSER_FUNCTION: LocalFunction(BULK_ANALYSER_FUNCTION, bulk_concurrency, isolation),
+            DISPATCHER_FUNCTION: LocalFunction(DISPATCHER_FUNCTION, dispatcher_concurrency),
+            CALLBACK_FUNCTION: LocalFunction(CALLBACK_FUNCTION, callback_concurrency),
+        }
+        importlib.import_module('mp4_dispatcher_handler')._lambda_client = LocalLambdaClient(self.functions)
+        if not dynamodb_endpoint:
+            from tools.memory_table import MemoryTable
+
+            callback_module = importlib.import_module('callback_handler')
+            callback_module._table = MemoryTable(indexes={
+                os.environ['BATCH_INDEX_NAME']: ('batch_id', 'timestamp'),
+                os.environ['STATUS_INDEX_NAME']: ('status_shard', 'status_at'),
+            })
+            importlib.import_module('idempotency')._table = MemoryTable(hash_key='idempotency_key', range_key=None)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stats(self):
+        return {name: dict(function.stats, in_flight=function.in_flight) for name, function in self.functions.items()}
+
+    def shutdown(self):
+        self.server.shutdown()
+        for function in self.functions.values():
+            function.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Émulateur local dispatcher → analyser → callback")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--analyser-concurrency', type=int, default=4, help="Invocations simultanées de l'analyser")
+    parser.add_argument('--bulk-concurrency', type=int, default=2, help="Invocations simultanées de l'analyser de masse")
+    parser.add_argument('--dispatcher-concurrency', type=int, default=10)
+    parser.add_argument('--callback-concurrency', type=int, default=20)
+    parser.add_argument('--isolation', choices=['process', 'thread'], default='process',
+                        help="Analyser dans des processus dédiés (défaut) ou des threads (débogage)")
+    parser.add_argument('--dynamodb-endpoint', help="URL de DynamoDB Local (table en mémoire sinon)")
+    parser.add_argument('--s3-endpoint', help="URL d'un stockage compatible S3 pour les entrées s3:// (MinIO, moto...)")
+    args = parser.parse_args()
+
+    emulator = LocalEmulator(
+        args.host, args.port, args.analyser_concurrency, args.dispatcher_concurrency,
+        args.callback_concurrency, args.isolation, args.dynamodb_endpoint, bulk_concurrency=args.bulk_concurrency,
+        s3_endpoint=args.s3_endpoint
+    ).start()
+    print(f"🚀 Émulateur local démarré sur {emulator.base_url}")
+    print(f"   POST {emulator.base_url}/mp4_small_analyser")
+    print(f"   GET  {emulator.base_url}/callback/{{task_id}}")
+    try:
+        while True:
+            time.sleep(30)
+            print(f"📊 {json.dumps(emulator.stats())}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Table DynamoDB en mémoire pour l'émulateur local
+
+Implémente le sous-ensemble de l'API boto3 Table utilisé par le handler de
+callback et le dispatcher (put_item et delete_item conditionnels, get_item, query
+paginée sur la table ou un index global) en évaluant directement les objets
+Key/Attr de boto3.
+"""
+import threading
+
+from boto3.dynamodb.conditions import AttributeBase, ConditionBase
+from botocore.exceptions import ClientError
+
+COMPARATORS = {
+    'Equals': lambda a, b: a == b,
+    'NotEquals': lambda a, b: a != b,
+    'LessThan': lambda a, b: a < b,
+    'LessThanEquals': lambda a, b: a <= b,
+    'GreaterThan': lambda a, b: a > b,
+    'GreaterThanEquals': lambda a, b: a >= b,
+}
+
+
+def evaluate(condition, item):
+    """Évalue une condition boto3 (Key/Attr) sur un item"""
+    if isinstance(condition, AttributeBase):
+        return item.get(condition.name)
+    if not isinstance(condition, ConditionBase):
+        return condition
+
+    operator = type(condition).__name__
+    values = condition.get_expression()['values']
+    if operator == 'And':
+        return evaluate(values[0], item) and evaluate(values[1], item)
+    if operator == 'Or':
+        return evaluate(values[0], item) or evaluate(values[1], item)
+    if operator == 'Not':
+        return not evaluate(values[0], item)
+    if operator == 'AttributeExists':
+        return values[0].name in item
+    if operator == 'AttributeNotExists':
+        return values[0].name not in item
+
+    left = evaluate(values[0], item)
+    if left is None:
+        return False
+    if operator == 'BeginsWith':
+        return isinstance(left, str) and left.startswith(values[1])
+    if operator == 'Between':
+        return values[1] <= left <= values[2]
+    if operator == 'In':
+        return left in values[1]
+    if operator not in COMPARATORS:
+        raise NotImplementedError(f"Condition non supportée par la table en mémoire: {operator}")
+    return COMPARATORS[operator](left, evaluate(values[1], item))
+
+
+def project(item, projection, names):
+    """Applique une ProjectionExpression simple (attributs séparés par des virgules)"""
+    if not projection:
+        return dict(item)
+    attributes = [names.get(name.strip(), name.strip()) for name in projection.split(',')]
+    return {name: item[name] for name in attributes if name in item}
+
+
+class MemoryTable:
+    """Stand-in thread-safe d'une table DynamoDB (clé de partition + clé de tri)"""
+
+    def __init__(self, hash_key='task_id', range_key='timestamp', indexes=None):
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # Index globaux : nom -> (clé de partition, clé de tri)
+        self.indexes = indexes or {}
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def _key(self, item):
+        return item[self.hash_key], item.get(self.range_key)
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        with self._lock:
+            existing = self.items.get(self._key(Item), {})
+            if ConditionExpression is not None and not evaluate(ConditionExpression, existing):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}}, 'PutItem')
+            self.items[self._key(Item)] = dict(Item)
+        return {}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        with self._lock:
+            item = self.items.get(self._key(Key))
+        if item is None:
+            return {}
+        return {'Item': project(item, ProjectionExpression, ExpressionAttributeNames or {})}
+
+    def delete_item(self, Key, ConditionExpression=None, **kwargs):
+        with self._lock:
+            existing = self.items.get(self._key(Key), {})
+            if ConditionExpression is not None and not evaluate(ConditionExpression, existing):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}}, 'DeleteItem')
+            self.items.pop(self._key(Key), None)
+        return {}
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, Limit=None,
+              FilterExpression=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+              ExclusiveStartKey=None, **kwargs):
+        hash_key, range_key = self.indexes.get(IndexName, (self.hash_key, self.range_key))
+        key_names = [name for name in (hash_key, range_key, self.hash_key, self.range_key) if name]
+
+        # Ordre de la clé de tri, départagé par la clé de la table (pagination stable)
+        def order(item):
+            return tuple(str(item.get(name, '')) for name in (range_key, self.hash_key, self.range_key) if name)
+
+        with self._lock:
+            # Un index global ne contient que les items possédant sa clé de partition
+            items = [item for item in self.items.values() if hash_key in item and evaluate(KeyConditionExpression, item)]
+        items.sort(key=order, reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = order(ExclusiveStartKey)
+            items = [item for item in items if (order(item) > start if ScanIndexForward else order(item) < start)]
+        response = {}
+        # Comme DynamoDB : LastEvaluatedKey dès que la limite est atteinte
+        if Limit and len(items) >= Limit:
+            items = items[:Limit]
+            response['LastEvaluatedKey'] = {name: items[-1][name] for name in key_names if name in items[-1]}
+        if FilterExpression is not None:
+            items = [item for item in items if evaluate(FilterExpression, item)]
+        names = ExpressionAttributeNames or {}
+        response.update({'Items': [project(item, ProjectionExpression, names) for item in items], 'Count': len(items)})
+        return response
@@ -0,0 +1,153 @@
+"""
+Collecteur local des spans de trace émis par le dispatcher, l'analyser et le callback
+
+Les Lambdas écrivent une ligne JSON par span (type 'trace_span', voir
+lambda/layers/common/python/trace_context.py). Ce script lit des exports de logs
+CloudWatch (ou la sortie d'un test local), regroupe les spans par trace_id et
+affiche la décomposition de la latence de bout en bout :
+attente avant exécution, invocation, analyse, envoi et réception du callback.
+
+Usage :
+    aws logs tail /aws/lambda/<fonction> --since 1h > logs.txt
+    python -m tools.trace_collector logs.txt [autres fichiers...]
+    python -m tools.trace_collector logs.txt --trace <trace_id> --json
+"""
+import argparse
+import json
+import statistics
+import sys
+
+# Étapes de la décomposition : (libellé, nom du span, attribut mesuré ou None pour la durée)
+BREAKDOWN = [
+    ('requête dispatcher', 'dispatcher.request', None),
+    ('invocation Lambda', 'dispatcher.invoke', None),
+    ("attente avant exécution", 'lambda.queue', None),
+    ('invocation analyser', 'analyser.invocation', None),
+    ('analyse', 'analyser.analysis', None),
+    ('envoi du callback', 'analyser.callback', None),
+    ('latence de livraison', 'callback.receive', 'delivery_lag_ms'),
+    ('enregistrement callback', 'callback.receive', None),
+]
+
+
+def parse_span_line(line):
+    """Extrait un span d'une ligne de log (préfixe CloudWatch éventuel ignoré)"""
+    start = line.find('{')
+    if start < 0 or '"trace_span"' not in line:
+        return None
+    try:
+        record = json.loads(line[start:])
+    except ValueError:
+        return None
+    return record if record.get('type') == 'trace_span' else None
+
+
+def collect_spans(lines):
+    """Regroupe les spans par trace_id"""
+    traces = {}
+    for line in lines:
+        span = parse_span_line(line)
+        if span:
+            traces.setdefault(span['trace_id'], []).append(span)
+    for spans in traces.values():
+        spans.sort(key=lambda span: span['start_unix_nano'])
+    return traces
+
+
+def trace_breakdown(spans):
+    """Durées cumulées par étape pour une trace (ms)"""
+    breakdown = {}
+    for label, name, attribute in BREAKDOWN:
+        values = [
+            span['attributes'].get(attribute) if attribute else span['duration_ms']
+            for span in spans if span['name'] == name
+        ]
+        values = [value for value in values if value is not None]
+        if values:
+            breakdown[label] = round(max(values), 3)
+    start = min(span['start_unix_nano'] for span in spans)
+    end = max(span['end_unix_nano'] for span in spans)
+    breakdown['bout en bout'] = round((end - start) / 1e6, 3)
+    return breakdown
+
+
+def print_tree(spans):
+    """Affiche les spans d'une trace en arbre, avec leur décalage depuis le début"""
+    origin = min(span['start_unix_nano'] for span in spans)
+    children = {}
+    span_ids = {span['span_id'] for span in spans}
+    for span in spans:
+        parent = span['parent_span_id'] if span['parent_span_id'] in span_ids else None
+        children.setdefault(parent, []).append(span)
+
+    def walk(parent, depth):
+        for span in children.get(parent, []):
+            offset_ms = (span['start_unix_nano'] - origin) / 1e6
+            task_id = span['attributes'].get('task_id', '')
+            print(f"  {'  ' * depth}{span['name']:<24} +{offset_ms:>10.1f} ms {span['duration_ms']:>10.1f} ms  {span['service']} {task_id}")
+            walk(span['span_id'], depth + 1)
+
+    walk(None, 0)
+
+
+def summarize(traces):
+    """Médiane et p95 de chaque étape sur l'ensemble des traces"""
+    per_stage = {}
+    for spans in traces.values():
+        for label, value in trace_breakdown(spans).items():
+            per_stage.setdefault(label, []).append(value)
+    summary = {}
+    for label, values in per_stage.items():
+        values.sort()
+        summary[label] = {
+            'count': len(values),
+            'p50_ms': round(statistics.median(values), 3),
+            'p95_ms': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Décomposition de latence à partir des spans de trace")
+    parser.add_argument('files', nargs='*', help="Fichiers de logs (stdin si absent)")
+    parser.add_argument('--trace', help="N'afficher que cette trace")
+    parser.add_argument('--json', action='store_true', help="Sortie JSON (traces et synthèse)")
+    args = parser.parse_args()
+
+    lines = []
+    if args.files:
+        for path in args.files:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                lines.extend(f)
+    else:
+        lines = sys.stdin
+
+    traces = collect_spans(lines)
+    if args.trace:
+        traces = {args.trace: traces.get(args.trace, [])} if traces.get(args.trace) else {}
+
+    if args.json:
+        print(json.dumps({
+            'traces': {trace_id: {'spans': spans, 'breakdown': trace_breakdown(spans)} for trace_id, spans in traces.items()},
+            'summary': summarize(traces),
+        }, indent=2, ensure_ascii=False))
+        return
+
+    if not traces:
+        print("Aucun span de trace trouvé")
+        return
+
+    for trace_id, spans in traces.items():
+        print(f"🔎 Trace {trace_id} ({len(spans)} spans)")
+        print_tree(spans)
+        for label, value in trace_breakdown(spans).items():
+            print(f"    {label:<26} {value:>10.1f} ms")
+        print()
+
+    print(f"📊 Synthèse sur {len(traces)} traces")
+    for label, values in summarize(traces).items():
+        print(f"    {label:<26} p50 {values['p50_ms']:>10.1f} ms   p95 {values['p95_ms']:>10.1f} ms   (n={values['count']})")
+
+
+if __name__ == '__main__':
+    main()